@@ -0,0 +1,77 @@
+# framebench - compare how fast hgclient reads command server frames with
+# util.framereader against the previous way of reading them: two read()
+# calls and a decode per frame, collected in a StringIO
+#
+# usage: python examples/framebench.py [frames per command]
+#
+# To leave out the time Mercurial spends running a command, hgclient talks
+# to a stand-in server over a pipe that answers every command with the same
+# status-like output.
+
+import io
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from hglib import client, error
+
+server = r'''
+import struct, sys
+out, inp = sys.stdout.buffer, sys.stdin.buffer
+hello = b'capabilities: runcommand\nencoding: ascii'
+out.write(struct.pack('>cI', b'o', len(hello)) + hello)
+out.flush()
+payload = b'M some/path/to/a/file.py\n'
+frame = struct.pack('>cI', b'o', len(payload)) + payload
+output = frame * %d + struct.pack('>cIi', b'r', 4, 0)
+while inp.readline():
+    inp.read(struct.unpack('>I', inp.read(4))[0])
+    out.write(output)
+    out.flush()
+'''
+
+
+class oldclient(client.hgclient):
+    """ hgclient reading frames the way it did before framereader """
+    def _readchannel(self):
+        data = self.server.stdout.read(5)
+        if not data:
+            raise error.ServerError("No data")
+        channel, length = struct.unpack('>cI', data)
+        if channel in b'IL':
+            return channel, length
+        return channel, self._decode(self.server.stdout.read(length))
+
+    def rawcommand(self, args, eh=None, prompt=None, input=None):
+        out, err = io.StringIO(), io.StringIO()
+        outchannels = {b'o': out.write, b'e': err.write}
+        self._writecommand(args)
+        while True:
+            channel, data = self._readchannel()
+            if channel in outchannels:
+                outchannels[channel](data)
+            elif channel == b'r':
+                struct.unpack(self.retfmt, data.encode('latin-1'))
+                return out.getvalue()
+
+
+frames = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+commands = max(1, 500000 // frames)
+
+for name, cls in [('read per frame', oldclient),
+                  ('framereader', client.hgclient)]:
+    c = cls(None, None, None, connect=False)
+    c._args = [sys.executable, '-c', server % frames]
+    c.open()
+    best = None
+    for i in range(3):
+        start = time.perf_counter()
+        for j in range(commands):
+            c.rawcommand(['status'])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    c.close()
+    print("%-16s %10.0f frames/sec" % (name, frames * commands / best))
@@ -6,12 +6,17 @@ from . import util
 from . import error
 
 
-def open(path=None, encoding=None, configs=None):
+def open(path=None, encoding=None, configs=None, raw_bytes=False,
+         transport='pipe'):
     ''' starts a cmdserver for the given path (or for a repository found in
     the cwd). HGENCODING is set to the given encoding. configs is a list of
-    key, value, similar to those passed to hg --config.
+    key, value, similar to those passed to hg --config. When raw_bytes is
+    True, rawcommand, cat, diff, export and annotate return bytes as they
+    were received from the server instead of decoding them. transport is
+    how to reach the server, 'pipe' or 'unix' (see hglib.transport).
     '''
-    return client.hgclient(path, encoding, configs)
+    return client.hgclient(path, encoding, configs, raw_bytes=raw_bytes,
+                           transport=transport)
 
 
 def init(dest=None, ssh=None, remotecmd=None, insecure=False,
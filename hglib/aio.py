@@ -0,0 +1,459 @@
+"""
+An asyncio counterpart of client.hgclient.
+
+It speaks the same protocol to a command server started with
+asyncio.create_subprocess_exec, so waiting for the server never blocks the
+event loop and a single thread can drive any number of servers. Commands on
+one client are still run one at a time.
+
+    async with await hglib.aio.open(path) as client:
+        async for rev in client.iterlog():
+            ...
+"""
+import asyncio
+import io
+import struct
+
+from . import HGPATH
+from . import error
+from . import util
+from . import templates
+from . import client as _client
+
+cmdbuilder = util.cmdbuilder
+_synchgclient = _client.hgclient
+
+
+async def open(path=None, encoding=None, configs=None, raw_bytes=False):
+    ''' like hglib.open(), but returns a connected aio.hgclient '''
+    c = hgclient(path, encoding, configs, raw_bytes=raw_bytes)
+    return await c.open()
+
+
+class hgclient(object):
+    inputfmt = _synchgclient.inputfmt
+    retfmt = _synchgclient.retfmt
+
+    def __init__(self, path, encoding, configs, raw_bytes=False):
+        self._args = [HGPATH, 'serve', '--cmdserver', 'pipe',
+                      '--config', 'ui.interactive=True']
+        if path:
+            self._args += ['-R', path]
+        if configs:
+            self._args += ['--config'] + configs
+        self._env = {'HGPLAIN': '1'}
+        if encoding:
+            self._env['HGENCODING'] = encoding
+
+        self.server = None
+        self._version = None
+        # include the hidden changesets if True
+        self.hidden = None
+        self._encoding = encoding
+        self._rawbytes = raw_bytes
+        # commands are run one at a time
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    # decoding and parsing are shared with the blocking client
+    _decode = _synchgclient._decode
+    _incrementaldecoder = _synchgclient._incrementaldecoder
+
+    async def _readchannel(self):
+        """ read a frame, returning its payload as bytes (or an int for the
+        I and L channels) """
+        try:
+            data = await self.server.stdout.readexactly(
+                util.framereader.header.size)
+            channel, length = util.framereader.header.unpack(data)
+            if channel in b'IL':
+                return channel, length
+            return channel, await self.server.stdout.readexactly(length)
+        except asyncio.IncompleteReadError:
+            raise error.ServerError("No data")
+
+    async def _readhello(self):
+        """ read the hello message the server sends when started """
+        ch, msg = await self._readchannel()
+        assert ch == b'o'
+
+        msg = self._decode(msg).split('\n')
+
+        self.capabilities = msg[0][len('capabilities: '):]
+        if not self.capabilities:
+            raise error.ResponseError("bad hello message: expected '"
+                                      "capabilities: ', got %r" % msg[0])
+
+        self.capabilities = set(self.capabilities.split())
+
+        # at the very least the server should be able to run commands
+        assert 'runcommand' in self.capabilities
+
+        self._encoding = msg[1][len('encoding: '):]
+        if not self._encoding:
+            raise error.ResponseError("bad hello message: expected "
+                                      "'encoding: ', got %r" % msg[1])
+
+    def _writeblock(self, data):
+        if isinstance(data, str):
+            data = data.encode('latin-1')
+        self.server.stdin.write(struct.pack(self.inputfmt, len(data)) + data)
+
+    async def _runcommanditer(self, args, inchannels):
+        """ like hgclient._runcommanditer, as an async generator; the caller
+        must hold the lock """
+        if not self.server:
+            raise ValueError("server not connected")
+
+        self.server.stdin.write(b'runcommand\n')
+        self._writeblock('\0'.join(args))
+
+        while True:
+            await self.server.stdin.drain()
+            channel, data = await self._readchannel()
+
+            # input channels
+            if channel in inchannels:
+                self._writeblock(inchannels[channel](data))
+            # result channel, command finished
+            elif channel == b'r':
+                yield channel, struct.unpack(self.retfmt, data)[0]
+                return
+            # a channel that we don't know and can't ignore
+            elif channel.isupper():
+                raise error.ResponseError("unexpected data on required"
+                                          "channel '%s'" % channel)
+            # output channels and optional channels
+            else:
+                yield channel, data
+
+    async def rawcommand(self, args, eh=None, prompt=None, input=None):
+        """ see hgclient.rawcommand """
+        return await self._rawcommand(args, eh, prompt, input,
+                                      self._rawbytes)
+
+    async def _rawcommand(self, args, eh=None, prompt=None, input=None,
+                          raw=False):
+        if raw:
+            decode = bytes
+        else:
+            decode = self._decode
+
+        out, err = io.BytesIO(), io.BytesIO()
+        inchannels = {}
+        if prompt is not None:
+            def func(size):
+                return prompt(size, decode(out.getvalue()))
+            inchannels[b'L'] = func
+        if input is not None:
+            inchannels[b'I'] = input
+
+        async with self._lock:
+            async for channel, data in self._runcommanditer(args,
+                                                            inchannels):
+                if channel == b'o':
+                    out.write(data)
+                elif channel == b'e':
+                    err.write(data)
+                elif channel == b'r':
+                    ret = data
+
+        out, err = decode(out.getvalue()), decode(err.getvalue())
+        if ret:
+            if eh is None:
+                raise error.CommandError(args, ret, out, err)
+            else:
+                return eh(ret, out, err)
+
+        return out
+
+    def rawcommanditer(self, args, delimiter=None, eh=None, input=None):
+        """ see hgclient.rawcommanditer, returns an async generator """
+        return self._rawcommanditer(args, delimiter, eh, input,
+                                    self._rawbytes)
+
+    async def _rawcommanditer(self, args, delimiter=None, eh=None, input=None,
+                              raw=False):
+        err = io.BytesIO()
+        inchannels = {}
+        if input is not None:
+            inchannels[b'I'] = input
+
+        if raw:
+            decode, empty = bytes, b''
+        else:
+            decode, empty = self._incrementaldecoder(), ''
+        splitter = util.recordsplitter(delimiter)
+
+        async with self._lock:
+            frames = self._runcommanditer(args, inchannels)
+            ret = None
+            try:
+                async for channel, data in frames:
+                    if channel == b'o':
+                        for record in splitter.feed(decode(data)):
+                            yield record
+                    elif channel == b'e':
+                        err.write(data)
+                    elif channel == b'r':
+                        ret = data
+            finally:
+                if ret is None:
+                    # closed before the command finished, skip the rest of
+                    # it so the server is ready for the next one
+                    async for channel, data in frames:
+                        pass
+
+        if not raw:
+            for record in splitter.feed(decode(b'', True)):
+                yield record
+        rest = splitter.flush()
+        if rest:
+            yield rest
+
+        if ret:
+            if raw:
+                err = err.getvalue()
+            else:
+                err = self._decode(err.getvalue())
+            if eh is None:
+                raise error.CommandError(args, ret, empty, err)
+            eh(ret, empty, err)
+
+    async def open(self):
+        if self.server is not None:
+            raise ValueError('server already open')
+
+        environ = dict(util.os.environ)
+        environ.update(self._env)
+        self.server = await asyncio.create_subprocess_exec(
+            *self._args, stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            close_fds=util.close_fds, env=environ)
+        await self._readhello()
+        return self
+
+    async def close(self):
+        """
+        Closes the command server instance and waits for it to exit, returns
+        the exit code.
+        """
+        self.server.stdin.close()
+        ret = await self.server.wait()
+        self.server = None
+        return ret
+
+    async def _iterrevs(self, records):
+        fields = []
+        try:
+            async for record in records:
+                fields.append(record)
+                if len(fields) == 7:
+                    yield _synchgclient._parserev(fields)
+                    fields = []
+        finally:
+            # release the lock now rather than when records is collected
+            await records.aclose()
+
+    async def annotate(self, files, rev=None, nofollow=False, text=False,
+                       user=False, file=False, date=False, number=False,
+                       changeset=False, line=False, verbose=False,
+                       include=None, exclude=None):
+        """ see hgclient.annotate, returns an async generator """
+        if not isinstance(files, list):
+            files = [files]
+
+        args = cmdbuilder('annotate', r=rev, no_follow=nofollow, a=text,
+                          u=user, f=file, d=date, n=number, c=changeset,
+                          l=line, v=verbose, I=include, X=exclude,
+                          hidden=self.hidden, *files)
+
+        sep = b': ' if self._rawbytes else ': '
+        newline = b'\n' if self._rawbytes else '\n'
+        lines = self.rawcommanditer(args, delimiter=newline)
+        try:
+            async for line in lines:
+                yield tuple(line.split(sep, 1))
+        finally:
+            await lines.aclose()
+
+    async def bookmarks(self):
+        """ see hgclient.bookmarks """
+        args = cmdbuilder('bookmarks', hidden=self.hidden)
+        out = await self._rawcommand(args)
+        return _synchgclient._parsebookmarks(out)
+
+    async def branches(self, active=False, closed=False):
+        """ see hgclient.branches """
+        args = cmdbuilder('branches', a=active, c=closed, hidden=self.hidden)
+        out = await self._rawcommand(args)
+        return _synchgclient._parsebranches(out)
+
+    async def cat(self, files, rev=None, output=None):
+        """ see hgclient.cat """
+        args = cmdbuilder('cat', r=rev, o=output, hidden=self.hidden, *files)
+        out = await self.rawcommand(args)
+
+        if not output:
+            return out
+
+    async def diff(self, files=[], revs=[], change=None, text=False,
+                   git=False, nodates=False, showfunction=False,
+                   reverse=False, ignoreallspace=False,
+                   ignorespacechange=False, ignoreblanklines=False,
+                   unified=None, stat=False, subrepos=False, include=None,
+                   exclude=None):
+        """ see hgclient.diff """
+        if change and revs:
+            raise ValueError('cannot specify both change and rev')
+
+        args = cmdbuilder('diff', r=revs, c=change,
+                          a=text, g=git, nodates=nodates,
+                          p=showfunction, reverse=reverse,
+                          w=ignoreallspace, b=ignorespacechange,
+                          B=ignoreblanklines, U=unified, stat=stat,
+                          S=subrepos, I=include, X=exclude,
+                          hidden=self.hidden, *files)
+
+        return await self.rawcommand(args)
+
+    async def heads(self, rev=[], startrev=[], topological=False,
+                    closed=False):
+        """ see hgclient.heads """
+        return [r async for r in self.iterheads(rev, startrev, topological,
+                                                 closed)]
+
+    def iterheads(self, rev=[], startrev=[], topological=False,
+                  closed=False):
+        """ see hgclient.iterheads, returns an async generator """
+        if not isinstance(rev, list):
+            rev = [rev]
+
+        args = cmdbuilder('heads', r=startrev, t=topological, c=closed,
+                          template=templates.changeset, hidden=self.hidden,
+                          *rev)
+
+        def eh(ret, out, err):
+            if ret != 1:
+                raise error.CommandError(args, ret, out, err)
+
+        records = self._rawcommanditer(args, delimiter='\0', eh=eh)
+        return self._iterrevs(records)
+
+    async def identify(self, rev=None, source=None, num=False, id=False,
+                       branch=False, tags=False, bookmarks=False):
+        """ see hgclient.identify """
+        args = cmdbuilder('identify', source, r=rev, n=num, i=id, b=branch,
+                          t=tags, B=bookmarks, hidden=self.hidden)
+
+        return await self._rawcommand(args)
+
+    async def log(self, revrange=None, files=[], follow=False,
+                  followfirst=False, date=None, copies=False, keyword=None,
+                  removed=False, onlymerges=False, user=None, branch=None,
+                  prune=None, hidden=None, limit=None, nomerges=False,
+                  include=None, exclude=None):
+        """ see hgclient.log """
+        return [r async for r in self.iterlog(revrange, files, follow,
+                                               followfirst, date, copies,
+                                               keyword, removed, onlymerges,
+                                               user, branch, prune, hidden,
+                                               limit, nomerges, include,
+                                               exclude)]
+
+    def iterlog(self, revrange=None, files=[], follow=False,
+                followfirst=False, date=None, copies=False, keyword=None,
+                removed=False, onlymerges=False, user=None, branch=None,
+                prune=None, hidden=None, limit=None, nomerges=False,
+                include=None, exclude=None):
+        """ see hgclient.iterlog, returns an async generator """
+        if hidden is None:
+            hidden = self.hidden
+        args = cmdbuilder('log', template=templates.changeset,
+                          r=revrange, f=follow, follow_first=followfirst,
+                          d=date, C=copies, k=keyword, removed=removed,
+                          m=onlymerges, u=user, b=branch, P=prune,
+                          l=limit, M=nomerges, I=include, X=exclude,
+                          hidden=hidden, *files)
+
+        records = self._rawcommanditer(args, delimiter='\0')
+        return self._iterrevs(records)
+
+    async def manifest(self, rev=None, all=False):
+        """ see hgclient.manifest, returns an async generator """
+        args = cmdbuilder('manifest', r=rev, all=all, debug=True,
+                          hidden=self.hidden)
+
+        lines = self._rawcommanditer(args, delimiter='\n')
+        try:
+            async for line in lines:
+                if all:
+                    yield line
+                else:
+                    yield _synchgclient._parsemanifestline(line)
+        finally:
+            await lines.aclose()
+
+    async def parents(self, rev=None, file=None):
+        """ see hgclient.parents """
+        revs = [r async for r in self.iterparents(rev, file)]
+        if not revs:
+            return
+
+        return revs
+
+    def iterparents(self, rev=None, file=None):
+        """ see hgclient.iterparents, returns an async generator """
+        args = cmdbuilder('parents', file, template=templates.changeset, r=rev,
+                          hidden=self.hidden)
+
+        records = self._rawcommanditer(args, delimiter='\0')
+        return self._iterrevs(records)
+
+    async def root(self):
+        """ see hgclient.root """
+        return (await self._rawcommand(['root'])).rstrip()
+
+    async def status(self, rev=None, change=None, all=False, modified=False,
+                     added=False, removed=False, deleted=False, clean=False,
+                     unknown=False, ignored=False, copies=False,
+                     subrepos=False, include=None, exclude=None):
+        """ see hgclient.status """
+        if rev and change:
+            raise ValueError('cannot specify both rev and change')
+
+        args = cmdbuilder('status', rev=rev, change=change, A=all, m=modified,
+                          a=added, r=removed, d=deleted, c=clean, u=unknown,
+                          i=ignored, C=copies, S=subrepos, I=include,
+                          X=exclude, hidden=self.hidden)
+
+        args.append('-0')
+
+        out = await self._rawcommand(args)
+        return _synchgclient._parsestatus(out)
+
+    async def tags(self):
+        """ see hgclient.tags """
+        args = cmdbuilder('tags', v=True)
+        out = await self._rawcommand(args)
+        return _synchgclient._parsetags(out)
+
+    async def tip(self):
+        """ see hgclient.tip """
+        args = cmdbuilder('tip', template=templates.changeset,
+                          hidden=self.hidden)
+        records = self._rawcommanditer(args, delimiter='\0')
+        return [r async for r in self._iterrevs(records)][0]
+
+    async def version(self):
+        """ see hgclient.version (a coroutine here rather than a property) """
+        if self._version is None:
+            v = await self._rawcommand(cmdbuilder('version', q=True))
+            self._version = _synchgclient._parseversion(v)
+
+        return self._version
@@ -0,0 +1,285 @@
+"""
+Benchmarks for the commands hglib spends most of its time in.
+
+usage: python -m hglib.bench [options]
+
+A repository of the requested size is created in a temporary directory
+(or --repo is used as is), each benchmark is run --repeat times and the
+best and median times are reported together with the throughput and the
+peak memory allocated by Python while it ran. Results can be saved as JSON
+and compared to a saved baseline:
+
+    python -m hglib.bench --save base.json
+    ... change hglib ...
+    python -m hglib.bench --baseline base.json --threshold 0.1
+
+The comparison exits with status 1 if any benchmark got slower than the
+baseline by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import hglib
+
+timer = time.perf_counter
+
+
+def makerepo(path, files=1000, revs=100, filesize=40, changes=10):
+    """
+    Create a repository at path with files files spread over directories of
+    up to 100 files each, filesize lines long, and revs revisions that each
+    change changes files.
+    """
+    hglib.init(path)
+    names = ['d%03d/f%05d.txt' % (i // 100, i) for i in range(files)]
+    for i, name in enumerate(names):
+        os.makedirs(os.path.join(path, os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(path, name), 'w') as f:
+            for j in range(filesize):
+                f.write('file %d line %d\n' % (i, j))
+
+    with hglib.open(path, configs=configs) as client:
+        client.commit('initial import', addremove=True, user='bench')
+        for rev in range(1, revs):
+            for k in range(changes):
+                name = names[(rev * 7919 + k * 104729) % files]
+                with open(os.path.join(path, name), 'a') as f:
+                    f.write('change %d\n' % rev)
+            client.commit('change %d\n\nchanges %d files' % (rev, changes),
+                          user='bench%d' % (rev % 5))
+    return names
+
+
+# grep refuses to run without a username
+configs = ['ui.username=bench']
+
+
+class benchmark(object):
+    """ a timed function, which is passed a client opened on the repository
+    (or None if client is False) and returns the number of items it
+    handled """
+    def __init__(self, name, func, unit, client=True):
+        self.name = name
+        self.func = func
+        self.unit = unit
+        self.client = client
+
+
+def benchmarks(path, names):
+    """ return the benchmarks to run against the repository at path """
+    def openclose(client):
+        for i in range(5):
+            hglib.open(path, configs=configs).close()
+        return 5
+
+    sample = names[::max(1, len(names) // 50)]
+
+    def cat(client):
+        for name in sample:
+            client.cat([os.path.join(path, name)])
+        return len(sample)
+
+    def annotate(client):
+        for name in sample[:10]:
+            list(client.annotate([os.path.join(path, name)]))
+        return len(sample[:10])
+
+    def changectx(client):
+        count = 0
+        for rev in range(int(client.tip().rev) + 1):
+            ctx = client[rev]
+            ctx.description()
+            ctx.files()
+            count += 1
+        return count
+
+    def grep(client):
+        return len(list(client.grep('line 1\\b')))
+
+    pairs = []
+
+    def ancestorpairs(client, n):
+        # the same random (older, newer) pairs every run
+        if not pairs:
+            tip = int(client.tip().rev)
+            rnd = random.Random(0)
+            for i in range(1000):
+                pairs.append(tuple(sorted((rnd.randint(0, tip),
+                                           rnd.randint(0, tip)))))
+        return pairs[:n]
+
+    def isancestor(client):
+        # read the dag index outside of the timed runs, like a long lived
+        # client would have
+        client.dag(refresh=False)
+        for a, b in ancestorpairs(client, 1000):
+            client.isancestor(a, b)
+        return 1000
+
+    def revsetancestor(client):
+        for a, b in ancestorpairs(client, 100):
+            bool(client.log('%d and ::%d' % (a, b)))
+        return 100
+
+    return [
+        benchmark('open', openclose, 'clients', client=False),
+        benchmark('log', lambda c: len(c.log()), 'revs'),
+        benchmark('iterlog', lambda c: sum(1 for r in c.iterlog()), 'revs'),
+        benchmark('status', lambda c: len(c.status(all=True)), 'files'),
+        benchmark('manifest', lambda c: len(list(c.manifest())), 'files'),
+        benchmark('cat', cat, 'files'),
+        benchmark('annotate', annotate, 'files'),
+        benchmark('grep', grep, 'matches'),
+        benchmark('changectx', changectx, 'revs'),
+        benchmark('isancestor', isancestor, 'checks'),
+        benchmark('revsetanc', revsetancestor, 'checks'),
+    ]
+
+
+def run(bench, path, repeat):
+    """ run bench repeat times and return a dict of its results """
+    client = None
+    if bench.client:
+        client = hglib.open(path, configs=configs)
+    try:
+        # measure memory in a run of its own, since tracing allocations
+        # slows it down. It also warms up the server for the timed runs.
+        tracemalloc.start()
+        try:
+            bench.func(client)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        times = []
+        for i in range(repeat):
+            start = timer()
+            items = bench.func(client)
+            times.append(timer() - start)
+    finally:
+        if client is not None:
+            client.close()
+
+    median = statistics.median(times)
+    return {
+        'min': min(times),
+        'median': median,
+        'items': items,
+        'unit': bench.unit,
+        'throughput': items / median if median else None,
+        'peak': peak,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Return a list of (name, baseline median, median, ratio, regressed)
+    for the benchmarks in both results and baseline. A benchmark regressed if
+    its median is more than threshold (a fraction) slower.
+    """
+    rows = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+        ratio = r['median'] / b['median'] if b['median'] else 1.0
+        rows.append((name, b['median'], r['median'], ratio,
+                     ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m hglib.bench',
+                                     description='benchmark hglib')
+    parser.add_argument('--repo', help='benchmark an existing repository '
+                        'instead of creating one')
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--revs', type=int, default=100)
+    parser.add_argument('--filesize', type=int, default=40,
+                        help='lines per file')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', action='append', metavar='NAME',
+                        help='run only this benchmark (can be repeated)')
+    parser.add_argument('--save', metavar='FILE',
+                        help='write the results as JSON to FILE')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare to the results saved in FILE')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown that counts as a regression, as a '
+                        'fraction of the baseline (default: 0.1)')
+    opts = parser.parse_args(argv)
+
+    tmpdir = None
+    try:
+        if opts.repo:
+            path = os.path.abspath(opts.repo)
+            with hglib.open(path, configs=configs) as client:
+                names = [m[4] for m in client.manifest()]
+        else:
+            tmpdir = tempfile.mkdtemp(prefix='hglib-bench-')
+            path = os.path.join(tmpdir, 'repo')
+            start = timer()
+            names = makerepo(path, opts.files, opts.revs, opts.filesize)
+            print('created %d files, %d revisions in %.1fs'
+                  % (opts.files, opts.revs, timer() - start))
+
+        results = {}
+        print('%-10s %10s %10s %20s %10s'
+              % ('benchmark', 'min', 'median', 'throughput', 'peak'))
+        for bench in benchmarks(path, names):
+            if opts.only and bench.name not in opts.only:
+                continue
+            r = results[bench.name] = run(bench, path, opts.repeat)
+            print('%-10s %9.1fms %9.1fms %8.0f %-11s %8.0fK'
+                  % (bench.name, r['min'] * 1000, r['median'] * 1000,
+                     r['throughput'] or 0, bench.unit + '/s',
+                     r['peak'] / 1024.0))
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if opts.save:
+        with open(opts.save, 'w') as f:
+            json.dump({
+                'meta': {
+                    'hglib': os.path.dirname(hglib.__file__),
+                    'python': platform.python_version(),
+                    'repo': opts.repo,
+                    'files': opts.files,
+                    'revs': opts.revs,
+                    'filesize': opts.filesize,
+                    'repeat': opts.repeat,
+                    'time': time.time(),
+                },
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if opts.baseline:
+        with open(opts.baseline) as f:
+            baseline = json.load(f)['results']
+        rows = compare(results, baseline, opts.threshold)
+        print()
+        print('%-10s %10s %10s %8s' % ('benchmark', 'baseline', 'now',
+                                       'change'))
+        regressed = False
+        for name, base, now, ratio, slower in rows:
+            print('%-10s %9.1fms %9.1fms %+7.1f%%%s'
+                  % (name, base * 1000, now * 1000, (ratio - 1) * 100,
+                     '  REGRESSION' if slower else ''))
+            regressed = regressed or slower
+        if regressed:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
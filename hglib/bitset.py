@@ -0,0 +1,108 @@
+"""
+Sets of revision numbers as bits of an integer.
+
+The result of a revset as a list of revisions costs an object per revision,
+and combining two of them means asking the server again. A bitset holds one
+bit per revision instead, and combines with others with Python's integer
+operations:
+
+    drafts = client.revs('draft()')
+    mine = client.revs('author(alice)')
+    len(drafts & mine), 42 in drafts - mine
+"""
+
+
+class bitset(object):
+    """An immutable set of revision numbers (non-negative ints). It supports
+    in, len, iteration in ascending order, the set operators |, &, - and ^,
+    and comparisons with other bitsets. None of these create a revision."""
+    __slots__ = ('bits',)
+
+    def __init__(self, bits=0):
+        """ bits - an int with bit r set for every revision r in the set """
+        self.bits = bits
+
+    @classmethod
+    def fromrevs(cls, revs):
+        """ the bitset of an iterable of revision numbers """
+        revs = list(revs)
+        if not revs:
+            return cls()
+        if min(revs) < 0:
+            raise ValueError('a bitset only holds revisions >= 0')
+        buf = bytearray((max(revs) >> 3) + 1)
+        for r in revs:
+            buf[r >> 3] |= 1 << (r & 7)
+        return cls(int.from_bytes(buf, 'little'))
+
+    def __contains__(self, rev):
+        return rev >= 0 and bool(self.bits >> rev & 1)
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __bool__(self):
+        return bool(self.bits)
+
+    def __iter__(self):
+        bits = self.bits
+        buf = bits.to_bytes((bits.bit_length() + 7) >> 3, 'little')
+        for i, byte in enumerate(buf):
+            if byte:
+                base = i << 3
+                for j in range(8):
+                    if byte >> j & 1:
+                        yield base + j
+
+    def __reversed__(self):
+        return reversed(list(self))
+
+    def first(self):
+        """ the smallest revision, None if the set is empty """
+        if not self.bits:
+            return None
+        return (self.bits & -self.bits).bit_length() - 1
+
+    def last(self):
+        """ the largest revision, None if the set is empty """
+        if not self.bits:
+            return None
+        return self.bits.bit_length() - 1
+
+    def __or__(self, other):
+        return bitset(self.bits | other.bits)
+
+    def __and__(self, other):
+        return bitset(self.bits & other.bits)
+
+    def __sub__(self, other):
+        return bitset(self.bits & ~other.bits)
+
+    def __xor__(self, other):
+        return bitset(self.bits ^ other.bits)
+
+    def issubset(self, other):
+        return not self.bits & ~other.bits
+
+    def issuperset(self, other):
+        return other.issubset(self)
+
+    def __eq__(self, other):
+        if isinstance(other, bitset):
+            return self.bits == other.bits
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, bitset):
+            return self.bits != other.bits
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __repr__(self):
+        revs = list(self)
+        if len(revs) > 10:
+            return '<bitset %d revisions, %d..%d>' % (len(revs), revs[0],
+                                                      revs[-1])
+        return '<bitset %r>' % revs
@@ -1,13 +1,26 @@
+import array
+import collections
 import struct
 import re
+import codecs
 import datetime
 import io
+import itertools
+import os
+import weakref
 
 from . import HGPATH
+from . import bitset
+from . import dag
 from . import error
 from . import util
 from . import templates
 from . import merge
+from . import metrics
+from . import manifest
+from . import revcache
+from . import table
+from . import transport
 
 cmdbuilder = util.cmdbuilder
 
@@ -17,22 +30,39 @@ _nullcset = ['-1', '0'*39, '', '', '', '', '']
 class changectx(object):
     """A changecontext object makes access to data related to a particular
     changeset convenient."""
+    # what is asked of log for a changectx, see templates.keywords. The
+    # file lists are those status --change prints, so that files() and
+    # friends don't need a command of their own. file_copies is left out,
+    # tracing copies costs the server more than everything else together.
+    _fields = ('rev', 'node', 'tags', 'branch', 'author', 'desc', 'epoch',
+               'offset', 'manifest', 'file_mods', 'file_adds', 'file_dels',
+               'p1rev', 'p1node', 'p2rev', 'p2node')
+    _parentfields = ('p1rev', 'p1node', 'p2rev', 'p2node')
+
     def __init__(self, repo, changeid=''):
         """changeid is a revision number, node, or tag"""
         if changeid == '':
             changeid = '.'
         self._repo = repo
+        r = None
         if isinstance(changeid, revision):
             cset = changeid
+        elif isinstance(changeid, templates.project(self._fields).record):
+            # from hgclient.itercontexts
+            r = changeid
         elif changeid == -1:
             cset = _nullcset
+            self._manifestnode = manifest.nullid
+            self._status = ([], [], [], [])
+            self._parentids = ()
+            self._copies = {}
         else:
             if isinstance(changeid, int):
                 changeid = 'rev(%d)' % changeid
 
             notfound = False
             try:
-                cset = self._repo.log(changeid)
+                cset = self._repo.log(changeid, fields=self._fields)
             except error.CommandError:
                 notfound = True
 
@@ -40,10 +70,19 @@ class changectx(object):
                 raise ValueError('changeid %r not found in repo' % changeid)
             if len(cset) > 1:
                 raise ValueError('changeid must yield a single changeset')
-            cset = cset[0]
+            r = cset[0]
+
+        if r is not None:
+            self._manifestnode = r.manifest
+            self._status = (r.file_mods, r.file_adds, r.file_dels, [])
+            self._parentids = self._parseparents(r)
+            cset = revision(str(r.rev), r.node, ' '.join(r.tags), r.branch,
+                            r.author, r.desc, (r.epoch, r.offset))
 
         self._rev, self._node, self._tags = cset[:3]
-        self._branch, self._author, self._description, self._date = cset[3:]
+        self._branch, self._author, self._description = cset[3:6]
+        # a revision, whose date is only converted when asked for
+        self._cset = cset
 
         self._rev = int(self._rev)
 
@@ -56,6 +95,14 @@ class changectx(object):
         self._ignored = None
         self._clean = None
 
+    def _refresh(self, other):
+        """take what can change for a changeset from other, a newer context
+        of it"""
+        if other is not self:
+            self._tags = other._tags
+            self._cset = other._cset
+            self.__dict__.pop('_bookmarks', None)
+
     def __str__(self):
         return self._node[:12]
 
@@ -87,8 +134,12 @@ class changectx(object):
         return key in self._manifest
 
     def __iter__(self):
-        for f in sorted(self._manifest):
-            yield f
+        return iter(self._manifest)
+
+    def walk(self, prefix):
+        """yield the files starting with prefix in sorted order, e.g. the
+        ones under a directory if it ends with a slash"""
+        return self._manifest.walk(prefix)
 
     @util.propertycache
     def _status(self):
@@ -135,7 +186,7 @@ class changectx(object):
         return self._author
 
     def date(self):
-        return self._date
+        return self._cset[6]
 
     def description(self):
         return self._description
@@ -143,6 +194,15 @@ class changectx(object):
     def files(self):
         return sorted(self._status[0] + self._status[1] + self._status[2])
 
+    @util.propertycache
+    def _copies(self):
+        return self._repo.log(self._node, fields=('file_copies',))[0][0]
+
+    def copies(self):
+        """return a dict of the files copied or renamed in this changeset to
+        their source"""
+        return self._copies
+
     def modified(self):
         return self._status[0]
 
@@ -162,12 +222,14 @@ class changectx(object):
             self.status(clean=True)
         return self._clean
 
+    @util.propertycache
+    def _manifestnode(self):
+        return self._repo.log(self._node, fields=('manifest',))[0].manifest
+
     @util.propertycache
     def _manifest(self):
-        d = {}
-        for node, p, e, s, path in self._repo.manifest(rev=self):
-            d[path] = node
-        return d
+        return self._repo.manifestcache.get(self._repo, self._node,
+                                            self._manifestnode)
 
     def manifest(self):
         return self._manifest
@@ -175,13 +237,27 @@ class changectx(object):
     def hex(self):
         return hex(self._node)
 
+    @staticmethod
+    def _parseparents(r):
+        if r.p2rev != -1:
+            return ((r.p1rev, r.p1node), (r.p2rev, r.p2node))
+        if r.p1rev != -1:
+            return ((r.p1rev, r.p1node),)
+        return ()
+
+    @util.propertycache
+    def _parentids(self):
+        """(rev, node) of each parent, none for a root"""
+        r = self._repo.log(self._node, fields=self._parentfields)[0]
+        return self._parseparents(r)
+
     @util.propertycache
     def _parents(self):
         """return contexts for each parent changeset"""
-        par = self._repo.parents(rev=self)
-        if not par:
-            return [changectx(self._repo, -1)]
-        return [changectx(self._repo, int(cset.rev)) for cset in par]
+        if not self._parentids:
+            return [self._repo._lookupctx(-1, None)]
+        return [self._repo._lookupctx(rev, node)
+                for rev, node in self._parentids]
 
     def parents(self):
         return self._parents
@@ -192,7 +268,7 @@ class changectx(object):
     def p2(self):
         if len(self._parents) == 2:
             return self._parents[1]
-        return changectx(self._repo, -1)
+        return self._repo._lookupctx(-1, None)
 
     @util.propertycache
     def _bookmarks(self):
@@ -217,65 +293,118 @@ class changectx(object):
 
     def children(self):
         """return contexts for each child changeset"""
-        for c in self._repo.log('children(%s)' % self._node):
-            yield changectx(self._repo, c)
+        return self._repo.itercontexts('children(%s)' % self._node)
 
     def ancestors(self):
-        for a in self._repo.log('ancestors(%s)' % self._node):
-            yield changectx(self._repo, a)
+        return self._repo.itercontexts('ancestors(%s)' % self._node)
 
     def descendants(self):
-        for d in self._repo.log('descendants(%s)' % self._node):
-            yield changectx(self._repo, d)
+        return self._repo.itercontexts('descendants(%s)' % self._node)
 
     def ancestor(self, c2):
         """
         return the ancestor context of self and c2
         """
-        return changectx(self._repo, 'ancestor(%s, %s)' % (self, c2))
-
-
-class revision(tuple):
-    def __new__(cls, rev, node, tags, branch, author, desc, date):
-        return tuple.__new__(cls, (rev, node, tags, branch, author, desc,
-                                   date))
+        return self._repo['ancestor(%s, %s)' % (self, c2)]
+
+
+class revision(object):
+    """A changeset as returned by log and friends. It behaves like the tuple
+    (rev, node, tags, branch, author, desc, date), with a field for each.
+
+    The date is kept as the seconds since the epoch and the timezone offset
+    of the changeset, and only turned into a datetime when it is asked for.
+    """
+    __slots__ = ('rev', 'node', 'tags', 'branch', 'author', 'desc', 'epoch',
+                 'offset', '_date')
+
+    def __init__(self, rev, node, tags, branch, author, desc, date):
+        """ date is either a datetime or a (epoch, offset) pair, where offset
+        is in seconds west of UTC as Mercurial stores it """
+        self.rev = rev
+        self.node = node
+        self.tags = tags
+        self.branch = branch
+        self.author = author
+        self.desc = desc
+        if isinstance(date, datetime.datetime):
+            self._date = date
+            self.epoch = date.timestamp()
+            self.offset = None
+        else:
+            self._date = None
+            self.epoch, self.offset = date
 
     @property
-    def rev(self):
-        return self[0]
+    def date(self):
+        """ the date as a local datetime without timezone """
+        if self._date is None:
+            self._date = datetime.datetime.fromtimestamp(self.epoch)
+        return self._date
 
     @property
-    def node(self):
-        return self[1]
+    def tzdate(self):
+        """ the date as an aware datetime in the timezone it was committed in,
+        or None if the offset isn't known """
+        if self.offset is None:
+            return None
+        tz = datetime.timezone(datetime.timedelta(seconds=-self.offset))
+        return datetime.datetime.fromtimestamp(self.epoch, tz)
 
-    @property
-    def tags(self):
-        return self[2]
+    def _fields(self):
+        return (self.rev, self.node, self.tags, self.branch, self.author,
+                self.desc, self.date)
 
-    @property
-    def branch(self):
-        return self[3]
+    def __len__(self):
+        return 7
 
-    @property
-    def author(self):
-        return self[4]
+    def __iter__(self):
+        return iter(self._fields())
 
-    @property
-    def desc(self):
-        return self[5]
+    def __getitem__(self, i):
+        return self._fields()[i]
 
-    @property
-    def date(self):
-        return self[6]
+    def __eq__(self, other):
+        if isinstance(other, (revision, tuple)):
+            return self._fields() == tuple(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    def __hash__(self):
+        return hash(self._fields())
+
+    def __repr__(self):
+        return 'revision%r' % (self._fields(),)
+
+
+_serverids = itertools.count()
+
+# what hgclient.fingerprint returns
+fingerprint = collections.namedtuple('fingerprint',
+                                     'changelog refs phases workingcopy')
+
+
+def epochs(revs):
+    """
+    Return the dates of revs, a list of revisions or a table.revisiontable,
+    as an array of seconds since the epoch, without creating datetimes.
+    """
+    if isinstance(revs, table.revisiontable):
+        return revs.dates
+    return array.array('d', [r.epoch for r in revs])
 
 
 class hgclient(object):
     inputfmt = '>I'
-    outputfmt = '>cI'
-    outputfmtsize = struct.calcsize(outputfmt)
     retfmt = '>i'
 
-    def __init__(self, path, encoding, configs, connect=True):
+    def __init__(self, path, encoding, configs, connect=True,
+                 raw_bytes=False, transport='pipe'):
         self._args = [HGPATH, 'serve', '--cmdserver', 'pipe',
                       '--config', 'ui.interactive=True']
         if path:
@@ -287,10 +416,42 @@ class hgclient(object):
             self._env['HGENCODING'] = encoding
 
         self.server = None
+        self._reader = None
+        # set while the output of a command is being streamed
+        self._streaming = False
         self._version = None
         # include the hidden changesets if True
         self.hidden = None
         self._encoding = encoding
+        # return the output of rawcommand, cat, diff, export and annotate as
+        # bytes instead of decoding it
+        self._rawbytes = raw_bytes
+        # the name of a transport in hglib.transport, or a transport
+        self._transport = transport
+        # functions called with the metrics.commandstats of every command
+        self._observers = []
+        # the manifests read by changectxs
+        self.manifestcache = manifest.manifestcache()
+        # the changectxs in use by node, so that there is only one per
+        # changeset
+        self._contexts = weakref.WeakValueDictionary()
+        # how many contexts to read at once when a traversal reaches a
+        # parent that hasn't been read yet, see _lookupctx
+        self.prefetchsize = 0
+        # the contexts read by the last prefetch, kept alive until the next
+        self._prefetched = []
+        self._dag = None
+        self._dagfingerprint = None
+        # (revset, hidden) -> (fingerprint, bitset), see revs
+        self._revsets = collections.OrderedDict()
+        self.revsetcachesize = 256
+        # component -> the paths fingerprint stats for it
+        self._fingerprintpaths = None
+        self._revcache = None
+        self._revcachefingerprint = None
+        # a commandcache.commandcache of the output of read-only commands,
+        # if any
+        self.commandcache = None
 
         if connect:
             self.open()
@@ -323,21 +484,39 @@ class hgclient(object):
             raise error.ResponseError("bad hello message: expected "
                                       "'encoding: ', got %r" % msg[1])
 
-    def _read_stdout(self, size):
-        """Read the server's stdout and try to decode it. Either way, return
-        it as unicode.
+    def _decode(self, data):
+        """Decode data read from the server. Either way, return it as unicode.
 
-        :param int size: The amount to read
+        :param data: A bytes-like object, such as the payload of a frame.
         :return str: A unicode string.
         """
-        data = self.server.stdout.read(size)
         if self._encoding:
             try:
-                return data.decode(self._encoding)
+                return str(data, self._encoding)
             except UnicodeError:
-                self._encoding = None
+                pass
         # arbitrary 1-byte encoding, hope for the best!
-        return data.decode('latin-1')
+        return str(data, 'latin-1')
+
+    def _incrementaldecoder(self):
+        """Return a function that decodes consecutive pieces of data read
+        from the server like _decode does, except that characters split
+        between two pieces are decoded whole. Pass final=True with the last
+        piece.
+        """
+        state = {'decoder': codecs.getincrementaldecoder(
+            self._encoding or 'latin-1')()}
+
+        def decode(data, final=False):
+            decoder = state['decoder']
+            held = decoder.getstate()[0]
+            try:
+                return decoder.decode(data, final)
+            except UnicodeError:
+                # fall back to latin-1 for the rest of the stream
+                state['decoder'] = codecs.getincrementaldecoder('latin-1')()
+                return str(held + bytes(data), 'latin-1')
+        return decode
 
     def _readchannel(self):
         """Read server for data and a channel. Messages are written in byte
@@ -353,53 +532,156 @@ class hgclient(object):
         :return tuple: A (bytes, str) tuple or a (bytes, int) tuple.
         :raise error.ServerError: If no data is read.
         """
-        data = self.server.stdout.read(hgclient.outputfmtsize)
-        if not data:
-            raise error.ServerError("No data")
-        channel, length = struct.unpack(hgclient.outputfmt, data)
+        channel, data = self._reader.readframe()
         if channel in b'IL':
-            return channel, length
+            return channel, data
         else:
-            return channel, self._read_stdout(length)
+            return channel, self._decode(data)
+
+    @staticmethod
+    def _parserev(rev):
+        ''' rev is a sequence of the 7 fields of templates.changeset '''
+        return revision(rev[0], rev[1], rev[2], rev[3], rev[4], rev[5],
+                        util.parsedate(rev[6]))
 
     @staticmethod
     def _parserevs(splitted):
         ''' splitted is a list of fields according to our rev.style, where each
-        6 fields compose one revision. '''
-        revs = []
-        for rev in util.grouper(7, splitted):
-            # truncate the timezone and convert to a local datetime
-            posixtime = float(rev[6].split('.', 1)[0])
-            dt = datetime.datetime.fromtimestamp(posixtime)
-            revs.append(revision(rev[0], rev[1], rev[2], rev[3], rev[4],
-                                 rev[5], dt))
-        return revs
+        7 fields compose one revision. '''
+        return [hgclient._parserev(rev) for rev in util.grouper(7, splitted)]
 
-    def runcommand(self, args, inchannels, outchannels):
-        def writeblock(data):
-            self.server.stdin.write(struct.pack(self.inputfmt, len(data)))
-            self.server.stdin.write(data.encode('latin-1'))
-            self.server.stdin.flush()
+    @staticmethod
+    def _parsestatus(out):
+        ''' parse the output of status -0 into (code, path) tuples '''
+        l = []
+
+        for entry in out.split('\0'):
+            if entry:
+                if entry[0] == ' ':
+                    l.append((' ', entry[2:]))
+                else:
+                    l.append(tuple(entry.split(' ', 1)))
+
+        return l
+
+    @staticmethod
+    def _parsemanifestline(line):
+        ''' parse a line of manifest --debug '''
+        node = line[0:40]
+        perm = line[41:44]
+        symlink = line[45] == '@'
+        executable = line[45] == '*'
+        return (node, perm, executable, symlink, line[47:])
+
+    @staticmethod
+    def _parsebookmarks(out):
+        bms = []
+        current = -1
+        if out.rstrip() != 'no bookmarks set':
+            for line in out.splitlines():
+                iscurrent, line = line[0:3], line[3:]
+                if '*' in iscurrent:
+                    current = len(bms)
+                name, line = line.split(' ', 1)
+                rev, node = line.split(':')
+                bms.append((name, int(rev), node))
+        return bms, current
+
+    @staticmethod
+    def _parsebranches(out):
+        branches = []
+        for line in out.rstrip().splitlines():
+            namerev, node = line.rsplit(':', 1)
+            name, rev = namerev.rsplit(' ', 1)
+            name = name.rstrip()
+            node = node.split()[0]  # get rid of ' (inactive)'
+            branches.append((name, int(rev), node))
+        return branches
+
+    @staticmethod
+    def _parsetags(out):
+        t = []
+        for line in out.splitlines():
+            taglocal = line.endswith(' local')
+            if taglocal:
+                line = line[:-6]
+            name, rev = line.rsplit(' ', 1)
+            rev, node = rev.split(':')
+            t.append((name.rstrip(), int(rev), node, taglocal))
+        return t
+
+    @staticmethod
+    def _parseversion(out):
+        v = list(re.match(r'.*?(\d+)\.(\d+)\.?(\d+)?(\+[0-9a-f-]+)?',
+                          out).groups())
 
+        for i in range(3):
+            try:
+                v[i] = int(v[i])
+            except TypeError:
+                v[i] = 0
+
+        return tuple(v)
+
+    @staticmethod
+    def _iterrevs(splitted, fields=None):
+        ''' like _parserevs, but splitted can be any iterable (e.g. the records
+        of rawcommanditer) and revisions are yielded as they are parsed. If
+        fields is given, splitted is the output of the template of
+        templates.project(fields). '''
+        if fields is not None:
+            yield from templates.project(fields).parse(splitted)
+            return
+        for rev in util.grouper(7, splitted):
+            yield hgclient._parserev(rev)
+
+    @staticmethod
+    def _template(fields):
+        ''' the template to print revisions with '''
+        if fields is None:
+            return templates.changeset
+        return templates.project(fields).template
+
+    def _writeblock(self, data):
+        if isinstance(data, str):
+            data = data.encode('latin-1')
+        self.server.stdin.write(struct.pack(self.inputfmt, len(data)))
+        self.server.stdin.write(data)
+        self.server.stdin.flush()
+
+    def _writecommand(self, args):
         if not self.server:
             raise ValueError("server not connected")
+        if self._streaming:
+            raise ValueError("server busy, the output of a previous command "
+                             "is still being read")
 
         self.server.stdin.write(b'runcommand\n')
-        writeblock('\0'.join(args))
+        self._writeblock('\0'.join(args))
+
+    def _runcommand(self, args, inchannels, outchannels, stats=None):
+        """Like runcommand, but the functions in outchannels are passed the
+        undecoded payload of each frame as a memoryview, which is only valid
+        until they return. The frames are counted in stats, if given.
+        """
+        if stats is not None:
+            outchannels = stats.wrap(outchannels)
+        self._writecommand(args)
 
         while True:
-            channel, data = self._readchannel()
+            channel, data = self._reader.readframe(outchannels)
+            if stats is not None:
+                stats.frame(channel, data)
 
             # input channels
             if channel in inchannels:
-                writeblock(inchannels[channel](data))
-            # output channels
-            elif channel in outchannels:
-                outchannels[channel](data)
+                self._writeblock(inchannels[channel](data))
             # result channel, command finished
             elif channel == b'r':
-                return struct.unpack(hgclient.retfmt,
-                                     data.encode('latin-1'))[0]
+                ret = struct.unpack(hgclient.retfmt, data)[0]
+                if stats is not None:
+                    stats.done(ret)
+                return ret
             # a channel that we don't know and can't ignore
             elif channel.isupper():
                 raise error.ResponseError("unexpected data on required"
@@ -408,6 +690,84 @@ class hgclient(object):
             else:
                 pass
 
+    def _runcommanditer(self, args, inchannels, stats=None):
+        """Send a command to the server and yield a (channel, data) tuple for
+        every frame that isn't a request for input, where data is the
+        undecoded payload as a memoryview that is only valid until the next
+        tuple is requested. Input requests are replied to by the function for
+        that channel in inchannels.
+
+        The last tuple yielded is (b'r', ret), where ret is the return code of
+        the command.
+
+        Until the generator is exhausted or closed, trying to run another
+        command raises a ValueError.
+
+        The frames are counted in stats, if given.
+        """
+        self._writecommand(args)
+
+        self._streaming = True
+        try:
+            while True:
+                channel, data = self._reader.readframe()
+                if stats is not None:
+                    stats.frame(channel, data)
+
+                # input channels
+                if channel in inchannels:
+                    self._writeblock(inchannels[channel](data))
+                # result channel, command finished
+                elif channel == b'r':
+                    self._streaming = False
+                    ret = struct.unpack(hgclient.retfmt, data)[0]
+                    if stats is not None:
+                        stats.done(ret)
+                    yield channel, ret
+                    return
+                # a channel that we don't know and can't ignore
+                elif channel.isupper():
+                    raise error.ResponseError("unexpected data on required"
+                                              "channel '%s'" % channel)
+                # output channels and optional channels
+                else:
+                    yield channel, data
+        finally:
+            self._streaming = False
+
+    def runcommand(self, args, inchannels, outchannels):
+        def decoded(func):
+            return lambda data: func(self._decode(data))
+
+        outchannels = dict((channel, decoded(func))
+                           for channel, func in outchannels.items())
+        stats = self._newstats(args)
+        ret = self._runcommand(args, inchannels, outchannels, stats)
+        self._emit(stats)
+        return ret
+
+    def addobserver(self, observer):
+        """
+        Call observer with a metrics.commandstats after every command, see
+        hglib.metrics.
+        """
+        self._observers.append(observer)
+
+    def removeobserver(self, observer):
+        self._observers.remove(observer)
+
+    def _newstats(self, args):
+        """ a commandstats for a command, if anyone is listening """
+        if self._observers:
+            return metrics.commandstats(args)
+
+    def _emit(self, stats):
+        if stats is None:
+            return
+        stats.finish()
+        for observer in self._observers:
+            observer(stats)
+
     def rawcommand(self, args, eh=None, prompt=None, input=None):
         """
         args is the cmdline (usually built using util.cmdbuilder)
@@ -421,36 +781,195 @@ class hgclient(object):
 
         input is used to reply to bulk data requests by the server
         It receives the max number of bytes to return
+
+        If the client was opened with raw_bytes, stdout and stderr are
+        bytes, both when returned and when passed to eh and prompt.
         """
+        return self._rawcommand(args, eh, prompt, input, self._rawbytes)
+
+    def _rawcommand(self, args, eh=None, prompt=None, input=None, raw=False,
+                    parse=None):
+        """ rawcommand, returning bytes if raw is True and str otherwise.
+        The command methods use this to parse the output as text regardless
+        of raw_bytes. If given, parse is called with the output of a
+        successful command and its result is returned instead. """
+        if raw:
+            decode = bytes
+        else:
+            decode = self._decode
 
-        out, err = io.StringIO(), io.StringIO()
+        # collect the output undecoded and decode it all at once at the end
+        out, err = io.BytesIO(), io.BytesIO()
         outchannels = {b'o': out.write, b'e': err.write}
 
         inchannels = {}
         if prompt is not None:
             def func(size):
-                reply = prompt(size, out.getvalue())
-                return reply.decode('latin-1')
+                return prompt(size, decode(out.getvalue()))
             inchannels[b'L'] = func
         if input is not None:
             inchannels[b'I'] = input
 
-        ret = self.runcommand(args, inchannels, outchannels)
+        cache = self.commandcache
+        state = None
+        if cache is not None and prompt is None and input is None:
+            key, state, cached = cache.get(self, args)
+            if cached is not None:
+                out = decode(cached)
+                return parse(out) if parse is not None else out
+
+        stats = self._newstats(args)
+        ret = self._runcommand(args, inchannels, outchannels, stats)
         out, err = out.getvalue(), err.getvalue()
+        if state is not None and not ret:
+            cache.put(key, state, out)
+        out, err = decode(out), decode(err)
 
         if ret:
+            self._emit(stats)
             if eh is None:
                 raise error.CommandError(args, ret, out, err)
             else:
                 return eh(ret, out, err)
 
+        if parse is not None:
+            if stats is not None:
+                start = metrics.timer()
+                out = parse(out)
+                stats.parse = metrics.timer() - start
+            else:
+                out = parse(out)
+
+        self._emit(stats)
         return out
 
+    def rawcommanditer(self, args, delimiter=None, eh=None, input=None):
+        """
+        Like rawcommand, but return a generator that yields the output of the
+        command as it is read from the server instead of collecting all of it
+        first.
+
+        delimiter - when given, the output is split on it and each complete
+        record is yielded (without the delimiter), followed by whatever
+        remains after the last delimiter, if anything. Otherwise the output is
+        yielded in the chunks it is received in. Either way, only a single
+        chunk or record is held in memory at a time.
+
+        If the client was opened with raw_bytes, the output is yielded as
+        bytes (and delimiter must be bytes too). Otherwise it is decoded
+        incrementally, so characters split between frames come out whole.
+
+        eh and input are as for rawcommand. Since the return code is only known
+        once all the output has been read, a CommandError (or a call to eh,
+        which receives an empty stdout and whose return value is ignored) only
+        happens after everything has been yielded.
+
+        The server can't run other commands until the generator is exhausted
+        or closed. Closing it early reads and discards the remaining output.
+        """
+        return self._rawcommanditer(args, delimiter, eh, input,
+                                    self._rawbytes)
+
+    def _rawcommanditer(self, args, delimiter=None, eh=None, input=None,
+                        raw=False):
+        """ rawcommanditer, yielding bytes if raw is True and str otherwise
+        """
+        err = io.BytesIO()
+        inchannels = {}
+        if input is not None:
+            inchannels[b'I'] = input
+
+        if raw:
+            decode, empty = bytes, b''
+        else:
+            decode, empty = self._incrementaldecoder(), ''
+
+        splitter = util.recordsplitter(delimiter)
+
+        stats = self._newstats(args)
+        frames = self._runcommanditer(args, inchannels, stats)
+        ret = None
+        try:
+            for channel, data in frames:
+                if channel == b'o':
+                    for record in splitter.feed(decode(data)):
+                        yield record
+                elif channel == b'e':
+                    err.write(data)
+                elif channel == b'r':
+                    ret = data
+        finally:
+            if ret is None:
+                # closed before the command finished, skip the rest of it so
+                # the server is ready for the next one
+                for channel, data in frames:
+                    pass
+                self._emit(stats)
+
+        if not raw:
+            # whatever the decoder held back can't be completed anymore
+            for record in splitter.feed(decode(b'', True)):
+                yield record
+        rest = splitter.flush()
+        if rest:
+            yield rest
+
+        self._emit(stats)
+        if ret:
+            if raw:
+                err = err.getvalue()
+            else:
+                err = self._decode(err.getvalue())
+            if eh is None:
+                raise error.CommandError(args, ret, empty, err)
+            eh(ret, empty, err)
+
+    # the first release where every command that takes a json argument here
+    # supports -Tjson
+    jsonversion = (4, 0)
+
+    def _jsoncommanditer(self, args):
+        """
+        Run args with -Tjson and yield the objects of the array it prints as
+        soon as each one has been read. They are decoded from UTF-8, which
+        Mercurial uses for JSON whatever the encoding, by the json module's C
+        decoder, so no field needs to be split out of the output by hand.
+
+        Raises CapabilityError if the server is older than jsonversion.
+        """
+        if self.version < self.jsonversion:
+            raise error.CapabilityError(
+                '-Tjson needs Mercurial %d.%d or later' % self.jsonversion)
+
+        # bytes that aren't UTF-8 come through as lone surrogates
+        decode = codecs.getincrementaldecoder('utf-8')('surrogatepass').decode
+        splitter = util.jsonsplitter()
+        args = args + ['-Tjson']
+        eh = None
+        if not self._rawbytes:
+            def eh(ret, out, err):
+                raise error.CommandError(args, ret, '', self._decode(err))
+        chunks = self._rawcommanditer(args, eh=eh, raw=True)
+        try:
+            for chunk in chunks:
+                yield from splitter.feed(decode(chunk))
+        finally:
+            chunks.close()
+        yield from splitter.feed(decode(b'', True))
+        yield from splitter.flush()
+
     def open(self):
         if self.server is not None:
             raise ValueError('server already open')
 
-        self.server = util.popen(self._args, self._env)
+        connect = self._transport
+        if not callable(connect):
+            connect = transport.transports[connect]
+        self.server = connect(self._args, self._env)
+        # tells the servers apart in commandcache, since the configuration
+        # is only read when one starts
+        self._serverid = next(_serverids)
+        self._reader = util.framereader(self.server.stdout)
         self._readhello()
         return self
 
@@ -465,7 +984,7 @@ class hgclient(object):
         self.server.stdin.close()
         self.server.wait()
         ret = self.server.returncode
-        self.server = None
+        self.server = self._reader = None
         return ret
 
     def add(self, files=[], dryrun=False, subrepos=False, include=None,
@@ -488,7 +1007,7 @@ class hgclient(object):
                           *files)
 
         eh = util.reterrorhandler(args)
-        self.rawcommand(args, eh=eh)
+        self._rawcommand(args, eh=eh)
 
         return bool(eh)
 
@@ -522,14 +1041,14 @@ class hgclient(object):
                           X=exclude, *files)
 
         eh = util.reterrorhandler(args)
-        self.rawcommand(args, eh=eh)
+        self._rawcommand(args, eh=eh)
 
         return bool(eh)
 
     def annotate(self, files, rev=None, nofollow=False, text=False,
                  user=False, file=False, date=False, number=False,
                  changeset=False, line=False, verbose=False, include=None,
-                 exclude=None):
+                 exclude=None, json=False):
         """
         Show changeset information by line for each file in files.
 
@@ -547,6 +1066,10 @@ class hgclient(object):
 
         Yields a (info, contents) tuple for each line in a file. Info is a
         space separated string according to the given options.
+
+        With json, yields a dict per file instead, as printed by annotate
+        -Tjson: its path and its lines, a list of dicts with the line and
+        the fields asked for by the options.
         """
         if not isinstance(files, list):
             files = [files]
@@ -556,10 +1079,15 @@ class hgclient(object):
                           l=line, v=verbose, I=include, X=exclude,
                           hidden=self.hidden, *files)
 
+        if json:
+            yield from self._jsoncommanditer(args)
+            return
+
         out = self.rawcommand(args)
+        sep = b': ' if self._rawbytes else ': '
 
         for line in out.splitlines():
-            yield tuple(line.split(': ', 1))
+            yield tuple(line.split(sep, 1))
 
     def archive(self, dest, rev=None, nodecode=False, prefix=None, type=None,
                 subrepos=False, include=None, exclude=None):
@@ -599,7 +1127,7 @@ class hgclient(object):
                           p=prefix, t=type, S=subrepos, I=include, X=exclude,
                           hidden=self.hidden)
 
-        self.rawcommand(args)
+        self._rawcommand(args)
 
     def backout(self, rev, merge=False, parent=None, tool=None, message=None,
                 logfile=None, date=None, user=None):
@@ -627,7 +1155,19 @@ class hgclient(object):
                           t=tool, m=message, l=logfile, d=date, u=user,
                           hidden=self.hidden)
 
-        self.rawcommand(args)
+        self._rawcommand(args)
+
+    def batch(self):
+        """
+        Return a commandbatch, which queues read-only commands (cat, status,
+        log, manifest, ...) and sends them to the server back to back instead
+        of waiting for each one to finish before sending the next.
+
+        with client.batch() as b:
+            results = [b.cat([f], rev='tip') for f in files]
+        contents = [r.result() for r in results]
+        """
+        return commandbatch(self)
 
     def bookmark(self, name, rev=None, force=False, delete=False,
                  inactive=False, rename=None):
@@ -645,29 +1185,22 @@ class hgclient(object):
         args = cmdbuilder('bookmark', name, r=rev, f=force, d=delete,
                           i=inactive, m=rename)
 
-        self.rawcommand(args)
+        self._rawcommand(args)
 
-    def bookmarks(self):
+    def bookmarks(self, json=False):
         """
         Return the bookmarks as a list of (name, rev, node) and the index of
         the current one.
 
         If there isn't a current one, -1 is returned as the index.
+
+        json - return the list of dicts printed by bookmarks -Tjson instead,
+        with the keys bookmark, rev, node and active
         """
         args = cmdbuilder('bookmarks', hidden=self.hidden)
-        out = self.rawcommand(args)
-
-        bms = []
-        current = -1
-        if out.rstrip() != 'no bookmarks set':
-            for line in out.splitlines():
-                iscurrent, line = line[0:3], line[3:]
-                if '*' in iscurrent:
-                    current = len(bms)
-                name, line = line.split(' ', 1)
-                rev, node = line.split(':')
-                bms.append((name, int(rev), node))
-        return bms, current
+        if json:
+            return list(self._jsoncommanditer(args))
+        return self._rawcommand(args, parse=self._parsebookmarks)
 
     def branch(self, name=None, clean=False, force=False):
         """
@@ -688,7 +1221,7 @@ class hgclient(object):
             raise ValueError('cannot use both name and clean')
 
         args = cmdbuilder('branch', name, f=force, C=clean)
-        out = self.rawcommand(args).rstrip()
+        out = self._rawcommand(args).rstrip()
 
         if name:
             return name
@@ -698,25 +1231,20 @@ class hgclient(object):
             # len('reset working directory to branch ') == 34
             return out[34:]
 
-    def branches(self, active=False, closed=False):
+    def branches(self, active=False, closed=False, json=False):
         """
         Returns the repository's named branches as a list of
         (name, rev, node).
 
         active - show only branches that have unmerged heads
         closed - show normal and closed branches
+        json - return the list of dicts printed by branches -Tjson instead,
+        with the keys branch, rev, node, active, closed and current
         """
         args = cmdbuilder('branches', a=active, c=closed, hidden=self.hidden)
-        out = self.rawcommand(args)
-
-        branches = []
-        for line in out.rstrip().splitlines():
-            namerev, node = line.rsplit(':', 1)
-            name, rev = namerev.rsplit(' ', 1)
-            name = name.rstrip()
-            node = node.split()[0]  # get rid of ' (inactive)'
-            branches.append((name, int(rev), node))
-        return branches
+        if json:
+            return list(self._jsoncommanditer(args))
+        return self._rawcommand(args, parse=self._parsebranches)
 
     def bundle(self, file, destrepo=None, rev=[], branch=[], base=[],
                all=False, force=False, type=None, ssh=None, remotecmd=None,
@@ -752,7 +1280,7 @@ class hgclient(object):
                           hidden=self.hidden)
 
         eh = util.reterrorhandler(args)
-        self.rawcommand(args, eh=eh)
+        self._rawcommand(args, eh=eh)
 
         return bool(eh)
 
@@ -791,7 +1319,7 @@ class hgclient(object):
         """
         args = cmdbuilder('clone', source, dest, b=branch, u=updaterev,
                           r=revrange)
-        self.rawcommand(args)
+        self._rawcommand(args)
 
     def commit(self, message=None, logfile=None, addremove=False,
                closebranch=False, date=None, user=None, include=None,
@@ -818,7 +1346,7 @@ class hgclient(object):
                           close_branch=closebranch, d=date, u=user, l=logfile,
                           I=include, X=exclude)
 
-        out = self.rawcommand(args)
+        out = self._rawcommand(args)
         rev, node = out.splitlines()[-1].rsplit(':')
         return int(rev.split()[-1]), node
 
@@ -839,7 +1367,7 @@ class hgclient(object):
             names = [names]
 
         args = cmdbuilder('showconfig', u=untrusted, debug=showsource, *names)
-        out = self.rawcommand(args)
+        out = self._rawcommand(args)
 
         conf = []
         if showsource:
@@ -895,10 +1423,32 @@ class hgclient(object):
                           I=include, X=exclude, *source)
 
         eh = util.reterrorhandler(args)
-        self.rawcommand(args, eh=eh)
+        self._rawcommand(args, eh=eh)
 
         return bool(eh)
 
+    def dag(self, refresh=True):
+        """
+        Return the dag.dagindex of the repository, which answers ancestry
+        questions (ancestors, descendants, children, heads, isancestor,
+        ancestor) about revision numbers without asking the server.
+
+        It is read the first time, and then brought up to date with the
+        revisions added since on every call unless refresh is False. The
+        server is only asked when the fingerprint shows the history (or
+        which revisions are hidden) has changed.
+        """
+        if self._dag is None:
+            self._dag = dag.dagindex(self)
+        elif not refresh:
+            return self._dag
+        fp = self.fingerprint()
+        fp = (fp.changelog, fp.phases)
+        if fp != self._dagfingerprint:
+            self._dag.refresh()
+            self._dagfingerprint = fp
+        return self._dag
+
     def diff(self, files=[], revs=[], change=None, text=False,
              git=False, nodates=False, showfunction=False, reverse=False,
              ignoreallspace=False, ignorespacechange=False,
@@ -970,6 +1520,91 @@ class hgclient(object):
         if output is None:
             return out
 
+    # the files each component of a fingerprint stats, relative to .hg,
+    # the store or the .hg of the share source, see _fingerprintfiles
+    _fingerprintfiles = {
+        'changelog': ('store:00changelog.i',),
+        'refs': ('bookmarks:bookmarks', 'localtags'),
+        'phases': ('store:phaseroots', 'store:obsstore'),
+        'workingcopy': ('dirstate', 'branch', 'bookmarks.current'),
+    }
+
+    def fingerprint(self):
+        """
+        Return a fingerprint of the state of the repository, computed from
+        the os.stat of the files it is stored in without asking the server.
+        Any change to the repository gives a different fingerprint, so
+        caches can compare it to the one their contents were read at.
+
+        It is a namedtuple with a field per part of the repository, for
+        caches that only depend on some of them:
+
+        changelog - the revisions
+        refs - bookmarks, local tags and the branch caches
+        phases - phases and obsolescence markers (and so which revisions
+        are hidden)
+        workingcopy - the dirstate: the working directory parents, its
+        branch and tracked files, and the active bookmark
+
+        Each field is a tuple of the (inode, size, mtime) of every file of
+        that part, None for a missing one.
+        """
+        paths = self._fingerprintpaths
+        if paths is None:
+            paths = self._fingerprintpaths = self._findfingerprintfiles()
+
+        def stat(path):
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+        refs = [stat(p) for p in paths['refs']]
+        # the branch caches are only found by listing the cache directory
+        cachedir = paths['cache']
+        try:
+            names = sorted(n for n in os.listdir(cachedir)
+                           if n.startswith('branch'))
+        except OSError:
+            names = []
+        refs += [stat(os.path.join(cachedir, n)) for n in names]
+
+        return fingerprint(
+            tuple(stat(p) for p in paths['changelog']), tuple(refs),
+            tuple(stat(p) for p in paths['phases']),
+            tuple(stat(p) for p in paths['workingcopy']))
+
+    def _findfingerprintfiles(self):
+        """ the paths of the files _fingerprintfiles lists, by component,
+        and the cache directory, following a share to its source """
+        hgdir = os.path.join(self.root(), '.hg')
+        store = os.path.join(hgdir, 'store')
+        bookmarks = hgdir
+        try:
+            with open(os.path.join(hgdir, 'sharedpath')) as f:
+                source = f.read().strip()
+        except OSError:
+            source = None
+        if source is not None:
+            store = os.path.join(source, 'store')
+            try:
+                with open(os.path.join(hgdir, 'shared')) as f:
+                    if 'bookmarks' in f.read().split():
+                        bookmarks = source
+            except OSError:
+                pass
+
+        bases = {'store': store, 'bookmarks': bookmarks}
+        paths = {'cache': os.path.join(hgdir, 'cache')}
+        for component, names in self._fingerprintfiles.items():
+            paths[component] = []
+            for name in names:
+                base, sep, name = name.rpartition(':')
+                paths[component].append(os.path.join(bases.get(base, hgdir),
+                                                     name))
+        return paths
+
     def forget(self, files, include=None, exclude=None):
         """
         Mark the specified files so they will no longer be tracked after the
@@ -990,7 +1625,7 @@ class hgclient(object):
         args = cmdbuilder('forget', I=include, X=exclude, *files)
 
         eh = util.reterrorhandler(args)
-        self.rawcommand(args, eh=eh)
+        self._rawcommand(args, eh=eh)
 
         return bool(eh)
 
@@ -1034,7 +1669,7 @@ class hgclient(object):
                 raise error.CommandError(args, ret, out, err)
             return ''
 
-        out = self.rawcommand(args, eh=eh).split('\0')
+        out = self._rawcommand(args, eh=eh).split('\0')
 
         fieldcount = 3
         if user:
@@ -1050,7 +1685,8 @@ class hgclient(object):
 
         return util.grouper(fieldcount, out)
 
-    def heads(self, rev=[], startrev=[], topological=False, closed=False):
+    def heads(self, rev=[], startrev=[], topological=False, closed=False,
+              fields=None):
         """
         Return a list of current repository heads or branch heads.
 
@@ -1063,21 +1699,33 @@ class hgclient(object):
         without children will be shown.
 
         closed - normal and closed branch heads.
+
+        fields - a sequence of field names (see templates.keywords) to ask
+        for instead of the usual ones, the heads are then returned as
+        namedtuples with just those fields
+        """
+        return list(self.iterheads(rev, startrev, topological, closed,
+                                   fields))
+
+    def iterheads(self, rev=[], startrev=[], topological=False, closed=False,
+                  fields=None):
+        """
+        Like heads, but return a generator that yields the heads one at a
+        time as they are read from the server.
         """
         if not isinstance(rev, list):
             rev = [rev]
 
         args = cmdbuilder('heads', r=startrev, t=topological, c=closed,
-                          template=templates.changeset, hidden=self.hidden,
+                          template=self._template(fields), hidden=self.hidden,
                           *rev)
 
         def eh(ret, out, err):
             if ret != 1:
                 raise error.CommandError(args, ret, out, err)
-            return ''
 
-        out = self.rawcommand(args, eh=eh).split('\0')[:-1]
-        return self._parserevs(out)
+        records = self._rawcommanditer(args, delimiter='\0', eh=eh)
+        return self._iterrevs(records, fields)
 
     def identify(self, rev=None, source=None, num=False, id=False,
                  branch=False, tags=False, bookmarks=False):
@@ -1102,7 +1750,7 @@ class hgclient(object):
         args = cmdbuilder('identify', source, r=rev, n=num, i=id, b=branch,
                           t=tags, B=bookmarks, hidden=self.hidden)
 
-        return self.rawcommand(args)
+        return self._rawcommand(args)
 
     def import_(self, patches, strip=None, force=False, nocommit=False,
                 bypass=False, exact=False, importbranch=False, message=None,
@@ -1146,11 +1794,11 @@ class hgclient(object):
                           date=date, user=user, similarity=similarity,
                           _=stdin, *patches)
 
-        self.rawcommand(args, prompt=prompt, input=input)
+        self._rawcommand(args, prompt=prompt, input=input)
 
     def incoming(self, revrange=None, path=None, force=False, newest=False,
                  bundle=None, bookmarks=False, branch=None, limit=None,
-                 nomerges=False, subrepos=False):
+                 nomerges=False, subrepos=False, fields=None):
         """
         Return new changesets found in the specified path or the default
         pull location.
@@ -1174,7 +1822,15 @@ class hgclient(object):
         insecure- do not verify server certificate
         (ignoring web.cacerts config)
         subrepos - recurse into subrepositories
+        fields - a sequence of field names (see templates.keywords) to ask
+        for instead of the usual ones, the changesets are then returned as
+        namedtuples with just those fields
         """
+        if not bookmarks:
+            return list(self.iterincoming(revrange, path, force, newest,
+                                          bundle, branch, limit, nomerges,
+                                          subrepos, fields))
+
         args = cmdbuilder('incoming',
                           path,
                           template=templates.changeset, r=revrange,
@@ -1186,24 +1842,84 @@ class hgclient(object):
             if ret != 1:
                 raise error.CommandError(args, ret, out, err)
 
-        out = self.rawcommand(args, eh=eh)
+        out = self._rawcommand(args, eh=eh)
         if not out:
             return []
 
         out = util.eatlines(out, 2)
-        if bookmarks:
-            bms = []
-            for line in out.splitlines():
-                bms.append(tuple(line.split()))
-            return bms
-        else:
-            out = out.split('\0')[:-1]
-            return self._parserevs(out)
+        bms = []
+        for line in out.splitlines():
+            bms.append(tuple(line.split()))
+        return bms
+
+    def isancestor(self, a, b):
+        """
+        Return True if a is an ancestor of b, or b itself.
+
+        a and b are revision numbers or full hex nodes, which are answered
+        from the dag index without asking the server (it is only refreshed
+        when it doesn't know one of them yet), or anything else log accepts,
+        which costs a command to look up.
+        """
+        d = self.dag(refresh=False)
+        return d.isancestor(self._dagrev(d, a), self._dagrev(d, b))
+
+    def _dagrev(self, d, changeid):
+        """ the revision number of changeid, refreshing d if it isn't
+        known to it yet """
+        if not isinstance(changeid, int):
+            if len(changeid) == 40:
+                try:
+                    return d.rev(changeid)
+                except (KeyError, ValueError):
+                    pass
+            revs = self.log(changeid, fields=('rev',))
+            if len(revs) != 1:
+                raise ValueError('changeid %r must yield a single changeset'
+                                 % changeid)
+            changeid = revs[0].rev
+        if changeid != -1 and changeid not in d:
+            d.refresh()
+            if changeid not in d:
+                raise ValueError('revision %d not found in repo' % changeid)
+        return changeid
+
+    def iterincoming(self, revrange=None, path=None, force=False,
+                     newest=False, bundle=None, branch=None, limit=None,
+                     nomerges=False, subrepos=False, fields=None):
+        """
+        Like incoming, but return a generator that yields the new changesets
+        one at a time as they are read from the server.
+        """
+        args = cmdbuilder('incoming',
+                          path,
+                          template=self._template(fields), r=revrange,
+                          f=force, n=newest, bundle=bundle,
+                          b=branch, l=limit, M=nomerges, S=subrepos)
+
+        return self._iterremoterevs(args, fields)
+
+    def _iterremoterevs(self, args, fields=None):
+        """ yield the revisions printed by incoming or outgoing """
+        def eh(ret, out, err):
+            if ret != 1:
+                raise error.CommandError(args, ret, out, err)
+
+        records = self._rawcommanditer(args, delimiter='\0', eh=eh)
+        first = next(records, None)
+        if first is None:
+            return
+
+        # skip the 'comparing with' and 'searching for changes' lines the
+        # first record starts with
+        records = itertools.chain([util.eatlines(first, 2)], records)
+        yield from self._iterrevs(records, fields)
 
     def log(self, revrange=None, files=[], follow=False, followfirst=False,
             date=None, copies=False, keyword=None, removed=False,
             onlymerges=False, user=None, branch=None, prune=None, hidden=None,
-            limit=None, nomerges=False, include=None, exclude=None):
+            limit=None, nomerges=False, include=None, exclude=None,
+            columnar=False, fields=None, json=False):
         """
         Return the revision history of the specified files or the entire
         project.
@@ -1243,22 +1959,104 @@ class hgclient(object):
         nomerges - do not show merges
         include - include names matching the given patterns
         exclude - exclude names matching the given patterns
-        """
+        columnar - return a table.revisiontable instead of a list, which
+        stores the revisions in compact columns
+        fields - a sequence of field names (see templates.keywords) to ask
+        for instead of the usual ones, the revisions are then returned as
+        namedtuples with just those fields
+        json - return the list of dicts printed by log -Tjson instead, which
+        hold every field (including the parents and the date as [epoch,
+        offset]) and can't be confused by unusual descriptions
+        """
+        if columnar and fields is not None:
+            raise ValueError('cannot specify both columnar and fields')
+        if json:
+            if columnar or fields is not None:
+                raise ValueError('cannot specify json with columnar or '
+                                 'fields')
+            return list(self.iterlog(revrange, files, follow, followfirst,
+                                     date, copies, keyword, removed,
+                                     onlymerges, user, branch, prune, hidden,
+                                     limit, nomerges, include, exclude,
+                                     json=True))
+
+        records = self._logrecords(revrange, files, follow, followfirst, date,
+                                   copies, keyword, removed, onlymerges, user,
+                                   branch, prune, hidden, limit, nomerges,
+                                   include, exclude, fields)
+        if columnar:
+            return table.revisiontable.fromrecords(records)
+        return list(self._iterrevs(records, fields))
+
+    def iterlog(self, revrange=None, files=[], follow=False,
+                followfirst=False, date=None, copies=False, keyword=None,
+                removed=False, onlymerges=False, user=None, branch=None,
+                prune=None, hidden=None, limit=None, nomerges=False,
+                include=None, exclude=None, fields=None, json=False):
+        """
+        Like log, but return a generator that yields the revisions one at a
+        time as they are read from the server, so the history never has to
+        be held in memory at once.
+        """
+        if json:
+            if fields is not None:
+                raise ValueError('cannot specify both json and fields')
+            if hidden is None:
+                hidden = self.hidden
+            args = cmdbuilder('log', r=revrange, f=follow,
+                              follow_first=followfirst, d=date, C=copies,
+                              k=keyword, removed=removed, m=onlymerges,
+                              u=user, b=branch, P=prune, l=limit, M=nomerges,
+                              I=include, X=exclude, hidden=hidden, *files)
+            return self._jsoncommanditer(args)
+
+        records = self._logrecords(revrange, files, follow, followfirst, date,
+                                   copies, keyword, removed, onlymerges, user,
+                                   branch, prune, hidden, limit, nomerges,
+                                   include, exclude, fields)
+        return self._iterrevs(records, fields)
+
+    def itercontexts(self, revrange=None, hidden=None):
+        """
+        Return a generator of a changectx for every revision in revrange
+        (all of them by default, in the order of log). They are read with a
+        single log command, together with the files each of them changed,
+        instead of one command per context.
+        """
+        for r in self.iterlog(revrange, hidden=hidden,
+                              fields=changectx._fields):
+            yield self._context(r)
+
+    def prefetch(self, revrange):
+        """
+        Read the contexts of revrange with a single command, so that the
+        ones a traversal reaches through parents() or p1() later on don't
+        need one each. They are kept until the next prefetch.
+
+        Setting prefetchsize does this automatically: when a parent that
+        hasn't been read is asked for, it is read together with the
+        prefetchsize - 1 revisions below it.
+        """
+        self._prefetched = list(self.itercontexts(revrange))
+        return self._prefetched
+
+    def _logrecords(self, revrange, files, follow, followfirst, date, copies,
+                    keyword, removed, onlymerges, user, branch, prune, hidden,
+                    limit, nomerges, include, exclude, fields=None):
+        """ run log with the template for fields and return a generator of
+        the fields of the output """
         if hidden is None:
             hidden = self.hidden
-        args = cmdbuilder('log', template=templates.changeset,
+        args = cmdbuilder('log', template=self._template(fields),
                           r=revrange, f=follow, follow_first=followfirst,
                           d=date, C=copies, k=keyword, removed=removed,
                           m=onlymerges, u=user, b=branch, P=prune,
                           l=limit, M=nomerges, I=include, X=exclude,
                           hidden=hidden, *files)
 
-        out = self.rawcommand(args)
-        out = out.split('\0')[:-1]
+        return self._rawcommanditer(args, delimiter='\0')
 
-        return self._parserevs(out)
-
-    def manifest(self, rev=None, all=False):
+    def manifest(self, rev=None, all=False, json=False):
         """
         Yields (nodeid, permission, executable, symlink, file path) tuples
         for version controlled files for the given revision. If no revision is
@@ -1267,22 +2065,25 @@ class hgclient(object):
 
         When all is True, all files from all revisions are yielded
         (just the name). This includes deleted and renamed files.
+
+        json - yield the dicts printed by manifest -Tjson instead, with the
+        keys path, hash, mode ('644' or '755') and type ('', 'x' or 'l')
         """
         args = cmdbuilder('manifest', r=rev, all=all, debug=True,
                           hidden=self.hidden)
 
-        out = self.rawcommand(args)
+        if json:
+            yield from self._jsoncommanditer(args)
+            return
+
+        out = self._rawcommand(args)
 
         if all:
             for line in out.splitlines():
                 yield line
         else:
             for line in out.splitlines():
-                node = line[0:40]
-                perm = line[41:44]
-                symlink = line[45] == '@'
-                executable = line[45] == '*'
-                yield (node, perm, executable, symlink, line[47:])
+                yield self._parsemanifestline(line)
 
     def merge(self, rev=None, force=False, tool=None,
               cb=merge.handlers.abort):
@@ -1321,7 +2122,7 @@ class hgclient(object):
         else:
             prompt = lambda size, output: cb(output) + b'\n'
 
-        self.rawcommand(args, prompt=prompt)
+        self._rawcommand(args, prompt=prompt)
 
     def move(self, source, dest, after=False, force=False, dryrun=False,
              include=None, exclude=None):
@@ -1348,13 +2149,13 @@ class hgclient(object):
                           I=include, X=exclude, *source)
 
         eh = util.reterrorhandler(args)
-        self.rawcommand(args, eh=eh)
+        self._rawcommand(args, eh=eh)
 
         return bool(eh)
 
     def outgoing(self, revrange=None, path=None, force=False, newest=False,
                  bookmarks=False, branch=None, limit=None, nomerges=False,
-                 subrepos=False):
+                 subrepos=False, fields=None):
         """
         Return changesets not found in the specified path or the default push
         location.
@@ -1374,7 +2175,15 @@ class hgclient(object):
         insecure - do not verify server certificate
         (ignoring web.cacerts config)
         subrepos - recurse into subrepositories
+        fields - a sequence of field names (see templates.keywords) to ask
+        for instead of the usual ones, the changesets are then returned as
+        namedtuples with just those fields
         """
+        if not bookmarks:
+            return list(self.iteroutgoing(revrange, path, force, newest,
+                                          branch, limit, nomerges, subrepos,
+                                          fields))
+
         args = cmdbuilder('outgoing',
                           path,
                           template=templates.changeset, r=revrange,
@@ -1385,37 +2194,57 @@ class hgclient(object):
             if ret != 1:
                 raise error.CommandError(args, ret, out, err)
 
-        out = self.rawcommand(args, eh=eh)
+        out = self._rawcommand(args, eh=eh)
         if not out:
             return []
 
         out = util.eatlines(out, 2)
-        if bookmarks:
-            bms = []
-            for line in out.splitlines():
-                bms.append(tuple(line.split()))
-            return bms
-        else:
-            out = out.split('\0')[:-1]
-            return self._parserevs(out)
+        bms = []
+        for line in out.splitlines():
+            bms.append(tuple(line.split()))
+        return bms
 
-    def parents(self, rev=None, file=None):
+    def iteroutgoing(self, revrange=None, path=None, force=False,
+                     newest=False, branch=None, limit=None, nomerges=False,
+                     subrepos=False, fields=None):
+        """
+        Like outgoing, but return a generator that yields the changesets one
+        at a time as they are read from the server.
+        """
+        args = cmdbuilder('outgoing',
+                          path,
+                          template=self._template(fields), r=revrange,
+                          f=force, n=newest, b=branch, S=subrepos)
+
+        return self._iterremoterevs(args, fields)
+
+    def parents(self, rev=None, file=None, fields=None):
         """
         Return the working directory's parent revisions. If rev is given, the
         parent of that revision will be printed. If file is given, the
         revision in which the file was last changed (before the working
         directory revision or the revision specified by rev) is returned.
-        """
-        args = cmdbuilder('parents', file, template=templates.changeset, r=rev,
-                          hidden=self.hidden)
 
-        out = self.rawcommand(args)
-        if not out:
+        fields - a sequence of field names (see templates.keywords) to ask
+        for instead of the usual ones, the parents are then returned as
+        namedtuples with just those fields
+        """
+        revs = list(self.iterparents(rev, file, fields))
+        if not revs:
             return
 
-        out = out.split('\0')[:-1]
+        return revs
+
+    def iterparents(self, rev=None, file=None, fields=None):
+        """
+        Like parents, but return a generator that yields the parents as they
+        are read from the server (and nothing if there are none).
+        """
+        args = cmdbuilder('parents', file, template=self._template(fields),
+                          r=rev, hidden=self.hidden)
 
-        return self._parserevs(out)
+        records = self._rawcommanditer(args, delimiter='\0')
+        return self._iterrevs(records, fields)
 
     def paths(self, name=None):
         """
@@ -1427,14 +2256,14 @@ class hgclient(object):
         ".hg/hgrc" is used, too.
         """
         if not name:
-            out = self.rawcommand(['paths'])
+            out = self._rawcommand(['paths'])
             if not out:
                 return {}
 
             return dict([s.split(' = ') for s in out.rstrip().split('\n')])
         else:
             args = cmdbuilder('paths', name)
-            out = self.rawcommand(args)
+            out = self._rawcommand(args)
             return out.rstrip()
 
     def pull(self, source=None, rev=None, update=False, force=False,
@@ -1467,7 +2296,7 @@ class hgclient(object):
                           insecure=insecure, t=tool)
 
         eh = util.reterrorhandler(args)
-        self.rawcommand(args, eh=eh)
+        self._rawcommand(args, eh=eh)
 
         return bool(eh)
 
@@ -1504,7 +2333,7 @@ class hgclient(object):
                           insecure=insecure)
 
         eh = util.reterrorhandler(args)
-        self.rawcommand(args, eh=eh)
+        self._rawcommand(args, eh=eh)
 
         return bool(eh)
 
@@ -1529,7 +2358,7 @@ class hgclient(object):
                           *files)
 
         eh = util.reterrorhandler(args)
-        self.rawcommand(args, eh=eh)
+        self._rawcommand(args, eh=eh)
 
         return bool(eh)
 
@@ -1556,7 +2385,7 @@ class hgclient(object):
         args = cmdbuilder('resolve', a=all, l=listfiles, m=mark, u=unmark,
                           t=tool, I=include, X=exclude, *file)
 
-        out = self.rawcommand(args)
+        out = self._rawcommand(args)
 
         if listfiles:
             l = []
@@ -1600,20 +2429,74 @@ class hgclient(object):
                           hidden=self.hidden, *files)
 
         eh = util.reterrorhandler(args)
-        self.rawcommand(args, eh=eh)
+        self._rawcommand(args, eh=eh)
 
         return bool(eh)
 
+    def revcache(self, refresh=True):
+        """
+        Return the revcache.revcache of the repository: the metadata of
+        every revision (node, parents, date, branch, author and description)
+        kept in files under .hg/cache/hglib that all clients of the
+        repository share.
+
+        It is brought up to date with the repository when first opened and
+        on every call unless refresh is False, which reads only the
+        revisions added since it was last updated by any client. Nothing
+        is read while the fingerprint shows the history is unchanged.
+        """
+        if self._revcache is None:
+            self._revcache = revcache.revcache(self)
+        elif not refresh:
+            return self._revcache
+        fp = self.fingerprint().changelog
+        if fp != self._revcachefingerprint:
+            self._revcache.update()
+            self._revcachefingerprint = fp
+        return self._revcache
+
+    def revs(self, revset):
+        """
+        Return the revisions of revset as a bitset.bitset, which can be
+        combined with those of other revsets with |, & and - without asking
+        the server, and tested or counted without creating revisions.
+
+        The results of the last revsetcachesize revsets are kept for as long
+        as the repository doesn't change (see fingerprint), so asking for
+        one of them again costs no command.
+        """
+        key = (revset, self.hidden)
+        fingerprint = self.fingerprint()
+        cached = self._revsets.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            self._revsets.move_to_end(key)
+            return cached[1]
+
+        def parse(out):
+            revs = [int(r) for r in out.split()]
+            if 2147483647 in revs:
+                raise ValueError('the working directory can\'t be in a '
+                                 'bitset')
+            return bitset.bitset.fromrevs(revs)
+
+        args = cmdbuilder('log', template='{rev}\n', r=revset,
+                          hidden=self.hidden)
+        result = self._rawcommand(args, parse=parse)
+        self._revsets[key] = (fingerprint, result)
+        while len(self._revsets) > self.revsetcachesize:
+            self._revsets.popitem(last=False)
+        return result
+
     def root(self):
         """
         Return the root directory of the current repository.
         """
-        return self.rawcommand(['root']).rstrip()
+        return self._rawcommand(['root']).rstrip()
 
     def status(self, rev=None, change=None, all=False, modified=False,
                added=False, removed=False, deleted=False, clean=False,
                unknown=False, ignored=False, copies=False, subrepos=False,
-               include=None, exclude=None):
+               include=None, exclude=None, json=False):
         """
         Return status of files in the repository as a list of
         (code, file path) where code can be:
@@ -1641,6 +2524,8 @@ class hgclient(object):
         subrepos - recurse into subrepositories
         include - include names matching the given patterns
         exclude - exclude names matching the given patterns
+        json - return the list of dicts printed by status -Tjson instead,
+        with the keys path, status and, for copies, source
         """
         if rev and change:
             raise ValueError('cannot specify both rev and change')
@@ -1650,19 +2535,12 @@ class hgclient(object):
                           i=ignored, C=copies, S=subrepos, I=include,
                           X=exclude, hidden=self.hidden)
 
-        args.append('-0')
-
-        out = self.rawcommand(args)
-        l = []
+        if json:
+            return list(self._jsoncommanditer(args))
 
-        for entry in out.split('\0'):
-            if entry:
-                if entry[0] == ' ':
-                    l.append((' ', entry[2:]))
-                else:
-                    l.append(tuple(entry.split(' ', 1)))
+        args.append('-0')
 
-        return l
+        return self._rawcommand(args, parse=self._parsestatus)
 
     def tag(self, names, rev=None, message=None, force=False, local=False,
             remove=False, date=None, user=None):
@@ -1693,25 +2571,20 @@ class hgclient(object):
                           remove=remove, d=date, u=user, hidden=self.hidden,
                           *names)
 
-        self.rawcommand(args)
+        self._rawcommand(args)
 
-    def tags(self):
+    def tags(self, json=False):
         """
         Return a list of repository tags as: (name, rev, node, islocal)
+
+        json - return the list of dicts printed by tags -Tjson instead, with
+        the keys tag, rev, node and type ('local' or '')
         """
         args = cmdbuilder('tags', v=True)
+        if json:
+            return list(self._jsoncommanditer(args))
 
-        out = self.rawcommand(args)
-
-        t = []
-        for line in out.splitlines():
-            taglocal = line.endswith(' local')
-            if taglocal:
-                line = line[:-6]
-            name, rev = line.rsplit(' ', 1)
-            rev, node = rev.split(':')
-            t.append((name.rstrip(), int(rev), node, taglocal))
-        return t
+        return self._rawcommand(args, parse=self._parsetags)
 
     def phase(self, revs=(), secret=False, draft=False, public=False,
               force=False):
@@ -1732,7 +2605,7 @@ class hgclient(object):
         args = util.cmdbuilder('phase', secret=secret, draft=draft,
                                public=public, force=force,
                                hidden=self.hidden, *revs)
-        out = self.rawcommand(args)
+        out = self._rawcommand(args)
         if draft or public or secret:
             return
         else:
@@ -1756,7 +2629,7 @@ class hgclient(object):
         """
         args = cmdbuilder('summary', remote=remote, hidden=self.hidden)
 
-        out = self.rawcommand(args).splitlines()
+        out = self._rawcommand(args).splitlines()
 
         d = {}
         while out:
@@ -1820,18 +2693,23 @@ class hgclient(object):
 
         return d
 
-    def tip(self):
+    def tip(self, fields=None):
         """
         Return the tip revision (usually just called the tip) which is the
         changeset most recently added to the repository (and therefore the
         most recently changed head).
+
+        fields - a sequence of field names (see templates.keywords) to ask
+        for instead of the usual ones, the tip is then returned as a
+        namedtuple with just those fields
         """
-        args = cmdbuilder('tip', template=templates.changeset,
+        args = cmdbuilder('tip', template=self._template(fields),
                           hidden=self.hidden)
-        out = self.rawcommand(args)
-        out = out.split('\0')
 
-        return self._parserevs(out)[0]
+        def parse(out):
+            return next(self._iterrevs(out.split('\0'), fields))
+
+        return self._rawcommand(args, parse=parse)
 
     def update(self, rev=None, clean=False, check=False, date=None):
         """
@@ -1856,7 +2734,7 @@ class hgclient(object):
                 return out
             raise error.CommandError(args, ret, out, err)
 
-        out = self.rawcommand(args, eh=eh)
+        out = self._rawcommand(args, eh=eh)
 
         m = re.search(r'^(\d+).+, (\d+).+, (\d+).+, (\d+)', out, re.MULTILINE)
         return tuple(map(int, list(m.groups())))
@@ -1869,22 +2747,41 @@ class hgclient(object):
         (1, 9, 1, '+4-3095db9f5c2c')
         """
         if self._version is None:
-            v = self.rawcommand(cmdbuilder('version', q=True))
-            v = list(re.match(r'.*?(\d+)\.(\d+)\.?(\d+)?(\+[0-9a-f-]+)?',
-                              v).groups())
-
-            for i in range(3):
-                try:
-                    v[i] = int(v[i])
-                except TypeError:
-                    v[i] = 0
-
-            self._version = tuple(v)
+            self._version = self._rawcommand(cmdbuilder('version', q=True),
+                                             parse=self._parseversion)
 
         return self._version
 
     def __getitem__(self, changeid):
-        return changectx(self, changeid)
+        return self._context(changeid)
+
+    def _context(self, changeid):
+        """ the changectx for changeid, or the one already in use for the
+        same changeset """
+        if isinstance(changeid, changectx):
+            ctx = changeid
+        else:
+            ctx = changectx(self, changeid)
+        old = self._contexts.get(ctx._node)
+        if old is None:
+            self._contexts[ctx._node] = ctx
+            return ctx
+        old._refresh(ctx)
+        return old
+
+    def _lookupctx(self, rev, node):
+        """ the changectx of the changeset rev, node, read from the server
+        only if it isn't in use already """
+        if rev == -1:
+            return self._context(-1)
+        ctx = self._contexts.get(node)
+        if ctx is None and self.prefetchsize > 1:
+            self.prefetch('%d:%d' % (rev, max(rev - self.prefetchsize + 1,
+                                              0)))
+            ctx = self._contexts.get(node)
+        if ctx is None:
+            ctx = self._context(node)
+        return ctx
 
     def __contains__(self, changeid):
         """
@@ -1896,3 +2793,250 @@ class hgclient(object):
             return True
         except ValueError:
             return False
+
+
+class batchresult(object):
+    """The result of a command queued in a commandbatch, available once the
+    batch has run."""
+    def __init__(self, args, parse=None, eh=None):
+        self.args = args
+        self._parse = parse
+        self._eh = eh
+        self._done = False
+        self._value = None
+        self._error = None
+
+    def done(self):
+        return self._done
+
+    def _set(self, ret, out, err):
+        try:
+            if ret:
+                if self._eh is None:
+                    raise error.CommandError(self.args, ret, out, err)
+                out = self._eh(ret, out, err)
+            elif self._parse is not None:
+                out = self._parse(out)
+            self._value = out
+        except Exception as e:
+            self._error = e
+        self._done = True
+
+    def result(self):
+        """ return the result of the command, or raise the error it raised
+        (a CommandError unless handled by eh) """
+        if not self._done:
+            raise ValueError('the batch has not run yet')
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class commandbatch(object):
+    """Queue read-only commands and run them over one server connection
+    without waiting for each result before sending the next command.
+
+    Each method queues a command like the hgclient method of the same name
+    and returns a batchresult. Leaving the with block (without an exception)
+    or calling run() sends the queued commands and fills in their results:
+
+        with client.batch() as b:
+            a = b.cat(['a'], rev='tip')
+            st = b.status()
+        a.result(), st.result()
+
+    The commands must not ask for input; a prompt or a request for data
+    raises a ResponseError.
+    """
+    # bytes of requests written ahead of the results read back. Kept under
+    # the capacity of a pipe, so that writing never blocks on a server
+    # which is itself blocked writing output we haven't read yet.
+    window = 32768
+
+    def __init__(self, client):
+        self._client = client
+        self._queue = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.run()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _add(self, args, parse=None, eh=None, raw=False):
+        r = batchresult(args, parse, eh)
+        self._queue.append((r, raw))
+        return r
+
+    def run(self):
+        """
+        Run the queued commands, in order, and return the list of their
+        results. If any of them failed, the first error is raised once all
+        of them have run.
+        """
+        client = self._client
+        if not client.server:
+            raise ValueError("server not connected")
+        if client._streaming:
+            raise ValueError("server busy, the output of a previous command "
+                             "is still being read")
+
+        queue, self._queue = self._queue, []
+        requests = []
+        for r, raw in queue:
+            data = '\0'.join(r.args).encode('latin-1')
+            requests.append(b'runcommand\n' +
+                            struct.pack(client.inputfmt, len(data)) + data)
+
+        stdin = client.server.stdin
+        sent = inflight = 0
+        for i, (r, raw) in enumerate(queue):
+            # the first unanswered request is always sent, whatever its size
+            while sent < len(requests) and (
+                    sent == i or inflight + len(requests[sent]) <= self.window):
+                stdin.write(requests[sent])
+                inflight += len(requests[sent])
+                sent += 1
+            stdin.flush()
+
+            out, err = io.BytesIO(), io.BytesIO()
+            outchannels = {b'o': out.write, b'e': err.write}
+            # timed from when the command is next in line
+            stats = client._newstats(r.args)
+            if stats is not None:
+                outchannels = stats.wrap(outchannels)
+            while True:
+                channel, data = client._reader.readframe(outchannels)
+                if stats is not None:
+                    stats.frame(channel, data)
+                if channel == b'r':
+                    ret = struct.unpack(hgclient.retfmt, data)[0]
+                    break
+                elif channel.isupper():
+                    raise error.ResponseError("unexpected data on required"
+                                              "channel '%s' in a batch"
+                                              % channel)
+            inflight -= len(requests[i])
+
+            decode = bytes if raw else client._decode
+            out, err = decode(out.getvalue()), decode(err.getvalue())
+            if stats is None:
+                r._set(ret, out, err)
+            else:
+                stats.done(ret)
+                start = metrics.timer()
+                r._set(ret, out, err)
+                if r._parse is not None and not ret:
+                    stats.parse = metrics.timer() - start
+                client._emit(stats)
+
+        return [r.result() for r, raw in queue]
+
+    def rawcommand(self, args, eh=None):
+        """ see hgclient.rawcommand """
+        return self._add(args, eh=eh, raw=self._client._rawbytes)
+
+    def bookmarks(self):
+        """ see hgclient.bookmarks """
+        args = cmdbuilder('bookmarks', hidden=self._client.hidden)
+        return self._add(args, hgclient._parsebookmarks)
+
+    def branches(self, active=False, closed=False):
+        """ see hgclient.branches """
+        args = cmdbuilder('branches', a=active, c=closed,
+                          hidden=self._client.hidden)
+        return self._add(args, hgclient._parsebranches)
+
+    def cat(self, files, rev=None):
+        """ see hgclient.cat """
+        args = cmdbuilder('cat', r=rev, hidden=self._client.hidden, *files)
+        return self._add(args, raw=self._client._rawbytes)
+
+    def heads(self, rev=[], startrev=[], topological=False, closed=False):
+        """ see hgclient.heads """
+        if not isinstance(rev, list):
+            rev = [rev]
+
+        args = cmdbuilder('heads', r=startrev, t=topological, c=closed,
+                          template=templates.changeset,
+                          hidden=self._client.hidden, *rev)
+
+        def eh(ret, out, err):
+            if ret != 1:
+                raise error.CommandError(args, ret, out, err)
+            return []
+
+        return self._add(args, self._parserevs, eh)
+
+    def identify(self, rev=None, source=None, num=False, id=False,
+                 branch=False, tags=False, bookmarks=False):
+        """ see hgclient.identify """
+        args = cmdbuilder('identify', source, r=rev, n=num, i=id, b=branch,
+                          t=tags, B=bookmarks, hidden=self._client.hidden)
+        return self._add(args)
+
+    def log(self, revrange=None, files=[], follow=False, followfirst=False,
+            date=None, copies=False, keyword=None, removed=False,
+            onlymerges=False, user=None, branch=None, prune=None, hidden=None,
+            limit=None, nomerges=False, include=None, exclude=None):
+        """ see hgclient.log """
+        if hidden is None:
+            hidden = self._client.hidden
+        args = cmdbuilder('log', template=templates.changeset,
+                          r=revrange, f=follow, follow_first=followfirst,
+                          d=date, C=copies, k=keyword, removed=removed,
+                          m=onlymerges, u=user, b=branch, P=prune,
+                          l=limit, M=nomerges, I=include, X=exclude,
+                          hidden=hidden, *files)
+        return self._add(args, self._parserevs)
+
+    def manifest(self, rev=None, all=False):
+        """ see hgclient.manifest, the result is a list """
+        args = cmdbuilder('manifest', r=rev, all=all, debug=True,
+                          hidden=self._client.hidden)
+        if all:
+            parse = str.splitlines
+        else:
+            def parse(out):
+                return [hgclient._parsemanifestline(line)
+                        for line in out.splitlines()]
+        return self._add(args, parse)
+
+    def parents(self, rev=None, file=None):
+        """ see hgclient.parents """
+        args = cmdbuilder('parents', file, template=templates.changeset,
+                          r=rev, hidden=self._client.hidden)
+        return self._add(args, lambda out: self._parserevs(out) or None)
+
+    def status(self, rev=None, change=None, all=False, modified=False,
+               added=False, removed=False, deleted=False, clean=False,
+               unknown=False, ignored=False, copies=False, subrepos=False,
+               include=None, exclude=None):
+        """ see hgclient.status """
+        if rev and change:
+            raise ValueError('cannot specify both rev and change')
+
+        args = cmdbuilder('status', rev=rev, change=change, A=all,
+                          m=modified, a=added, r=removed, d=deleted, c=clean,
+                          u=unknown, i=ignored, C=copies, S=subrepos,
+                          I=include, X=exclude, hidden=self._client.hidden)
+        args.append('-0')
+        return self._add(args, hgclient._parsestatus)
+
+    def tags(self):
+        """ see hgclient.tags """
+        return self._add(cmdbuilder('tags', v=True), hgclient._parsetags)
+
+    def tip(self):
+        """ see hgclient.tip """
+        args = cmdbuilder('tip', template=templates.changeset,
+                          hidden=self._client.hidden)
+        return self._add(args, lambda out: self._parserevs(out)[0])
+
+    @staticmethod
+    def _parserevs(out):
+        return hgclient._parserevs(out.split('\0')[:-1])
@@ -0,0 +1,174 @@
+"""
+A cache of the output of read-only commands.
+
+Services ask the same repository for its tags, branches or the contents of
+a file at some changeset over and over. A commandcache keeps the output of
+the commands whose result is determined by the state of the repository, so
+that asking again sends nothing to the server until that state changes:
+
+    client.commandcache = hglib.commandcache.commandcache(maxbytes=64 << 20)
+    client.tags()          # runs tags
+    client.tags()          # from the cache
+    client.tag('v1.0')
+    client.tags()          # runs tags again, the refs have changed
+
+Every cached result is stored with the parts of client.fingerprint() that
+command reads (see commands), and is only used while they are the same.
+cat and diff of full 40 digit nodes print the same thing forever, so those
+are kept whatever happens to the repository. showconfig and paths don't
+depend on the repository files but on the configuration the server read
+when it started, so they are kept for as long as that server runs.
+
+Entries are evicted, least recently used first, when their total size
+exceeds maxbytes. A cache only holds the output of a single repository, but
+can be shared by several clients of it.
+"""
+import collections
+import re
+
+# command -> the fingerprint components its output depends on. A command
+# whose output changes with the hidden revisions depends on phases, which
+# includes the obsolescence markers
+commands = {
+    'bookmarks': ('changelog', 'phases', 'refs', 'workingcopy'),
+    'branches': ('changelog', 'phases', 'refs'),
+    'tags': ('changelog', 'phases', 'refs'),
+}
+
+# commands whose output only depends on the server's configuration
+configcommands = ('config', 'paths', 'showconfig')
+
+# options of cat and diff that select revisions, and those that make them
+# write somewhere else than to the client
+_revopts = {'-r': 'rev', '--rev': 'rev', '-c': 'change', '--change': 'change'}
+_outputopts = ('-o', '--output')
+
+_node = re.compile(r'^[0-9a-f]{40}$')
+
+# the key of entries that never change
+pinned = ()
+
+
+def _isnode(arg):
+    return _node.match(arg) is not None
+
+
+def nodeaddressed(args):
+    """
+    Whether args is a cat of a single revision or a diff between two (or of
+    one change), every one of them given by its full node, which print the
+    same thing forever.
+
+    >>> node = '0123456789abcdef0123456789abcdef01234567'
+    >>> nodeaddressed(['cat', '-r', node, 'a'])
+    True
+    >>> nodeaddressed(['cat', '-r', 'tip', 'a'])
+    False
+    >>> nodeaddressed(['cat', 'a'])
+    False
+    >>> nodeaddressed(['diff', '-r', node, '-r', node])
+    True
+    >>> nodeaddressed(['diff', '-r', node])
+    False
+    >>> nodeaddressed(['diff', '-c', node, '--git'])
+    True
+    """
+    if not args or args[0] not in ('cat', 'diff'):
+        return False
+    revs = []
+    it = iter(args[1:])
+    for arg in it:
+        if arg in _outputopts or arg.startswith('--output='):
+            return False
+        opt, sep, value = arg.partition('=')
+        if opt in _revopts:
+            if not sep:
+                value = next(it, '')
+            if not _isnode(value):
+                return False
+            revs.append(_revopts[opt])
+    if args[0] == 'cat':
+        return revs == ['rev']
+    return revs in (['rev', 'rev'], ['change'])
+
+
+class commandcache(object):
+    """The output of read-only commands, up to maxbytes of it. hits, misses
+    and evictions count lookups that found a fresh entry, lookups of a
+    command that could be cached that didn't, and entries evicted to make
+    room."""
+    def __init__(self, maxbytes=16 << 20):
+        self.maxbytes = maxbytes
+        # args -> (state, output)
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def _normalize(args):
+        return tuple(a.decode('utf-8', 'surrogateescape')
+                     if isinstance(a, bytes) else a for a in args)
+
+    def state(self, client, args):
+        """ what the output of args depends on for client, pinned if it
+        never changes and None if it can't be cached """
+        if not args:
+            return None
+        name = args[0]
+        if name in commands:
+            fp = client.fingerprint()
+            return tuple(getattr(fp, c) for c in commands[name])
+        if name in configcommands:
+            return ('server', client._serverid)
+        if nodeaddressed(args):
+            return pinned
+        return None
+
+    def get(self, client, args):
+        """
+        Return (key, state, output) for running args with client. output is
+        the cached output as bytes, or None if it has to be run, and then
+        it can be stored with put(key, state, output) unless state is None.
+        """
+        key = self._normalize(args)
+        state = self.state(client, key)
+        if state is None:
+            return key, None, None
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == state:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return key, state, entry[1]
+        self.misses += 1
+        return key, state, None
+
+    def put(self, key, state, output):
+        size = self._size(key, output)
+        if size > self.maxbytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            # replaced by a fresh one, not evicted
+            self._bytes -= self._size(key, old[1])
+        self._entries[key] = (state, output)
+        self._bytes += size
+        while self._bytes > self.maxbytes:
+            oldkey, old = self._entries.popitem(last=False)
+            self._bytes -= self._size(oldkey, old[1])
+            self.evictions += 1
+
+    @staticmethod
+    def _size(key, output):
+        return len(output) + sum(len(a) for a in key)
+
+    @property
+    def nbytes(self):
+        """ the total size of the cached entries """
+        return self._bytes
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
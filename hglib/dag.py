@@ -0,0 +1,353 @@
+"""
+The revision graph of a repository, held by the client.
+
+Asking the server for ancestors(x), children(x) and the like costs a command
+each. A dagindex reads the parents of every revision once and answers such
+questions locally from then on; refresh() only reads the revisions added
+since:
+
+    dag = client.dag()
+    dag.ancestors([rev]), dag.isancestor(a, b), dag.heads()
+
+Everything works on revision numbers, rev() and node() convert from and to
+hex nodes.
+"""
+import array
+import binascii
+import collections
+
+from . import error
+from . import util
+
+template = '{rev} {p1rev} {p2rev} {node}\\n'
+
+
+class dagindex(object):
+    """The parents of every revision of a repository in arrays indexed by
+    revision number.
+
+    Revisions the client doesn't see (hidden ones, unless client.hidden is
+    set) have no entry: they aren't in the index and their slots in p1 and
+    p2 are -1.
+
+    generation holds the generation number of every revision, one more
+    than the largest of its parents', so that an ancestor always has a
+    smaller one. isancestor uses it to prune its search, and keeps the
+    ancestors of the revisions it is asked about repeatedly in a cache of
+    up to maxcachebytes.
+    """
+    # the revisions remembered as asked about once by isancestor
+    _askedsize = 1024
+
+    def __init__(self, client, maxcachebytes=16 << 20):
+        self._client = client
+        self.maxcachebytes = maxcachebytes
+        self.p1 = array.array('l')
+        self.p2 = array.array('l')
+        self.generation = array.array('l')
+        self.nodes = bytearray()
+        self._present = bytearray()
+        self._revs = {}
+        self._count = 0
+        # computed when first needed after a change
+        self._children = None
+        self._heads = None
+        # rev -> bytearray marking its ancestors, least recently used first.
+        # The ancestors of a revision never change, so these only go when
+        # the whole index is read again.
+        self._reach = collections.OrderedDict()
+        self._reachbytes = 0
+        self._asked = collections.OrderedDict()
+
+    def refresh(self):
+        """ read the revisions added since the last refresh, or all of them
+        again if one of the known ones was removed or replaced """
+        last = len(self.p1) - 1
+        if last < 0:
+            self._load('all()')
+            return
+        try:
+            records = self._read('%d:' % last)
+        except error.CommandError:
+            # last is gone
+            records = None
+        if (not records or records[0][0] != last
+                or records[0][3] != self.nodes[last * 20:last * 20 + 20]):
+            self.clear()
+            self._load('all()')
+            return
+        self._add(records[1:])
+
+    def clear(self):
+        self.__init__(self._client, self.maxcachebytes)
+
+    def _read(self, revrange):
+        c = self._client
+        args = util.cmdbuilder('log', template=template, r=revrange,
+                               hidden=c.hidden)
+        records = []
+        for line in c._rawcommanditer(args, delimiter='\n'):
+            rev, p1, p2, node = line.split(' ')
+            records.append((int(rev), int(p1), int(p2),
+                            binascii.unhexlify(node)))
+        return records
+
+    def _load(self, revrange):
+        self._add(self._read(revrange))
+
+    def _add(self, records):
+        if not records:
+            return
+        self._children = self._heads = None
+        p1, p2, nodes, present = self.p1, self.p2, self.nodes, self._present
+        gen = self.generation
+        for rev, r1, r2, node in records:
+            missing = rev + 1 - len(p1)
+            if missing > 0:
+                p1.extend([-1] * missing)
+                p2.extend([-1] * missing)
+                gen.extend([0] * missing)
+                nodes.extend(bytes(20 * missing))
+                present.extend(bytes(missing))
+            p1[rev] = r1
+            p2[rev] = r2
+            gen[rev] = 1 + max(gen[r1] if r1 != -1 else 0,
+                               gen[r2] if r2 != -1 else 0)
+            nodes[rev * 20:rev * 20 + 20] = node
+            present[rev] = 1
+            self._revs[node] = rev
+        self._count += len(records)
+
+    def __len__(self):
+        """ the number of revisions """
+        return self._count
+
+    def __contains__(self, rev):
+        return 0 <= rev < len(self._present) and bool(self._present[rev])
+
+    def __iter__(self):
+        """ the revisions in ascending order """
+        present = self._present
+        return (r for r in range(len(present)) if present[r])
+
+    def tiprev(self):
+        """ the highest revision, -1 if there is none """
+        return len(self.p1) - 1
+
+    def node(self, rev):
+        """ the hex node of rev """
+        if rev == -1:
+            return '0' * 40
+        return binascii.hexlify(self.nodes[rev * 20:rev * 20 + 20]).decode(
+            'ascii')
+
+    def rev(self, node):
+        """ the revision of a full hex or binary node, KeyError if it isn't
+        known """
+        if len(node) == 40:
+            node = binascii.unhexlify(node)
+        if node == b'\0' * 20:
+            return -1
+        return self._revs[bytes(node)]
+
+    def parents(self, rev):
+        """ the parent revisions of rev, without the null revision """
+        r1, r2 = self.p1[rev], self.p2[rev]
+        if r2 != -1:
+            return [r1, r2]
+        if r1 != -1:
+            return [r1]
+        return []
+
+    def children(self, rev):
+        """ the revisions that have rev as a parent, ascending """
+        if self._children is None:
+            self._buildchildren()
+        offsets, children = self._children
+        return children[offsets[rev]:offsets[rev + 1]].tolist()
+
+    def _buildchildren(self):
+        # every revision's children stored back to back, children of rev
+        # being children[offsets[rev]:offsets[rev + 1]]
+        n = len(self.p1)
+        counts = array.array('l', [0]) * (n + 1)
+        for r in self:
+            for p in self.parents(r):
+                counts[p + 1] += 1
+        offsets = array.array('l', [0]) * (n + 1)
+        for r in range(n):
+            offsets[r + 1] = offsets[r] + counts[r + 1]
+        fill = array.array('l', offsets)
+        children = array.array('l', [0]) * offsets[n]
+        for r in self:
+            for p in self.parents(r):
+                children[fill[p]] = r
+                fill[p] += 1
+        self._children = (offsets, children)
+
+    def heads(self):
+        """ the revisions without children, ascending """
+        if self._heads is None:
+            parent = bytearray(len(self.p1))
+            p1, p2 = self.p1, self.p2
+            for r in self:
+                if p1[r] != -1:
+                    parent[p1[r]] = 1
+                if p2[r] != -1:
+                    parent[p2[r]] = 1
+            self._heads = [r for r in self if not parent[r]]
+        return list(self._heads)
+
+    def _ancestormap(self, revs, stop=0):
+        """ a bytearray marking revs and their ancestors, only complete for
+        the revisions from stop up """
+        seen = bytearray(len(self.p1))
+        top = -1
+        for r in revs:
+            seen[r] = 1
+            top = max(top, r)
+        p1, p2 = self.p1, self.p2
+        # parents come before their children, so a single pass downwards
+        # visits every ancestor after all of its descendants
+        for r in range(top, stop - 1, -1):
+            if seen[r]:
+                if p1[r] != -1:
+                    seen[p1[r]] = 1
+                if p2[r] != -1:
+                    seen[p2[r]] = 1
+        return seen
+
+    def ancestors(self, revs):
+        """ revs and all of their ancestors, ascending """
+        seen = self._ancestormap(revs)
+        return [r for r in range(len(seen)) if seen[r]]
+
+    def descendants(self, revs):
+        """ revs and all of their descendants, ascending """
+        revs = list(revs)
+        if not revs:
+            return []
+        seen = bytearray(len(self.p1))
+        for r in revs:
+            seen[r] = 1
+        p1, p2 = self.p1, self.p2
+        present = self._present
+        result = []
+        for r in range(min(revs), len(seen)):
+            if not seen[r] and present[r] and (
+                    p1[r] != -1 and seen[p1[r]] or
+                    p2[r] != -1 and seen[p2[r]]):
+                seen[r] = 1
+            if seen[r]:
+                result.append(r)
+        return result
+
+    def isancestor(self, a, b):
+        """
+        Whether a is an ancestor of b, or b itself.
+
+        The first time b is asked about, this searches the ancestors of b
+        that could still lead to a: those above a with a larger generation.
+        The second time, all of b's ancestors are marked and cached, which
+        answers later questions about b by a lookup.
+        """
+        if a == b or a == -1:
+            return True
+        if a > b or b == -1:
+            return False
+        gen = self.generation
+        if gen[a] >= gen[b]:
+            return False
+
+        reach = self._reach.get(b)
+        if reach is not None:
+            self._reach.move_to_end(b)
+            return bool(reach[a])
+
+        if b in self._asked:
+            del self._asked[b]
+            return bool(self._cachereach(b)[a])
+        self._asked[b] = True
+        if len(self._asked) > self._askedsize:
+            self._asked.popitem(last=False)
+
+        p1, p2 = self.p1, self.p2
+        limit = gen[a]
+        seen = set()
+        stack = [b]
+        while stack:
+            r = stack.pop()
+            for p in (p1[r], p2[r]):
+                if p == a:
+                    return True
+                if p > a and gen[p] > limit and p not in seen:
+                    seen.add(p)
+                    stack.append(p)
+        return False
+
+    def _cachereach(self, rev):
+        reach = self._ancestormap([rev])
+        del reach[rev + 1:]
+        self._reach[rev] = reach
+        self._reachbytes += len(reach)
+        while self._reachbytes > self.maxcachebytes and len(self._reach) > 1:
+            self._reachbytes -= len(self._reach.popitem(last=False)[1])
+        return reach
+
+    def commonancestorsheads(self, a, b):
+        """ the common ancestors of a and b that aren't ancestors of other
+        common ancestors, ascending """
+        if a == -1 or b == -1:
+            return []
+        # a single pass downwards marking the ancestors of a with 1, those
+        # of b with 2 and those below a common ancestor found already with
+        # 4. It ends when only the latter are left.
+        flags = bytearray(len(self.p1))
+        flags[a] |= 1
+        flags[b] |= 2
+        live = 1 if a == b else 2
+        p1, p2 = self.p1, self.p2
+        heads = []
+        for r in range(max(a, b), -1, -1):
+            f = flags[r]
+            if not f or f & 4:
+                continue
+            live -= 1
+            if f == 3:
+                heads.append(r)
+                f = 7
+            for p in (p1[r], p2[r]):
+                if p == -1:
+                    continue
+                old = flags[p]
+                new = old | f
+                if new != old:
+                    flags[p] = new
+                    live += (not new & 4) - (old and not old & 4)
+            if not live:
+                break
+        heads.reverse()
+        return heads
+
+    def depth(self, rev):
+        """ the number of revisions on the longest path from a root to rev,
+        inclusive """
+        depths = {}
+        for r in self.ancestors([rev]):
+            depths[r] = 1 + max([depths[p] for p in self.parents(r)] or [0])
+        return depths[rev]
+
+    def ancestor(self, a, b):
+        """
+        The common ancestor of a and b that ancestor(a, b) gives, or -1:
+        the deepest of their common ancestor heads, or the one with the
+        smallest node among the deepest ones.
+        """
+        heads = self.commonancestorsheads(a, b)
+        if not heads:
+            return -1
+        if len(heads) > 1:
+            depths = dict((h, self.depth(h)) for h in heads)
+            deepest = max(depths.values())
+            heads = [h for h in heads if depths[h] == deepest]
+        return min(heads, key=self.node)
@@ -0,0 +1,325 @@
+"""
+Command servers for many repositories, within a budget.
+
+A service that reads thousands of repositories can't keep a server open for
+each of them, and starting one per request costs a process every time. A
+repomanager keeps the servers of the repositories used most recently,
+stopping the least recently used idle ones to stay under a cap on their
+number and on their total memory:
+
+    manager = hglib.manager.repomanager(maxservers=64, maxrss=4 << 30)
+    with manager.checkout('/srv/repos/foo') as client:
+        client.log()
+
+Each repository gets a single server, which one caller at a time checks out;
+others wait for it to be given back. Servers that die are replaced when
+their repository is next checked out.
+"""
+import collections
+import contextlib
+import os
+import threading
+import time
+
+from . import client
+from . import error
+from . import pool
+
+_pagesize = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss(c):
+    """ the resident memory of the server of c in bytes, 0 where it can't
+    be told (no /proc, or a server reached over a socket) """
+    pid = getattr(c.server, 'pid', None)
+    if pid is None:
+        return 0
+    try:
+        with open('/proc/%d/statm' % pid) as f:
+            return int(f.read().split()[1]) * _pagesize
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class _server(object):
+    """ the server of a repository, client is None while it is starting """
+    __slots__ = ('client', 'busy', 'rss')
+
+    def __init__(self):
+        self.client = None
+        self.busy = True
+        self.rss = 0
+
+
+class repomanager(object):
+    def __init__(self, maxservers=16, maxrss=None, encoding=None,
+                 configs=None, raw_bytes=False, transport='pipe'):
+        """
+        Start servers on demand, keeping at most maxservers of them, and
+        stopping idle ones while their total resident memory is above
+        maxrss bytes (if given). encoding, configs, raw_bytes and transport
+        are passed to each hgclient, see hglib.open.
+        """
+        if maxservers < 1:
+            raise ValueError('maxservers must be at least 1')
+
+        self.maxservers = maxservers
+        self.maxrss = maxrss
+        self._encoding = encoding
+        self._configs = configs
+        self._rawbytes = raw_bytes
+        self._transport = transport
+
+        self._cond = threading.Condition()
+        self._closed = False
+        # path -> _server, least recently used first
+        self._servers = collections.OrderedDict()
+        # path -> checkouts, of every repository ever asked for
+        self._heat = collections.Counter()
+        # client checked out -> its path
+        self._lent = {}
+
+        self._created = time.monotonic()
+        self._checkouts = 0
+        self._hits = 0
+        self._spawned = 0
+        self._evicted = 0
+        self._replaced = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def _key(path):
+        return os.path.realpath(path)
+
+    def _spawn(self, path):
+        c = client.hgclient(path, self._encoding, self._configs,
+                            raw_bytes=self._rawbytes,
+                            transport=self._transport)
+        with self._cond:
+            self._spawned += 1
+        return c
+
+    def _evict(self, room):
+        """ remove least recently used idle servers until there are fewer
+        than maxservers - room + 1 of them and they use less than maxrss,
+        returning them. Called with the lock held. """
+        evicted = []
+        def full():
+            if len(self._servers) + room > self.maxservers:
+                return True
+            return (self.maxrss is not None and self._servers
+                    and sum(s.rss for s in self._servers.values())
+                    > self.maxrss)
+
+        while full():
+            for path, s in self._servers.items():
+                if not s.busy:
+                    break
+            else:
+                break
+            del self._servers[path]
+            evicted.append(s.client)
+            self._evicted += 1
+        return evicted
+
+    @staticmethod
+    def _stop(clients):
+        for c in clients:
+            try:
+                c.close()
+            except (OSError, ValueError):
+                pool.clientpool._discard(c)
+
+    def get(self, path, timeout=None):
+        """
+        Return a client of the repository at path, starting a server for it
+        if there isn't one (and stopping idle ones to make room). Waits at
+        most timeout seconds (forever if None) for the repository's server
+        to be given back, or for room for a new one, and raises
+        pool.PoolTimeout if it wasn't. The client must be given back with
+        put().
+        """
+        key = self._key(path)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        evicted = []
+        try:
+            with self._cond:
+                self._heat[key] += 1
+                while True:
+                    if self._closed:
+                        raise ValueError('manager is closed')
+                    s = self._servers.get(key)
+                    if s is not None and not s.busy:
+                        s.busy = True
+                        self._servers.move_to_end(key)
+                        self._hits += 1
+                        break
+                    if s is None:
+                        evicted += self._evict(1)
+                        if len(self._servers) < self.maxservers:
+                            s = self._servers[key] = _server()
+                            break
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise pool.PoolTimeout(
+                                'no server available after %s seconds'
+                                % timeout)
+                    self._cond.wait(remaining)
+                self._checkouts += 1
+        finally:
+            self._stop(evicted)
+
+        c = s.client
+        if c is not None and not pool.clientpool._alive(c):
+            pool.clientpool._discard(c)
+            c = None
+            with self._cond:
+                self._replaced += 1
+        if c is None:
+            try:
+                c = s.client = self._spawn(path)
+            except BaseException:
+                with self._cond:
+                    del self._servers[key]
+                    self._cond.notify_all()
+                raise
+        with self._cond:
+            self._lent[c] = key
+        return c
+
+    def put(self, c, broken=False):
+        """
+        Give back a client taken with get(). If broken is True or its server
+        died, it is stopped, and started again when its repository is next
+        checked out.
+        """
+        alive = not broken and pool.clientpool._alive(c)
+        size = rss(c) if alive else 0
+        stopped = []
+        with self._cond:
+            key = self._lent.pop(c, None)
+            if key is None:
+                raise ValueError('client was not checked out of this manager')
+            s = self._servers[key]
+            s.busy = False
+            s.rss = size
+            if not alive or self._closed:
+                del self._servers[key]
+            else:
+                stopped = self._evict(0)
+            self._cond.notify_all()
+        if not alive:
+            pool.clientpool._discard(c)
+        elif self._closed and c not in stopped:
+            stopped.append(c)
+        self._stop(stopped)
+
+    @contextlib.contextmanager
+    def checkout(self, path, timeout=None):
+        """
+        Context manager lending a client of the repository at path for the
+        duration of the block, see get(). The server is replaced if the
+        block raises ServerError.
+        """
+        c = self.get(path, timeout)
+        broken = False
+        try:
+            yield c
+        except error.ServerError:
+            broken = True
+            raise
+        finally:
+            self.put(c, broken)
+
+    def prewarm(self, paths=None, count=None):
+        """
+        Start servers for the repositories in paths, or by default for those
+        checked out most often, most often first. At most count of them are
+        started (all of paths, or as many as maxservers leaves room for, by
+        default), without stopping any running server to make room. Returns
+        the paths a server was started for.
+        """
+        if paths is None:
+            with self._cond:
+                paths = [p for p, n in self._heat.most_common()]
+        if count is None:
+            count = len(paths)
+
+        started = []
+        for path in paths:
+            if len(started) >= count:
+                break
+            key = self._key(path)
+            with self._cond:
+                if (self._closed or key in self._servers
+                        or len(self._servers) >= self.maxservers):
+                    continue
+                s = self._servers[key] = _server()
+                self._servers.move_to_end(key, last=False)
+            try:
+                s.client = self._spawn(path)
+            except BaseException:
+                with self._cond:
+                    del self._servers[key]
+                    self._cond.notify_all()
+                raise
+            size = rss(s.client)
+            with self._cond:
+                s.busy = False
+                s.rss = size
+                self._cond.notify_all()
+            started.append(path)
+        return started
+
+    def stats(self):
+        """
+        Return a dict describing the manager:
+
+        servers - servers running
+        busy - servers checked out
+        rss - total resident memory of the servers when last given back,
+        in bytes
+        checkouts - number of successful get() calls
+        hits - checkouts whose repository already had a server
+        hitrate - hits / checkouts
+        spawned - servers started, including replacements and prewarm()
+        spawnrate - servers started per second since the manager was
+        created
+        evicted - idle servers stopped to make room
+        replaced - dead servers that were replaced
+        """
+        with self._cond:
+            elapsed = time.monotonic() - self._created
+            return {
+                'servers': len(self._servers),
+                'busy': sum(1 for s in self._servers.values() if s.busy),
+                'rss': sum(s.rss for s in self._servers.values()),
+                'checkouts': self._checkouts,
+                'hits': self._hits,
+                'hitrate': (self._hits / self._checkouts
+                            if self._checkouts else 0.0),
+                'spawned': self._spawned,
+                'spawnrate': self._spawned / elapsed if elapsed else 0.0,
+                'evicted': self._evicted,
+                'replaced': self._replaced,
+            }
+
+    def close(self):
+        """
+        Stop the idle servers. Servers still checked out are stopped when
+        they are given back.
+        """
+        with self._cond:
+            self._closed = True
+            idle = [path for path, s in self._servers.items()
+                    if not s.busy]
+            stopped = [self._servers.pop(path).client for path in idle]
+            self._cond.notify_all()
+        self._stop(stopped)
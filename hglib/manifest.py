@@ -0,0 +1,117 @@
+"""
+Manifests shared between the changectxs of a client.
+
+Every changectx used to run manifest for itself and keep its own dict, so
+walking many revisions of a large repository held many near identical copies
+of the same paths and nodes. A client's manifestcache keeps the manifests it
+has read by manifest node instead, evicting the least recently used ones when
+they hold more than maxentries files in total:
+
+    ctx = client['tip']
+    'src/main.c' in ctx, list(ctx.walk('src/'))
+"""
+import bisect
+import collections
+import collections.abc
+import sys
+
+nullid = '0' * 40
+
+
+class manifest(collections.abc.Mapping):
+    """The files of a revision: a read-only mapping of path to hex file node,
+    iterated in sorted order."""
+    def __init__(self, nodes, paths):
+        """ nodes - a dict of path to node, paths - its keys, sorted """
+        self._nodes = nodes
+        self._paths = paths
+
+    def __getitem__(self, path):
+        return self._nodes[path]
+
+    def __contains__(self, path):
+        return path in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def walk(self, prefix):
+        """ yield the paths starting with prefix in sorted order, e.g. the
+        files under a directory if prefix ends with a slash """
+        paths = self._paths
+        i = bisect.bisect_left(paths, prefix)
+        while i < len(paths) and paths[i].startswith(prefix):
+            yield paths[i]
+            i += 1
+
+    def __repr__(self):
+        return '<manifest with %d files>' % len(self)
+
+
+class manifestcache(object):
+    """
+    The manifests read by a client, by manifest node. As manifest nodes
+    identify their content, the cache never goes stale.
+
+    Paths and nodes are interned, so a file that is the same in several
+    cached manifests is stored once, and a manifest with the same paths as
+    the one read before it shares its sorted index.
+    """
+    def __init__(self, maxentries=1000000):
+        self.maxentries = maxentries
+        self._manifests = collections.OrderedDict()
+        self._entries = 0
+        self._last = None
+        self.hits = self.misses = 0
+
+    def get(self, client, rev, node):
+        """ return the manifest with the given node, reading it from the
+        manifest of rev with client if it isn't cached """
+        if node == nullid:
+            return manifest({}, [])
+
+        m = self._manifests.get(node)
+        if m is not None:
+            self._manifests.move_to_end(node)
+            self.hits += 1
+            return m
+
+        self.misses += 1
+        m = self._read(client, rev)
+        self._manifests[node] = m
+        self._entries += len(m)
+        # keep at least the manifest just read, however large it is
+        while self._entries > self.maxentries and len(self._manifests) > 1:
+            old = self._manifests.popitem(last=False)[1]
+            self._entries -= len(old)
+        return m
+
+    def _read(self, client, rev):
+        intern = sys.intern
+        nodes = {}
+        for node, perm, executable, symlink, path in client.manifest(rev=rev):
+            if isinstance(path, str):
+                path, node = intern(path), intern(node)
+            nodes[path] = node
+
+        last = self._last
+        if (last is not None and len(last) == len(nodes)
+                and last._nodes.keys() == nodes.keys()):
+            paths = last._paths
+        else:
+            # manifest prints the paths sorted already, which sorted()
+            # notices in a single pass
+            paths = sorted(nodes)
+        self._last = m = manifest(nodes, paths)
+        return m
+
+    def clear(self):
+        self._manifests.clear()
+        self._entries = 0
+        self._last = None
+
+    def __len__(self):
+        return len(self._manifests)
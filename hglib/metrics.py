@@ -0,0 +1,193 @@
+"""
+Per-command measurements for hgclient.
+
+Functions added with hgclient.addobserver() are called with a commandstats
+after every command. registry is such a function, which keeps a latency
+histogram per command name:
+
+    reg = hglib.metrics.registry()
+    client.addobserver(reg)
+    ...
+    print(reg.snapshot())
+"""
+import bisect
+import threading
+import time
+
+timer = time.perf_counter
+
+
+class commandstats(object):
+    """What happened during one command, all times are in seconds:
+
+    args - the command line sent to the server
+    name - the command name, args[0]
+    wall - from sending the command until its result was returned, including
+    decoding and parsing
+    server - from sending the command until its return code was read
+    ttfb - from sending the command until the first frame was read
+    parse - spent parsing the output into the returned value, None if the
+    command has nothing to parse or its output is streamed to the caller
+    bytes - a dict of the payload bytes read, by channel (b'o', b'e', ...)
+    frames - the number of frames read
+    ret - the return code, None if the command was abandoned before it
+    finished
+    """
+    __slots__ = ('args', 'start', 'wall', 'server', 'ttfb', 'parse',
+                 'bytes', 'frames', 'ret')
+
+    def __init__(self, args):
+        self.args = args
+        self.start = timer()
+        self.wall = self.server = self.ttfb = self.parse = None
+        self.bytes = {}
+        self.frames = 0
+        self.ret = None
+
+    @property
+    def name(self):
+        return self.args[0] if self.args else ''
+
+    def frame(self, channel, data):
+        """ count a frame read from the server """
+        if self.ttfb is None:
+            self.ttfb = timer() - self.start
+        self.frames += 1
+        if channel not in b'IL':
+            self.bytes[channel] = self.bytes.get(channel, 0) + len(data)
+
+    def wrap(self, outchannels):
+        """ return outchannels with every function counting the frames it is
+        passed """
+        def counted(channel, func):
+            def sink(data):
+                self.frame(channel, data)
+                return func(data)
+            return sink
+        return dict((channel, counted(channel, func))
+                    for channel, func in outchannels.items())
+
+    def done(self, ret):
+        """ record the return code """
+        self.ret = ret
+        self.server = timer() - self.start
+
+    def finish(self):
+        self.wall = timer() - self.start
+
+    def __repr__(self):
+        return ('<commandstats %s ret=%s wall=%.6f ttfb=%s frames=%d>'
+                % (self.name, self.ret, self.wall or 0, self.ttfb,
+                   self.frames))
+
+
+class histogram(object):
+    """A histogram of durations in exponential buckets: bucket i counts the
+    values in [bounds[i - 1], bounds[i]), the last one everything above."""
+    # 100us to about 100s, doubling
+    bounds = [0.0001 * 2 ** i for i in range(21)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_right(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def percentile(self, p):
+        """ an estimate of the p-th percentile (0 < p <= 100): the upper
+        bound of the bucket it falls in, clamped to the values seen """
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                if i < len(self.bounds):
+                    return max(self.min, min(self.bounds[i], self.max))
+                return self.max
+        return self.max
+
+
+class commandmetrics(object):
+    """ the totals registry keeps for one command name """
+    def __init__(self):
+        self.latency = histogram()
+        self.ttfb = histogram()
+        self.parse = histogram()
+        self.errors = 0
+        self.bytes = 0
+        self.frames = 0
+
+
+class registry(object):
+    """An observer for hgclient.addobserver that aggregates commandstats by
+    command name. It can be shared by several clients and threads."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commands = {}
+
+    def __call__(self, stats):
+        with self._lock:
+            m = self.commands.get(stats.name)
+            if m is None:
+                m = self.commands[stats.name] = commandmetrics()
+            m.latency.add(stats.wall)
+            if stats.ttfb is not None:
+                m.ttfb.add(stats.ttfb)
+            if stats.parse is not None:
+                m.parse.add(stats.parse)
+            if stats.ret != 0:
+                m.errors += 1
+            m.bytes += sum(stats.bytes.values())
+            m.frames += stats.frames
+
+    def reset(self):
+        with self._lock:
+            self.commands = {}
+
+    def snapshot(self):
+        """ return a plain text table of the metrics of every command, times
+        are in milliseconds """
+        def ms(v):
+            if v is None:
+                return '-'
+            return '%.2f' % (v * 1000)
+
+        header = ('command', 'count', 'errors', 'mean', 'p50', 'p90', 'p99',
+                  'max', 'ttfb', 'parse', 'bytes', 'frames')
+        rows = [header]
+        with self._lock:
+            for name in sorted(self.commands):
+                m = self.commands[name]
+                lat = m.latency
+                rows.append((name, str(lat.count), str(m.errors),
+                             ms(lat.mean), ms(lat.percentile(50)),
+                             ms(lat.percentile(90)), ms(lat.percentile(99)),
+                             ms(lat.max), ms(m.ttfb.mean), ms(m.parse.mean),
+                             str(m.bytes), str(m.frames)))
+
+        widths = [max(len(row[i]) for row in rows)
+                  for i in range(len(header))]
+        lines = []
+        for row in rows:
+            cells = [row[0].ljust(widths[0])]
+            cells += [c.rjust(w) for c, w in zip(row[1:], widths[1:])]
+            lines.append('  '.join(cells).rstrip())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,324 @@
+"""
+A thread-safe pool of command servers for one repository.
+
+An hgclient can only run one command at a time, so threads that share a
+repository either serialize on a single client or pay for starting a server
+per request. A clientpool starts size servers up front and lends them out:
+
+    pool = hglib.pool.clientpool(path, size=4)
+    with pool.checkout() as client:
+        client.log()
+
+Servers that die are noticed when a client is checked in or out and are
+replaced by a fresh one.
+
+Threads that want the same thing at the same time can ask the pool instead
+of a client, and concurrent identical read-only calls then share a single
+command (see clientpool.call):
+
+    pool.call('log', 'tip')
+"""
+import contextlib
+import inspect
+import queue
+import threading
+import time
+
+from . import client
+from . import error
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# the hgclient methods that don't change the repository and return their
+# whole result, which clientpool.call shares between identical calls
+readonly = frozenset([
+    'annotate', 'bookmarks', 'branches', 'cat', 'config', 'diff', 'heads',
+    'identify', 'log', 'manifest', 'parents', 'paths', 'status', 'summary',
+    'tags', 'tip',
+])
+
+
+def _hashable(value):
+    """ value with its lists and dicts made into tuples, raises TypeError
+    if that doesn't make it hashable """
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    hash(value)
+    return value
+
+
+class _flight(object):
+    """ a call in progress, whose result the identical ones wait for """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class clientpool(object):
+    def __init__(self, path=None, size=4, encoding=None, configs=None,
+                 raw_bytes=False, transport='pipe'):
+        """
+        Start size command servers for the repository at path (or the one
+        found in the cwd). encoding, configs, raw_bytes and transport are
+        passed to each hgclient, see hglib.open.
+        """
+        if size < 1:
+            raise ValueError('size must be at least 1')
+
+        self.path = path
+        self.size = size
+        self._encoding = encoding
+        self._configs = configs
+        self._rawbytes = raw_bytes
+        self._transport = transport
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        # clients currently checked out, mapped to when they were
+        self._busy = {}
+
+        self._created = time.monotonic()
+        self._checkouts = 0
+        self._spawned = 0
+        self._replaced = 0
+        self._waittotal = 0.0
+        self._waitmax = 0.0
+        self._busytime = 0.0
+        # the key of each call in progress, see call
+        self._flights = {}
+        self._calls = 0
+        self._shared = 0
+
+        try:
+            for i in range(size):
+                self._idle.put(self._spawn())
+            # call's fingerprints are taken with the first client, which
+            # only looks up where the repository is once
+            self._fingerprinter = self._idle.get()
+            self._fingerprinter.fingerprint()
+            self._idle.put(self._fingerprinter)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _spawn(self):
+        c = client.hgclient(self.path, self._encoding, self._configs,
+                            raw_bytes=self._rawbytes,
+                            transport=self._transport)
+        with self._lock:
+            self._spawned += 1
+        return c
+
+    @staticmethod
+    def _alive(c):
+        """ whether c can be given to the next caller """
+        return (c.server is not None and c.server.poll() is None
+                and not c._streaming)
+
+    @staticmethod
+    def _discard(c):
+        if c.server is not None:
+            try:
+                c.server.kill()
+                c.close()
+            except OSError:
+                # the pipe to a dead server can fail to flush
+                c.server.wait()
+                c.server = c._reader = None
+
+    def get(self, timeout=None):
+        """
+        Take an idle client out of the pool, waiting at most timeout seconds
+        (forever if None) for one to be checked in. Raises PoolTimeout if none
+        became available in time. The client must be given back with put().
+        """
+        if self._closed:
+            raise ValueError('pool is closed')
+
+        start = time.monotonic()
+        try:
+            c = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolTimeout('no client available after %s seconds'
+                              % timeout)
+        waited = time.monotonic() - start
+
+        # a dead server, or a slot left empty by a failed replacement
+        if c is None or not self._alive(c):
+            try:
+                if c is not None:
+                    self._discard(c)
+                c = self._spawn()
+            except BaseException:
+                self._idle.put(None)
+                raise
+            with self._lock:
+                self._replaced += 1
+
+        with self._lock:
+            self._checkouts += 1
+            self._waittotal += waited
+            self._waitmax = max(self._waitmax, waited)
+            self._busy[c] = time.monotonic()
+        return c
+
+    def put(self, c, broken=False):
+        """
+        Give back a client taken with get(). If broken is True or its server
+        died, it is closed and replaced the next time a client is needed.
+        """
+        with self._lock:
+            started = self._busy.pop(c)
+            self._busytime += time.monotonic() - started
+
+        if broken or not self._alive(c):
+            self._discard(c)
+            c = None
+
+        with self._lock:
+            if not self._closed:
+                self._idle.put(c)
+                return
+        if c is not None:
+            c.close()
+
+    @contextlib.contextmanager
+    def checkout(self, timeout=None):
+        """
+        Context manager lending a client for the duration of the block, see
+        get(). The client is replaced if the block raises ServerError.
+        """
+        c = self.get(timeout)
+        broken = False
+        try:
+            yield c
+        except error.ServerError:
+            broken = True
+            raise
+        finally:
+            self.put(c, broken)
+
+    def call(self, name, *args, **kwargs):
+        """
+        Check out a client, call its method name with args and kwargs and
+        return the result.
+
+        When the method is read-only (see readonly), a call made while an
+        identical one is already running, with the repository in the same
+        state (see hgclient.fingerprint), doesn't run anything. It waits
+        for the running one, and returns its result (or raises its
+        exception). Calls are identical when they give the method the same
+        arguments once its defaults are filled in. The result is the same
+        object for all of them, and must not be modified.
+        """
+        method = getattr(client.hgclient, name)
+        key = None
+        if name in readonly:
+            try:
+                bound = inspect.signature(method).bind(None, *args, **kwargs)
+                bound.apply_defaults()
+                key = (name, _hashable(list(bound.arguments.values())[1:]),
+                       self._fingerprinter.fingerprint())
+            except TypeError:
+                # arguments that can't be compared, or wrong ones that
+                # calling the method will complain about
+                pass
+
+        leader = None
+        with self._lock:
+            self._calls += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._shared += 1
+            elif key is not None:
+                leader = self._flights[key] = _flight()
+        if flight is not None:
+            return flight.wait()
+
+        try:
+            with self.checkout() as c:
+                result = method(c, *args, **kwargs)
+        except BaseException as e:
+            if leader is not None:
+                leader.error = e
+            raise
+        else:
+            if leader is not None:
+                leader.result = result
+            return result
+        finally:
+            if leader is not None:
+                with self._lock:
+                    del self._flights[key]
+                leader.done.set()
+
+    def stats(self):
+        """
+        Return a dict describing the pool:
+
+        size - number of clients
+        busy - clients currently checked out
+        checkouts - number of successful get() calls
+        spawned - servers started, including replacements
+        replaced - dead servers that were replaced
+        waittotal, waitmax - seconds spent waiting for a client in get()
+        waitavg - waittotal / checkouts
+        utilization - fraction of the pool's capacity in use since it was
+        created, in [0, 1]
+        calls - number of call() calls
+        shared - calls that waited for an identical one instead of running
+        """
+        with self._lock:
+            now = time.monotonic()
+            busytime = self._busytime + sum(now - t
+                                            for t in self._busy.values())
+            elapsed = now - self._created
+            return {
+                'size': self.size,
+                'busy': len(self._busy),
+                'checkouts': self._checkouts,
+                'spawned': self._spawned,
+                'replaced': self._replaced,
+                'waittotal': self._waittotal,
+                'waitmax': self._waitmax,
+                'waitavg': (self._waittotal / self._checkouts
+                            if self._checkouts else 0.0),
+                'utilization': (busytime / (elapsed * self.size)
+                                if elapsed else 0.0),
+                'calls': self._calls,
+                'shared': self._shared,
+            }
+
+    def close(self):
+        """
+        Close the idle clients. Clients still checked out are closed when
+        they are put back.
+        """
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                c = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if c is not None:
+                c.close()
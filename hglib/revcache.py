@@ -0,0 +1,273 @@
+"""
+A persistent cache of revision metadata, shared by every client of a
+repository.
+
+A new client knows nothing about the history and has to read all of it
+with log. A revcache keeps what log would say about each revision in files
+under .hg/cache/hglib, which any later client (in any process) maps into
+memory, only asking the server for the revisions added since:
+
+    cache = client.revcache()
+    len(cache), cache[rev], cache.node(rev), cache.desc(rev)
+
+The files are:
+
+records - one fixed width record per revision (see record), the revision
+number being its position
+heap - the descriptions, UTF-8 encoded and back to back
+names - the branch and author names, one per line, whose line number is
+the id records refer to them by
+
+All of them are only ever appended to, the records last, so a reader never
+sees a record whose strings are missing. Hidden revisions are included, so
+that revision numbers are positions.
+"""
+import binascii
+import mmap
+import os
+import struct
+
+from . import client
+from . import error
+from . import util
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# node, p1, p2, date, timezone offset, branch id, author id, description
+# offset and length in the heap
+record = struct.Struct('<20siidiIIQI')
+
+template = ('{rev}\\0{node}\\0{p1rev}\\0{p2rev}\\0{date|hgdate}\\0{branch}\\0'
+            '{author}\\0{desc}\\0')
+
+version = 1
+
+
+class revcache(object):
+    """The revision metadata cache in the directory path (by default
+    .hg/cache/hglib of the client's repository)."""
+    def __init__(self, client, path=None):
+        self._client = client
+        if path is None:
+            path = os.path.join(client.root(), '.hg', 'cache', 'hglib')
+        self.path = path
+        self._records = b''
+        self._heap = b''
+        self._names = []
+        self._nameids = {}
+        self._namessize = 0
+        self._revs = None
+
+    def _file(self, name):
+        return os.path.join(self.path, '%s-v%d' % (name, version))
+
+    def _map(self, name):
+        try:
+            with open(self._file(name), 'rb') as f:
+                if os.fstat(f.fileno()).st_size:
+                    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            pass
+        return b''
+
+    def _open(self):
+        """ map the files as they are on disk """
+        self.close()
+        self._records = self._map('records')
+        self._heap = self._map('heap')
+        self._revs = None
+        try:
+            with open(self._file('names'), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        if len(data) != self._namessize:
+            # a partial last line is being written by someone else
+            end = data.rfind(b'\n') + 1
+            self._names = data[:end].decode('utf-8',
+                                            'surrogatepass').split('\n')[:-1]
+            self._nameids = dict((n, i) for i, n in enumerate(self._names))
+            self._namessize = end
+
+    def __len__(self):
+        """ the number of revisions cached """
+        return len(self._records) // record.size
+
+    def update(self):
+        """
+        Bring the cache up to date with the repository: read the revisions
+        added since the last cached one, or all of them again if that one
+        has changed (after a strip or a rollback). Returns the number of
+        revisions read.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock():
+            self._open()
+            if not self._valid():
+                self._clear()
+            n = len(self)
+            if n:
+                revs = self._read('%d:' % (n - 1))
+                if not revs or revs[0][1] != self.node(n - 1):
+                    self._clear()
+                    revs = self._read('all()')
+                else:
+                    revs = revs[1:]
+            else:
+                revs = self._read('all()')
+            if revs:
+                self._append(revs)
+            self._open()
+            return len(revs)
+
+    def _valid(self):
+        """ whether the files agree with each other """
+        n = len(self)
+        if len(self._records) % record.size:
+            return False
+        if not n:
+            return True
+        last = self._record(n - 1)
+        return (last[7] + last[8] <= len(self._heap)
+                and max(last[5], last[6]) < len(self._names))
+
+    def _clear(self):
+        for name in ('records', 'heap', 'names'):
+            try:
+                os.unlink(self._file(name))
+            except FileNotFoundError:
+                pass
+        self._names, self._nameids, self._namessize = [], {}, 0
+        self._open()
+
+    def _read(self, revrange):
+        c = self._client
+        args = util.cmdbuilder('log', template=template, r=revrange,
+                               hidden=True)
+        try:
+            fields = list(c._rawcommanditer(args, delimiter='\0'))
+        except error.CommandError:
+            # the last cached revision is gone
+            return []
+        return list(util.grouper(8, fields))
+
+    def _append(self, revs):
+        expected = len(self)
+        heapsize = len(self._heap)
+        records, heap, names = [], [], []
+        for rev, node, p1, p2, date, branch, author, desc in revs:
+            if int(rev) != expected:
+                raise error.ResponseError('expected revision %d, got %s'
+                                          % (expected, rev))
+            expected += 1
+            epoch, offset = date.split(' ')
+            desc = desc.encode('utf-8', 'surrogatepass')
+            records.append(record.pack(
+                binascii.unhexlify(node), int(p1), int(p2), float(epoch),
+                int(offset), self._nameid(branch, names),
+                self._nameid(author, names), heapsize, len(desc)))
+            heap.append(desc)
+            heapsize += len(desc)
+
+        # strings first, so that no record refers to missing ones
+        with open(self._file('heap'), 'ab') as f:
+            f.write(b''.join(heap))
+        with open(self._file('names'), 'ab') as f:
+            f.write(''.join(n + '\n' for n in names).encode('utf-8',
+                                                            'surrogatepass'))
+        with open(self._file('records'), 'ab') as f:
+            f.write(b''.join(records))
+
+    def _nameid(self, name, added):
+        i = self._nameids.get(name)
+        if i is None:
+            i = self._nameids[name] = len(self._names)
+            self._names.append(name)
+            added.append(name)
+        return i
+
+    def _lock(self):
+        return _filelock(os.path.join(self.path, 'lock'))
+
+    def _record(self, rev):
+        if rev < 0:
+            rev += len(self)
+        if not 0 <= rev < len(self):
+            raise IndexError('revision %d not in the cache' % rev)
+        return record.unpack_from(self._records, rev * record.size)
+
+    def node(self, rev):
+        """ the hex node of rev """
+        return binascii.hexlify(self._record(rev)[0]).decode('ascii')
+
+    def parents(self, rev):
+        """ the parent revisions of rev, -1 for a missing one """
+        return list(self._record(rev)[1:3])
+
+    def date(self, rev):
+        """ the date of rev as (seconds since the epoch, timezone offset) """
+        return self._record(rev)[3:5]
+
+    def branch(self, rev):
+        return self._names[self._record(rev)[5]]
+
+    def author(self, rev):
+        return self._names[self._record(rev)[6]]
+
+    def desc(self, rev):
+        r = self._record(rev)
+        return self._heap[r[7]:r[7] + r[8]].decode('utf-8', 'surrogatepass')
+
+    def __getitem__(self, rev):
+        """ rev as a revision like log returns, without tags """
+        node, p1, p2, epoch, offset, branch, author, start, length = \
+            self._record(rev)
+        if rev < 0:
+            rev += len(self)
+        desc = self._heap[start:start + length].decode('utf-8',
+                                                       'surrogatepass')
+        return client.revision(str(rev),
+                               binascii.hexlify(node).decode('ascii'), '',
+                               self._names[branch], self._names[author],
+                               desc, (epoch, offset))
+
+    def __iter__(self):
+        for rev in range(len(self)):
+            yield self[rev]
+
+    def rev(self, node):
+        """ the revision of a full hex node, KeyError if it isn't cached """
+        if self._revs is None:
+            size = record.size
+            data = self._records
+            self._revs = dict((data[i * size:i * size + 20], i)
+                              for i in range(len(self)))
+        return self._revs[binascii.unhexlify(node)]
+
+    def close(self):
+        for m in (self._records, self._heap):
+            if isinstance(m, mmap.mmap):
+                m.close()
+        self._records = self._heap = b''
+
+
+class _filelock(object):
+    """ an exclusive lock on path, where fcntl is available """
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,167 @@
+"""
+Columnar storage for the output of log.
+
+A list of revision tuples costs several Python objects per changeset. A
+revisiontable keeps the same data in a handful of compact columns instead,
+and only builds a revision when a row is asked for:
+
+    t = client.log(columnar=True)
+    len(t), t[0], t.revs, t.dates
+    t.tonumpy()     # if NumPy is installed
+"""
+import array
+import binascii
+import datetime
+
+from . import client
+from . import util
+
+
+class revisiontable(object):
+    """The revisions of a log in columns:
+
+    revs - array of revision numbers
+    dates - array of seconds since the epoch, as floats
+    offsets - array of timezone offsets in seconds
+    nodes - the 20 byte binary nodes, back to back
+    branches, authors - lists of the distinct names, indexed by
+    branchids and authorids, arrays with one entry per revision
+    tags - a dict of row to tags for the revisions that have any
+
+    The descriptions are kept in a single string, see desc().
+
+    Indexing a table returns a revision like the ones log returns.
+    """
+    def __init__(self):
+        self.revs = array.array('l')
+        self.dates = array.array('d')
+        self.offsets = array.array('l')
+        self.nodes = bytearray()
+        self.branches = []
+        self.branchids = array.array('l')
+        self.authors = []
+        self.authorids = array.array('l')
+        self.tags = {}
+        self._branchpool = {}
+        self._authorpool = {}
+        self._descs = []
+        self._desc = None
+        self._descends = array.array('l')
+
+    @classmethod
+    def fromrecords(cls, records):
+        """ build a table from an iterable of the fields of
+        templates.changeset, 7 per revision """
+        t = cls()
+        fields = iter(records)
+        for rev in fields:
+            t.append(rev, next(fields), next(fields), next(fields),
+                     next(fields), next(fields), next(fields))
+        t._finish()
+        return t
+
+    def append(self, rev, node, tags, branch, author, desc, date):
+        """ add a revision given as the strings of the template fields """
+        row = len(self.revs)
+        self.revs.append(int(rev))
+        self.nodes += binascii.unhexlify(node)
+        if tags:
+            self.tags[row] = tags
+        self.branchids.append(self._intern(self._branchpool, self.branches,
+                                           branch))
+        self.authorids.append(self._intern(self._authorpool, self.authors,
+                                           author))
+        epoch, offset = util.parsedate(date)
+        self.dates.append(epoch)
+        self.offsets.append(offset)
+        # joined into a single string by _finish
+        self._descs.append(desc)
+        end = self._descends[-1] if self._descends else 0
+        self._descends.append(end + len(desc))
+
+    @staticmethod
+    def _intern(pool, values, value):
+        i = pool.get(value)
+        if i is None:
+            i = pool[value] = len(values)
+            values.append(value)
+        return i
+
+    def _finish(self):
+        if self._descs:
+            if self._desc:
+                self._descs.insert(0, self._desc)
+            self._desc = ''.join(self._descs)
+            self._descs = []
+
+    def __len__(self):
+        return len(self.revs)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('revisiontable index out of range')
+        return client.revision(str(self.revs[i]), self.node(i),
+                               self.tags.get(i, ''), self.branch(i),
+                               self.author(i), self.desc(i),
+                               (self.dates[i], self.offsets[i]))
+
+    def node(self, i):
+        """ the hex node of row i """
+        return binascii.hexlify(self.nodes[i * 20:i * 20 + 20]).decode(
+            'ascii')
+
+    def branch(self, i):
+        return self.branches[self.branchids[i]]
+
+    def author(self, i):
+        return self.authors[self.authorids[i]]
+
+    def desc(self, i):
+        self._finish()
+        start = self._descends[i - 1] if i else 0
+        return self._desc[start:self._descends[i]]
+
+    def date(self, i):
+        """ the date of row i as a local datetime, like log """
+        return datetime.datetime.fromtimestamp(self.dates[i])
+
+    def index(self, node):
+        """ the row of the revision with the given hex or binary node """
+        if len(node) == 40:
+            node = binascii.unhexlify(node)
+        pos = self.nodes.find(node)
+        while pos != -1:
+            if pos % 20 == 0:
+                return pos // 20
+            pos = self.nodes.find(node, pos + 1)
+        raise ValueError('%r not in table' % node)
+
+    def tonumpy(self):
+        """
+        Return a dict of NumPy arrays, one per column: rev, node (as 20 byte
+        strings), date, offset, branch and author (as indexes into
+        self.branches and self.authors). Raises ImportError if NumPy isn't
+        installed.
+        """
+        import numpy
+
+        def column(a):
+            kind = 'f' if a.typecode == 'd' else 'i'
+            # copied, so that the arrays can keep growing
+            return numpy.frombuffer(a, dtype='%s%d' % (kind,
+                                                       a.itemsize)).copy()
+
+        return {
+            'rev': column(self.revs),
+            'node': numpy.frombuffer(bytes(self.nodes), dtype='S20'),
+            'date': column(self.dates),
+            'offset': column(self.offsets),
+            'branch': column(self.branchids),
+            'author': column(self.authorids),
+        }
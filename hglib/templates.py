@@ -1,2 +1,107 @@
+import collections
+import datetime
+
 changeset = ('{rev}\\0{node}\\0{tags}\\0{branch}\\0{author}\\0{desc}\\0{date}'
              '\\0')
+
+
+def _list(value):
+    return value.split('\n') if value else []
+
+
+def _pairs(value):
+    items = value.split('\n')
+    return dict(zip(items[0::2], items[1::2]))
+
+
+def _date(value):
+    return datetime.datetime.fromtimestamp(float(value.split(' ', 1)[0]))
+
+
+def _epoch(value):
+    return float(value.split(' ', 1)[0])
+
+
+def _offset(value):
+    return int(value.split(' ', 1)[1])
+
+
+# the fields a projection can ask for: their template, which must not output
+# NUL, and how to convert what it outputs
+keywords = {
+    'rev': ('{rev}', int),
+    'node': ('{node}', str),
+    'p1rev': ('{p1rev}', int),
+    'p2rev': ('{p2rev}', int),
+    'p1node': ('{p1node}', str),
+    'p2node': ('{p2node}', str),
+    'tags': ("{join(tags, '\\n')}", _list),
+    'bookmarks': ("{join(bookmarks, '\\n')}", _list),
+    'branch': ('{branch}', str),
+    'author': ('{author}', str),
+    'desc': ('{desc}', str),
+    'phase': ('{phase}', str),
+    'manifest': ("{manifest % '{node}'}", str),
+    'date': ('{date|hgdate}', _date),
+    'epoch': ('{date|hgdate}', _epoch),
+    'offset': ('{date|hgdate}', _offset),
+    # file names can't contain newlines
+    'files': ("{join(files, '\\n')}", _list),
+    'file_adds': ("{join(file_adds, '\\n')}", _list),
+    'file_dels': ("{join(file_dels, '\\n')}", _list),
+    'file_mods': ("{join(file_mods, '\\n')}", _list),
+    'file_copies': ("{join(file_copies % '{name}\\n{source}', '\\n')}",
+                    _pairs),
+}
+
+
+class projection(object):
+    """A template asking only for some fields of each changeset, and the
+    parser for its output.
+
+    fields is a sequence of names from keywords. The parsed changesets are
+    namedtuples (self.record) with those fields, in that order. rev is an
+    int, the tags, bookmarks and file lists are lists, file_copies is a dict
+    of destination to source, date is a local datetime, epoch and offset are
+    the seconds since the epoch and the timezone offset.
+    """
+    def __init__(self, fields):
+        fields = tuple(fields)
+        if not fields:
+            raise ValueError('no fields given')
+        for f in fields:
+            if f not in keywords:
+                raise ValueError('unknown field %r, expected one of %s'
+                                 % (f, ', '.join(sorted(keywords))))
+        if len(set(fields)) != len(fields):
+            raise ValueError('duplicate fields in %r' % (fields,))
+
+        self.fields = fields
+        self.template = ''.join(keywords[f][0] + '\\0' for f in fields)
+        self.record = collections.namedtuple('record', fields)
+        self._converters = [keywords[f][1] for f in fields]
+
+    def parse(self, records):
+        """ yield a record for every len(self.fields) items of records, the
+        NUL separated output of self.template """
+        n = len(self.fields)
+        converters = self._converters
+        make = self.record._make
+        values = []
+        for value in records:
+            values.append(value)
+            if len(values) == n:
+                yield make([c(v) for c, v in zip(converters, values)])
+                values = []
+
+
+_projections = {}
+
+
+def project(fields):
+    """ return the projection for fields, compiling it on first use """
+    fields = tuple(fields)
+    p = _projections.get(fields)
+    if p is None:
+        p = _projections[fields] = projection(fields)
+    return p
@@ -0,0 +1,177 @@
+"""
+Ways for an hgclient to reach a command server.
+
+A transport is a callable taking the arguments and environment of
+'hg serve --cmdserver pipe' and returning a connection with the parts of
+subprocess.Popen that hgclient uses: stdin and stdout file objects, poll(),
+kill(), wait() and returncode.
+
+pipe - start a new command server for the client, talking to it over pipes
+unix - connect to a command server listening on a unix socket. The server
+       is started by hglib on first use and shared by every client opened
+       with the same arguments; it forks a process per connection, so
+       connecting costs a fork instead of starting a Python interpreter.
+"""
+import atexit
+import os
+import select
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+
+from . import error
+from . import util
+
+
+def pipe(args, env):
+    return util.popen(args, env)
+
+
+class unixconnection(object):
+    """ a connection to a forked command server, see unix() """
+    def __init__(self, sock):
+        self._sock = sock
+        self.stdin = sock.makefile('wb')
+        self.stdout = sock.makefile('rb')
+        self.returncode = None
+
+    def poll(self):
+        """ returns None while the server is connected, or a return code
+        once it hung up """
+        if self.returncode is None:
+            # a server that is waiting for a command sends nothing, so
+            # readable means the connection was closed
+            r, w, x = select.select([self._sock], [], [], 0)
+            if r and not self._sock.recv(1, socket.MSG_PEEK):
+                self._close(0)
+        return self.returncode
+
+    def kill(self):
+        self._close(-signal.SIGKILL)
+
+    def wait(self):
+        self._close(0)
+        return self.returncode
+
+    def _close(self, returncode):
+        if self.returncode is not None:
+            return
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        for f in (self.stdin, self.stdout):
+            try:
+                f.close()
+            except OSError:
+                pass
+        self._sock.close()
+        self.returncode = returncode
+
+
+class unixserver(object):
+    """ a 'hg serve --cmdserver unix' process listening on a socket in a
+    private temporary directory """
+    def __init__(self, args, env):
+        args = list(args)
+        i = args.index('--cmdserver')
+        args[i + 1:i + 2] = ['unix']
+        self._args = args
+        self._tmpdir = self.address = None
+        self._env = env
+        # a restarted server must find the same repository
+        self._cwd = os.getcwd()
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        environ = dict(os.environ)
+        environ.update(self._env)
+        self._tmpdir = tempfile.mkdtemp(prefix='hglib-')
+        self.address = os.path.join(self._tmpdir, 'server')
+        args = self._args + ['-a', self.address]
+        # stderr goes to a file rather than a pipe nobody reads while the
+        # server runs, which would block it once full
+        with open(os.path.join(self._tmpdir, 'log'), 'wb+') as log:
+            self._proc = subprocess.Popen(args, cwd=self._cwd,
+                                          stdin=subprocess.DEVNULL,
+                                          stdout=subprocess.PIPE, stderr=log,
+                                          close_fds=util.close_fds,
+                                          startupinfo=util.startupinfo,
+                                          env=environ)
+            # the server says where it listens once it is ready
+            line = self._proc.stdout.readline()
+            if not line.startswith(b'listening at'):
+                self._proc.kill()
+                self._proc.wait()
+                self._proc = None
+                log.seek(0)
+                msg = (log.read() or line).decode('latin-1').strip()
+                shutil.rmtree(self._tmpdir, ignore_errors=True)
+                raise error.ServerError('cannot start command server: %s'
+                                        % msg)
+
+    def connect(self):
+        """ connect to the server, (re)starting it if it isn't running """
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is not None:
+                self._proc.stdout.close()
+                shutil.rmtree(self._tmpdir, ignore_errors=True)
+                self._proc = None
+            if self._proc is None:
+                self._start()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.address)
+            except OSError:
+                sock.close()
+                raise
+        return unixconnection(sock)
+
+    def close(self, timeout=5):
+        """ stop the server. The processes it forked for clients that are
+        already connected keep serving them until they disconnect. """
+        with self._lock:
+            if self._proc is not None:
+                self._proc.terminate()
+                try:
+                    self._proc.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    self._proc.kill()
+                    self._proc.wait()
+                self._proc.stdout.close()
+                self._proc = None
+                shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+_unixservers = {}
+_unixlock = threading.Lock()
+
+
+def unix(args, env):
+    # the repository can be given relative to the cwd, or found from it
+    key = (os.getcwd(), tuple(args), tuple(sorted(env.items())))
+    with _unixlock:
+        server = _unixservers.get(key)
+        if server is None:
+            server = _unixservers[key] = unixserver(args, env)
+    return server.connect()
+
+
+@atexit.register
+def closeservers():
+    """ stop every server started by the unix transport """
+    with _unixlock:
+        servers = list(_unixservers.values())
+        _unixservers.clear()
+    for server in servers:
+        server.close()
+
+
+transports = {
+    'pipe': pipe,
+    'unix': unix,
+}
@@ -1,4 +1,7 @@
+import json
 import os
+import re
+import struct
 import subprocess
 from . import error
 import io
@@ -52,6 +55,24 @@ def skiplines(s, prefix):
     return ''
 
 
+def parsedate(date):
+    """
+    Split the {date} template keyword, e.g. '1000000.0-3600', into the
+    seconds since the epoch and the timezone offset in seconds (west of UTC,
+    as Mercurial stores it).
+
+    >>> parsedate('1000000.07200')
+    (1000000.0, 7200)
+    >>> parsedate('1000000.0-3600')
+    (1000000.0, -3600)
+    """
+    # a float timestamp followed by the offset, with no separator between
+    # them. Mercurial timestamps are whole seconds so the float always ends
+    # with '.0'.
+    epoch, rest = date.split('.', 1)
+    return float(epoch), int(rest[1:] or 0)
+
+
 def cmdbuilder(name, *args, **kwargs):
     """
     A helper for building the command arguments
@@ -171,6 +192,252 @@ class propertycache(object):
         return result
 
 
+class framereader(object):
+    """
+    Reads the frames the command server writes to stream: a 1-byte channel
+    and a big-endian unsigned integer that is either the length of the data
+    following it or, for the I and L channels, just an integer.
+
+    Data is read straight from the underlying raw stream (which, unlike a
+    buffered one, returns as soon as anything is available) into a single
+    reusable buffer, and readframe() returns payloads as memoryview slices of
+    it. A payload is therefore only valid until the next call to readframe(),
+    and nothing else may read from stream once the reader is in use.
+
+    >>> r = framereader(io.BytesIO(b'o\\0\\0\\0\\2hiL\\0\\0\\0\\5'), 4)
+    >>> channel, data = r.readframe()
+    >>> channel, bytes(data)
+    (b'o', b'hi')
+    >>> r.readframe()
+    (b'L', 5)
+    """
+    header = struct.Struct('>cI')
+
+    def __init__(self, stream, bufsize=65536):
+        self._stream = stream
+        # BufferedReader.readinto() waits for the whole buffer to be filled,
+        # and even readinto1() can block after it has already copied some
+        # buffered data, which deadlocks on a pipe to an idle server
+        self._readinto = getattr(stream, 'raw', stream).readinto
+        self._buf = memoryview(bytearray(max(bufsize, self.header.size)))
+        self._pos = self._end = 0
+
+    def _fill(self, size):
+        """ buffer at least size bytes (which must fit the buffer), return
+        False on EOF """
+        if self._pos + size > len(self._buf):
+            # move what's left to the front to make room
+            avail = self._end - self._pos
+            self._buf[:avail] = self._buf[self._pos:self._end]
+            self._pos, self._end = 0, avail
+
+        while self._end - self._pos < size:
+            n = self._readinto(self._buf[self._end:])
+            if not n:
+                return False
+            self._end += n
+        return True
+
+    def _readframe(self):
+        """ read a single frame, refilling the buffer as needed """
+        hsize = self.header.size
+        if self._pos + hsize > self._end and not self._fill(hsize):
+            raise error.ServerError("No data")
+        channel, length = self.header.unpack_from(self._buf, self._pos)
+        self._pos += hsize
+        if channel in b'IL':
+            return channel, length
+
+        if length > len(self._buf):
+            # too big for the buffer, read it into a buffer of its own
+            data = memoryview(bytearray(length))
+            avail = self._end - self._pos
+            data[:avail] = self._buf[self._pos:self._end]
+            self._pos = self._end = 0
+            while avail < length:
+                n = self._readinto(data[avail:])
+                if not n:
+                    raise error.ServerError("No data")
+                avail += n
+            return channel, data
+
+        if self._pos + length > self._end and not self._fill(length):
+            raise error.ServerError("No data")
+        data = self._buf[self._pos:self._pos + length]
+        self._pos += length
+        return channel, data
+
+    def readframe(self, sinks={}):
+        """
+        Return a (channel, data) tuple for the next frame, where data is a
+        memoryview, or an int for the I and L channels.
+
+        sinks maps channels to functions. The payloads of frames on those
+        channels are passed to the function instead, and reading goes on
+        until a frame on another channel arrives. This saves going through
+        readframe for every frame of a command's output.
+
+        :raise error.ServerError: If the stream ended.
+        """
+        unpack, hsize = self.header.unpack_from, self.header.size
+        while True:
+            buf, pos, bufend = self._buf, self._pos, self._end
+            # go through the frames that are already completely buffered
+            while pos + hsize <= bufend:
+                channel, length = unpack(buf, pos)
+                if channel in b'IL':
+                    self._pos = pos + hsize
+                    return channel, length
+                start = pos + hsize
+                end = start + length
+                if end > bufend:
+                    break
+                pos = end
+                sink = sinks.get(channel)
+                if sink is None:
+                    self._pos = pos
+                    return channel, buf[start:end]
+                sink(buf[start:end])
+            self._pos = pos
+
+            channel, data = self._readframe()
+            if channel in b'IL' or channel not in sinks:
+                return channel, data
+            sinks[channel](data)
+
+
+class recordsplitter(object):
+    """
+    Splits data that is fed to it piece by piece into the records separated
+    by delimiter. The pieces of a record are only joined once it is complete,
+    however many pieces it spans. Without a delimiter, every non-empty piece
+    is a record of its own.
+
+    >>> s = recordsplitter('\\n')
+    >>> list(s.feed('a\\nb')), list(s.feed('c\\n\\nd'))
+    (['a'], ['bc', ''])
+    >>> s.flush()
+    'd'
+    """
+    def __init__(self, delimiter):
+        self.delimiter = delimiter
+        # the pieces of the record that hasn't been completed yet
+        self._pending = []
+
+    def feed(self, data):
+        """ yield the records completed by data """
+        delimiter, pending = self.delimiter, self._pending
+        if delimiter is None:
+            if data:
+                yield data
+            return
+
+        if pending and len(delimiter) > 1:
+            # the delimiter could straddle the previous piece, so search the
+            # end of that along with this one
+            last = pending.pop()
+            cut = max(len(last) - len(delimiter) + 1, 0)
+            if cut:
+                pending.append(last[:cut])
+            data = last[cut:] + data
+
+        pos = 0
+        end = data.find(delimiter)
+        while end != -1:
+            pending.append(data[pos:end])
+            record = data[:0].join(pending)
+            del pending[:]
+            yield record
+            pos = end + len(delimiter)
+            end = data.find(delimiter, pos)
+        if pos < len(data):
+            pending.append(data[pos:])
+
+    def flush(self):
+        """ return what was fed after the last delimiter (or None) """
+        if self._pending:
+            rest = self._pending[0][:0].join(self._pending)
+            del self._pending[:]
+            return rest
+
+
+class jsonsplitter(object):
+    """
+    Splits a JSON array that is fed to it piece by piece, like the output of
+    a command run with -Tjson, into its elements. Each element is decoded as
+    soon as it is complete, so the ones at the start of a long array can be
+    used before the rest of it has arrived.
+
+    >>> s = jsonsplitter()
+    >>> list(s.feed('[\\n {"a": 1},\\n {"b"')), list(s.feed(': [2]}\\n]\\n'))
+    ([{'a': 1}], [{'b': [2]}])
+    >>> list(s.flush())
+    []
+    """
+    _whitespace = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        # what comes next: '[', an element or ']', ',' or ']', nothing
+        self._state = 0
+        # an incomplete element is only decoded again once the buffer has
+        # doubled, so that a large one isn't rescanned for every piece
+        self._retry = 0
+
+    def feed(self, data):
+        """ yield the elements completed by data """
+        buf = self._buffer + data
+        self._buffer = ''
+        if len(buf) < self._retry:
+            self._buffer = buf
+            return
+        self._retry = 0
+
+        skip = self._whitespace.match
+        pos = skip(buf).end()
+        while pos < len(buf):
+            c = buf[pos]
+            if self._state == 0:
+                if c != '[':
+                    raise ValueError('expected a JSON array, got %r'
+                                     % buf[pos:pos + 20])
+                self._state = 1
+                pos += 1
+            elif self._state in (1, 2) and c == ']':
+                self._state = 3
+                pos += 1
+            elif self._state == 1:
+                try:
+                    obj, end = self._decoder.raw_decode(buf, pos)
+                except ValueError:
+                    # not complete yet (or invalid, which close() reports)
+                    self._buffer = buf[pos:]
+                    self._retry = 2 * len(self._buffer)
+                    return
+                self._state = 2
+                pos = end
+                yield obj
+            elif self._state == 2 and c == ',':
+                self._state = 1
+                pos += 1
+            else:
+                raise ValueError('unexpected %r in JSON array' % c)
+            pos = skip(buf, pos).end()
+
+    def flush(self):
+        """ yield the elements still held back and check that the array was
+        complete, an empty input is taken as an empty array """
+        self._retry = 0
+        buf, self._buffer = self._buffer, ''
+        # raises the decoder's error if an element is invalid
+        yield from self.feed(buf)
+        if self._buffer:
+            self._decoder.decode(self._buffer)
+        if self._state not in (0, 3):
+            raise ValueError('truncated JSON array')
+
+
 close_fds = os.name == 'posix'
 
 
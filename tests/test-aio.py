@@ -0,0 +1,90 @@
+import asyncio
+
+from . import common
+import hglib
+from hglib import aio
+
+class test_aio(common.basetest):
+    def run_async(self, coro):
+        return asyncio.run(coro)
+
+    def test_log(self):
+        self.append('a', 'a')
+        rev0, node0 = self.client.commit('first', addremove=True)
+        self.append('a', 'a')
+        rev1, node1 = self.client.commit('second')
+
+        async def run():
+            async with await aio.open() as client:
+                revs = await client.log()
+                self.assertEquals(revs, self.client.log())
+                tip = await client.tip()
+                self.assertEquals(tip.node, node1)
+                revs = [r async for r in client.iterlog(revrange='0')]
+                self.assertEquals([r.node for r in revs], [node0])
+                self.assertEquals(await client.heads(), self.client.heads())
+                self.assertEquals(await client.parents(),
+                                  self.client.parents())
+        self.run_async(run())
+
+    def test_commands(self):
+        self.append('a', 'a\nb\n')
+        self.client.commit('first', addremove=True)
+        self.append('b', 'b')
+
+        async def run():
+            async with await aio.open() as client:
+                self.assertEquals(await client.status(),
+                                  self.client.status())
+                self.assertEquals(await client.cat(['a']), 'a\nb\n')
+                self.assertEquals([m async for m in client.manifest()],
+                                  list(self.client.manifest()))
+                self.assertEquals([l async for l in client.annotate('a')],
+                                  list(self.client.annotate('a')))
+                self.assertEquals(await client.root(), self.client.root())
+                self.assertEquals(await client.version(),
+                                  self.client.version)
+        self.run_async(run())
+
+    def test_error(self):
+        async def run():
+            async with await aio.open() as client:
+                with self.assertRaises(hglib.error.CommandError):
+                    await client.cat(['nonexistent'])
+                # the client is still usable
+                self.assertEquals(await client.log(), [])
+        self.run_async(run())
+
+    def test_close_early(self):
+        self.append('a', 'a\n' * 100)
+        self.client.commit('first', addremove=True)
+
+        async def run():
+            async with await aio.open() as client:
+                lines = client.manifest(all=True)
+                async for line in lines:
+                    break
+                await lines.aclose()
+                self.assertEquals(len(await client.log()), 1)
+        self.run_async(run())
+
+    def test_concurrent(self):
+        for i in range(5):
+            self.append('a', 'a')
+            self.client.commit('commit %d' % i, addremove=True)
+
+        async def run():
+            clients = [await aio.open() for i in range(3)]
+            try:
+                # several commands per client, all in flight together
+                results = await asyncio.gather(*[c.log(revrange=str(i))
+                                                 for c in clients
+                                                 for i in range(5)])
+            finally:
+                for c in clients:
+                    await c.close()
+            return results
+
+        results = self.run_async(run())
+        self.assertEquals([int(r[0].rev) for r in results],
+                          list(range(5)) * 3)
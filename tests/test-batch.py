@@ -0,0 +1,56 @@
+from . import common
+import hglib
+
+class test_batch(common.basetest):
+    def test_basic(self):
+        self.append('a', 'a\n')
+        self.append('b', 'b\n')
+        rev, node = self.client.commit('first', addremove=True)
+        self.append('c', 'c')
+
+        with self.client.batch() as b:
+            a = b.cat(['a'])
+            st = b.status()
+            log = b.log()
+            tip = b.tip()
+            m = b.manifest()
+            ident = b.identify(id=True)
+            bms = b.bookmarks()
+            self.assertFalse(a.done())
+
+        self.assertEquals(a.result(), 'a\n')
+        self.assertEquals(st.result(), self.client.status())
+        self.assertEquals(log.result(), self.client.log())
+        self.assertEquals(tip.result().node, node)
+        self.assertEquals(m.result(), list(self.client.manifest()))
+        self.assertEquals(ident.result(), self.client.identify(id=True))
+        self.assertEquals(bms.result(), self.client.bookmarks())
+
+    def test_error(self):
+        self.append('a', 'a\n')
+        self.client.commit('first', addremove=True)
+
+        b = self.client.batch()
+        bad = b.cat(['nonexistent'])
+        good = b.cat(['a'])
+        self.assertRaises(hglib.error.CommandError, b.run)
+        self.assertRaises(hglib.error.CommandError, bad.result)
+        self.assertEquals(good.result(), 'a\n')
+        # the server is still in sync
+        self.assertEquals(self.client.cat(['a']), 'a\n')
+
+    def test_many(self):
+        # more requests and output than fits in the pipes at once
+        for i in range(20):
+            self.append('f%d' % i, ('%d\n' % i) * 5000)
+        self.client.commit('first', addremove=True)
+
+        b = self.client.batch()
+        for j in range(50):
+            for i in range(20):
+                b.cat(['f%d' % i], rev='0')
+        self.assertEquals(len(b), 1000)
+        results = b.run()
+        self.assertEquals(results[:20],
+                          [('%d\n' % i) * 5000 for i in range(20)])
+        self.assertEquals(results, results[:20] * 50)
@@ -0,0 +1,37 @@
+import contextlib
+import io
+import json
+import os
+
+from . import common
+from hglib import bench
+
+class test_bench(common.basetest):
+    def test_compare(self):
+        base = {'log': {'median': 1.0}, 'cat': {'median': 2.0}}
+        now = {'log': {'median': 1.05}, 'cat': {'median': 2.5},
+               'new': {'median': 1.0}}
+        rows = sorted(bench.compare(now, base, 0.1))
+        self.assertEquals([(r[0], r[4]) for r in rows],
+                          [('cat', True), ('log', False)])
+
+    def test_main(self):
+        out = io.StringIO()
+        results = os.path.join(self._testtmp, 'results.json')
+        with contextlib.redirect_stdout(out):
+            ret = bench.main(['--files', '20', '--revs', '3', '--repeat', '1',
+                              '--only', 'log', '--only', 'status',
+                              '--save', results])
+        self.assertEquals(ret, 0)
+        with open(results) as f:
+            saved = json.load(f)
+        self.assertEquals(sorted(saved['results']), ['log', 'status'])
+        self.assertEquals(saved['results']['log']['items'], 3)
+
+        # comparing against itself with an impossible threshold fails
+        with contextlib.redirect_stdout(out):
+            ret = bench.main(['--files', '20', '--revs', '3', '--repeat', '1',
+                              '--only', 'log', '--baseline', results,
+                              '--threshold', '-1'])
+        self.assertEquals(ret, 1)
+        self.assertTrue('REGRESSION' in out.getvalue())
@@ -0,0 +1,80 @@
+from . import common
+import hglib
+from hglib.commandcache import commandcache
+
+class test_commandcache(common.basetest):
+    def setUp(self):
+        common.basetest.setUp(self)
+        self.append('a', 'a')
+        self.rev, self.node = self.client.commit('first', addremove=True,
+                                                 user='u')
+        self.append('a', 'b')
+        self.rev1, self.node1 = self.client.commit('second', user='u')
+        self.client.commandcache = commandcache()
+        self.commands = []
+        self.client.addobserver(
+            lambda stats: self.commands.append(stats.name))
+
+    def test_refs(self):
+        tags = self.client.tags()
+        self.assertEquals(self.client.tags(), tags)
+        self.assertEquals(self.client.branches(), self.client.branches())
+        self.assertEquals(self.commands.count('tags'), 1)
+        self.assertEquals(self.commands.count('branches'), 1)
+        self.assertEquals(self.client.commandcache.hits, 2)
+
+        self.client.tag('v1', user='u')
+        self.assertEquals(self.client.tags()[1][0], 'v1')
+        self.assertEquals(self.commands.count('tags'), 2)
+
+        self.assertEquals(self.client.bookmarks(), ([], -1))
+        self.client.bookmark('bm')
+        self.assertEquals(self.client.bookmarks()[0][0][0], 'bm')
+
+    def test_nodes(self):
+        cat = self.client.cat(['a'], rev=self.node)
+        self.assertEquals(cat, 'a')
+        diff = self.client.diff(revs=[self.node, self.node1])
+
+        # new revisions don't matter for node addressed results
+        self.append('a', 'c')
+        self.client.commit('third', user='u')
+        self.commands[:] = []
+        self.assertEquals(self.client.cat(['a'], rev=self.node), cat)
+        self.assertEquals(self.client.diff(revs=[self.node, self.node1]),
+                          diff)
+        self.assertEquals(self.commands, [])
+
+        # but revisions given any other way do
+        self.assertEquals(self.client.cat(['a'], rev='tip'), 'abc')
+        self.assertEquals(self.client.cat(['a'], rev='tip'), 'abc')
+        self.assertEquals(self.commands, ['cat', 'cat'])
+
+    def test_config(self):
+        self.assertEquals(self.client.paths(), {})
+        self.client.paths()
+        self.assertEquals(self.commands, ['paths'])
+
+        # a new server reads the configuration again
+        self.client.close()
+        self.client.open()
+        self.client.paths()
+        self.assertEquals(self.commands, ['paths', 'paths'])
+
+    def test_eviction(self):
+        cache = commandcache(maxbytes=60)
+        self.client.commandcache = cache
+        self.client.cat(['a'], rev=self.node)
+        self.client.cat(['a'], rev=self.node1)
+        self.assertEquals((len(cache), cache.evictions), (1, 1))
+        self.assertTrue(cache.nbytes <= 60)
+        self.client.cat(['a'], rev=self.node)
+        self.assertEquals((cache.hits, cache.misses, cache.evictions),
+                          (0, 3, 2))
+
+        # failed commands aren't cached
+        self.assertRaises(hglib.error.CommandError, self.client.cat,
+                          ['missing'], rev=self.node)
+        self.assertRaises(hglib.error.CommandError, self.client.cat,
+                          ['missing'], rev=self.node)
+        self.assertEquals(self.commands.count('cat'), 5)
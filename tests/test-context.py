@@ -1,3 +1,5 @@
+import os
+
 from hglib.error import CommandError
 from . import common
 from hglib import client
@@ -87,3 +89,106 @@ class test_context(common.basetest):
         self.assertNotIn(hash_2, self.client)
 
 
+
+    def test_manifest_cache(self):
+        os.mkdir('d')
+        self.append('a', 'a')
+        self.append('d/b', 'b')
+        self.append('d/c', 'c')
+        self.append('e', 'e')
+        rev0, node0 = self.client.commit('first', addremove=True)
+        self.append('a', 'a')
+        rev1, node1 = self.client.commit('second')
+
+        cache = self.client.manifestcache
+        ctx0, ctx1 = self.client[node0], self.client[node1]
+        self.assertEquals(list(ctx1), ['a', 'd/b', 'd/c', 'e'])
+        self.assertEquals(list(ctx1.walk('d/')), ['d/b', 'd/c'])
+        self.assertEquals(list(ctx1.walk('f')), [])
+        self.assertNotEqual(ctx0.manifest()['a'], ctx1.manifest()['a'])
+        self.assertEquals(ctx0.manifest()['e'], ctx1.manifest()['e'])
+        # the same paths share their index
+        self.assertTrue(ctx0.manifest()._paths is ctx1.manifest()._paths)
+        self.assertEquals((cache.hits, cache.misses), (0, 2))
+
+        # another context of the same changeset uses the cached manifest
+        self.assertEquals(list(client.changectx(self.client, node0)),
+                          list(ctx0))
+        self.assertEquals((cache.hits, cache.misses), (1, 2))
+        # as does one built from a revision
+        ctx = client.changectx(self.client, self.client.tip())
+        self.assertEquals(ctx.manifest(), ctx1.manifest())
+        self.assertEquals(len(cache), 2)
+
+        cache.maxentries = 4
+        cache.clear()
+        list(client.changectx(self.client, node0))
+        list(client.changectx(self.client, node1))
+        self.assertEquals(len(cache), 1)
+
+        self.assertEquals(list(self.client[-1]), [])
+
+    def test_file_lists(self):
+        self.append('a', 'a')
+        self.append('b', 'b')
+        rev0, node0 = self.client.commit('first', addremove=True)
+        self.append('a', 'a')
+        self.client.copy('b', 'c')
+        self.client.remove(['b'])
+        rev1, node1 = self.client.commit('second')
+
+        commands = []
+        self.client.addobserver(lambda stats: commands.append(stats.name))
+
+        ctx = self.client[node1]
+        self.assertEquals(ctx.modified(), ['a'])
+        self.assertEquals(ctx.added(), ['c'])
+        self.assertEquals(ctx.removed(), ['b'])
+        self.assertEquals(ctx.files(), ['a', 'b', 'c'])
+        self.assertEquals(commands, ['log'])
+        self.assertEquals(ctx.copies(), {'c': 'b'})
+
+        del commands[:]
+        ctxs = list(self.client.itercontexts())
+        self.assertEquals([c.rev() for c in ctxs], [1, 0])
+        self.assertEquals([c.files() for c in ctxs], [['a', 'b', 'c'],
+                                                      ['a', 'b']])
+        self.assertEquals(commands, ['log'])
+        self.assertEquals(ctxs[1].copies(), {})
+
+        # the same as status finds
+        ctx = client.changectx(self.client, self.client.tip())
+        self.assertEquals(ctx.files(), ['a', 'b', 'c'])
+        self.assertEquals(ctx.copies(), {'c': 'b'})
+
+    def test_identity(self):
+        for i in range(5):
+            self.append('a', 'a')
+            self.client.commit('commit %d' % i, addremove=True)
+
+        commands = []
+        self.client.addobserver(lambda stats: commands.append(stats.name))
+
+        tip = self.client['tip']
+        self.assertTrue(self.client[4] is tip)
+        self.assertTrue(self.client[tip.node()] is tip)
+
+        # parents come with the context, and contexts in use are reused
+        ctx3 = self.client[3]
+        del commands[:]
+        self.assertTrue(tip.p1() is ctx3)
+        self.assertEquals(tip.parents(), [ctx3])
+        self.assertEquals(int(tip.p2()), -1)
+        self.assertEquals(commands, [])
+        self.assertTrue(list(tip.ancestors())[3] is ctx3)
+
+        # walking first parents reads them in batches
+        self.client.prefetchsize = 2
+        del commands[:]
+        revs = []
+        ctx = ctx3
+        while ctx:
+            revs.append(ctx.rev())
+            ctx = ctx.p1()
+        self.assertEquals(revs, [3, 2, 1, 0])
+        self.assertEquals(commands, ['log', 'log'])
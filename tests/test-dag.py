@@ -0,0 +1,97 @@
+from . import common
+
+class test_dag(common.basetest):
+    def revs(self, revset):
+        return [int(r.rev) for r in self.client.log(revset)]
+
+    def test_queries(self):
+        self.client.rawcommand(['debugbuilddag',
+                                '+2:f +2:a *f +2:b /a +1 <f +1'])
+        dag = self.client.dag()
+        self.assertEquals(len(dag), 10)
+        self.assertEquals(list(dag), list(range(10)))
+        self.assertEquals(dag.parents(7), [6, 3])
+        self.assertEquals(dag.parents(0), [])
+        self.assertEquals(dag.children(1), [2, 4, 9])
+        self.assertEquals(dag.heads(), [8, 9])
+        self.assertEquals(dag.rev(dag.node(5)), 5)
+        self.assertEquals(dag.node(5), self.client.log('5')[0].node)
+
+        for r in range(10):
+            self.assertEquals(dag.ancestors([r]),
+                              self.revs('sort(ancestors(%d))' % r))
+            self.assertEquals(dag.descendants([r]),
+                              self.revs('sort(descendants(%d))' % r))
+            for s in range(10):
+                self.assertEquals(dag.isancestor(r, s),
+                                  bool(self.revs('%d and ::%d' % (r, s))))
+                self.assertEquals(dag.ancestor(r, s),
+                                  self.revs('ancestor(%d, %d)' % (r, s))[0])
+        self.assertEquals(dag.ancestors([3, 5]), [0, 1, 2, 3, 4, 5])
+        self.assertEquals(dag.commonancestorsheads(8, 9), [1])
+
+    def test_crisscross(self):
+        self.client.rawcommand(['debugbuilddag', '+1:r +1:a <r +1:b /a <a /b'])
+        dag = self.client.dag()
+        self.assertEquals(dag.commonancestorsheads(3, 4), [1, 2])
+        self.assertEquals(dag.ancestor(3, 4),
+                          self.revs('ancestor(3, 4)')[0])
+
+    def test_refresh(self):
+        dag = self.client.dag()
+        self.assertEquals(len(dag), 0)
+        self.assertEquals(dag.heads(), [])
+
+        self.client.rawcommand(['debugbuilddag', '+3'])
+        self.assertTrue(self.client.dag() is dag)
+        self.assertEquals(dag.heads(), [2])
+
+        commands = []
+        self.client.addobserver(lambda stats: commands.append(stats.args))
+        self.client.update('2')
+        for i in range(2):
+            self.append('a', 'a')
+            self.client.commit('commit %d' % i, addremove=True, user='u')
+        self.client.dag()
+        self.assertEquals(len(dag), 5)
+        self.assertEquals(dag.children(2), [3])
+        # only the revisions from the last known one were read
+        self.assertTrue('2:' in commands[-1])
+
+        # the known revisions were replaced
+        self.client.rawcommand(['--config', 'extensions.strip=',
+                                'strip', '--no-backup', '1'])
+        self.client.update('0')
+        self.append('b', 'b')
+        self.client.commit('new', addremove=True, user='u')
+        self.client.dag()
+        self.assertEquals(len(dag), 2)
+        self.assertEquals(dag.parents(1), [0])
+        self.assertEquals(dag.node(1), self.client.tip().node)
+
+    def test_isancestor(self):
+        self.client.rawcommand(['debugbuilddag',
+                                '+2:f +2:a *f +2:b /a +1 <f +1'])
+        dag = self.client.dag()
+        self.assertEquals(list(dag.generation), [1, 2, 3, 4, 3, 4, 5, 6, 7, 3])
+
+        node = self.client.log('3')[0].node
+        self.assertTrue(self.client.isancestor(node, 7))
+        self.assertTrue(self.client.isancestor('f', 'tip'))
+        self.assertFalse(self.client.isancestor(9, 8))
+        self.assertTrue(self.client.isancestor(-1, 0))
+        self.assertRaises(ValueError, self.client.isancestor, 0, 10)
+
+        # asking about the same revision again caches its ancestors
+        for i in range(2):
+            self.assertTrue(dag.isancestor(2, 8))
+            self.assertFalse(dag.isancestor(9, 8))
+        self.assertEquals(list(dag._reach), [8])
+
+        # new revisions are picked up when they are asked about
+        self.client.update('9')
+        self.append('a', 'a')
+        self.client.commit('new', addremove=True, user='u')
+        self.assertTrue(self.client.isancestor(9, 10))
+        self.assertFalse(self.client.isancestor(8, 10))
+        self.assertTrue(self.client.dag(refresh=False) is dag)
@@ -5,3 +5,30 @@ class test_encoding(common.basetest):
     def test_basic(self):
         self.client = hglib.open(encoding='utf-8')
         self.assertEquals(self.client.encoding, 'utf-8')
+
+    def test_raw_bytes(self):
+        self.append('a', b'caf\xc3\xa9\n')
+        self.client.commit('first', addremove=True)
+
+        client = hglib.open(raw_bytes=True)
+        self.assertEquals(client.cat(['a']), b'caf\xc3\xa9\n')
+        self.assertEquals(client.rawcommand(['cat', 'a']), b'caf\xc3\xa9\n')
+        self.assertEquals(list(client.annotate('a')), [(b'0', b'caf\xc3\xa9')])
+        self.assertEquals(list(client.rawcommanditer(['cat', 'a'],
+                                                     delimiter=b'\n')),
+                          [b'caf\xc3\xa9'])
+        # the other commands still parse text
+        self.assertEquals(client.log()[0].desc, 'first')
+
+    def test_split_character(self):
+        self.append('a', b'caf\xc3\xa9\n' * 10000)
+        self.client.commit('first', addremove=True)
+
+        client = hglib.open(encoding='utf-8')
+        self.assertEquals(''.join(client.rawcommanditer(['cat', 'a'])),
+                          'caf\xe9\n' * 10000)
+        # undecodable output falls back to latin-1 for that command only
+        self.append('b', b'\xff\n')
+        client.commit('second', addremove=True)
+        self.assertEquals(client.cat(['b']), '\xff\n')
+        self.assertEquals(client.cat(['a']), 'caf\xe9\n' * 10000)
@@ -0,0 +1,77 @@
+import datetime
+
+from . import common
+import hglib
+from hglib import templates
+
+class test_fields(common.basetest):
+    def test_log(self):
+        self.append('a', 'a')
+        self.append('b', 'b')
+        rev0, node0 = self.client.commit('first', addremove=True,
+                                         date='1000000 -3600')
+        self.client.copy('a', 'c')
+        self.client.remove(['b'])
+        self.append('a', 'a')
+        rev1, node1 = self.client.commit('second')
+
+        second, first = self.client.log(fields=('rev', 'node', 'p1rev',
+                                                'p1node', 'files'))
+        self.assertEquals(second.rev, 1)
+        self.assertEquals(second.node, node1)
+        self.assertEquals(second.p1rev, 0)
+        self.assertEquals(second.p1node, node0)
+        self.assertEquals(second.files, ['a', 'b', 'c'])
+        self.assertEquals(first.p1rev, -1)
+        self.assertEquals(second._fields,
+                          ('rev', 'node', 'p1rev', 'p1node', 'files'))
+
+        rec, = self.client.log('1', fields=['file_adds', 'file_dels',
+                                            'file_mods', 'file_copies',
+                                            'tags', 'desc'])
+        self.assertEquals(rec, (['c'], ['b'], ['a'], {'c': 'a'}, ['tip'],
+                                'second'))
+
+        rec, = self.client.log('0', fields=['date', 'epoch', 'offset'])
+        self.assertEquals(rec.date, datetime.datetime.fromtimestamp(1000000))
+        self.assertEquals((rec.epoch, rec.offset), (1000000.0, -3600))
+
+        self.assertEquals(list(self.client.iterlog(fields=['rev'])),
+                          [(1,), (0,)])
+
+    def test_others(self):
+        self.append('a', 'a')
+        rev0, node0 = self.client.commit('first', addremove=True)
+
+        fields = ('rev', 'node')
+        self.assertEquals(self.client.tip(fields=fields), (0, node0))
+        self.assertEquals(self.client.heads(fields=fields), [(0, node0)])
+        self.assertEquals(self.client.parents(fields=fields), [(0, node0)])
+
+        self.client.clone(dest='other')
+        other = hglib.open('other')
+        self.assertEquals(other.incoming(fields=fields), [])
+        self.assertEquals(self.client.outgoing(path='other', fields=fields),
+                          [])
+
+        self.append('a', 'a')
+        rev1, node1 = self.client.commit('second')
+        self.assertEquals(other.incoming(fields=['node']), [(node1,)])
+        self.assertEquals(self.client.outgoing(path='other',
+                                               fields=['node']),
+                          [(node1,)])
+        other.close()
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.client.log, fields=['nonexistent'])
+        self.assertRaises(ValueError, self.client.log, fields=[])
+        self.assertRaises(ValueError, self.client.log, fields=['rev', 'rev'])
+        self.assertRaises(ValueError, self.client.log, fields=['rev'],
+                          columnar=True)
+
+    def test_project(self):
+        p = templates.project(['rev', 'node'])
+        self.assertTrue(p is templates.project(('rev', 'node')))
+        self.assertEquals(p.template, '{rev}\\0{node}\\0')
+        self.assertEquals(list(p.parse(['1', 'abc', '0', 'def'])),
+                          [(1, 'abc'), (0, 'def')])
@@ -0,0 +1,53 @@
+from . import common
+
+class test_fingerprint(common.basetest):
+    def commit(self, message):
+        self.append('a', message)
+        return self.client.commit(message, addremove=True, user='u')
+
+    def changed(self, before):
+        after = self.client.fingerprint()
+        return [f for f in after._fields
+                if getattr(after, f) != getattr(before, f)]
+
+    def test_components(self):
+        self.commit('first')
+        fp = self.client.fingerprint()
+        self.assertEquals(self.changed(fp), [])
+
+        self.commit('second')
+        self.assertTrue('changelog' in self.changed(fp))
+
+        fp = self.client.fingerprint()
+        self.client.phase('0', public=True)
+        self.assertEquals(self.changed(fp), ['phases'])
+
+        fp = self.client.fingerprint()
+        self.client.bookmark('bm', rev=0, inactive=True)
+        self.assertEquals(self.changed(fp), ['refs'])
+
+        fp = self.client.fingerprint()
+        self.client.update('0')
+        self.assertEquals(self.changed(fp), ['workingcopy'])
+
+    def test_no_commands(self):
+        self.commit('first')
+        self.client.fingerprint()
+        commands = []
+        self.client.addobserver(lambda stats: commands.append(stats.name))
+        self.client.fingerprint()
+        self.assertEquals(commands, [])
+
+        # an unchanged history isn't read again
+        self.client.dag()
+        self.client.revcache()
+        del commands[:]
+        self.client.dag()
+        self.client.revcache()
+        self.assertEquals(commands, [])
+
+        self.commit('second')
+        del commands[:]
+        self.assertEquals(len(self.client.dag()), 2)
+        self.assertEquals(len(self.client.revcache()), 2)
+        self.assertEquals(commands, ['log', 'log'])
@@ -0,0 +1,52 @@
+import os
+import struct
+import threading
+import unittest
+
+from hglib import util
+
+def frame(channel, data):
+    return struct.pack('>cI', channel, len(data)) + data
+
+class test_framereader(unittest.TestCase):
+    def setUp(self):
+        r, self.w = os.pipe()
+        self.stream = os.fdopen(r, 'rb')
+
+    def tearDown(self):
+        self.stream.close()
+        if self.w is not None:
+            os.close(self.w)
+
+    def test_pipe(self):
+        # the writer stays open, like an idle server waiting for a command
+        os.write(self.w, frame(b'o', b'hi'))
+        reader = util.framereader(self.stream)
+        channel, data = reader.readframe()
+        self.assertEquals((channel, bytes(data)), (b'o', b'hi'))
+
+        os.write(self.w, struct.pack('>cI', b'L', 4096))
+        self.assertEquals(reader.readframe(), (b'L', 4096))
+
+    def test_sinks(self):
+        out = []
+        frames = [frame(b'o', b'x' * n) for n in range(0, 300, 7)]
+        frames.append(frame(b'o', b'big' * 1000))
+        data = b''.join(frames) + frame(b'r', b'\0\0\0\0')
+
+        def write():
+            # in uneven pieces, so frames straddle reads
+            for i in range(0, len(data), 97):
+                os.write(self.w, data[i:i + 97])
+            os.close(self.w)
+            self.w = None
+        writer = threading.Thread(target=write)
+        writer.start()
+
+        reader = util.framereader(self.stream, 256)
+        channel, data = reader.readframe({b'o': lambda d: out.append(bytes(d))})
+        writer.join()
+
+        self.assertEquals((channel, bytes(data)), (b'r', b'\0\0\0\0'))
+        self.assertEquals(out, [f[5:] for f in frames])
+        self.assertRaises(util.error.ServerError, reader.readframe)
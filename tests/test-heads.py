@@ -3,11 +3,13 @@ from . import common
 class test_heads(common.basetest):
     def test_empty(self):
         self.assertEquals(self.client.heads(), [])
+        self.assertEquals(list(self.client.iterheads()), [])
 
     def test_basic(self):
         self.append('a', 'a')
         rev, node0 = self.client.commit('first', addremove=True)
         self.assertEquals(self.client.heads(), [self.client.tip()])
+        self.assertEquals(list(self.client.iterheads()), [self.client.tip()])
 
         self.client.branch('foo')
         self.append('a', 'a')
@@ -0,0 +1,83 @@
+from . import common
+import hglib
+from hglib import error, util
+
+class test_json(common.basetest):
+    def test_splitter(self):
+        s = util.jsonsplitter()
+        text = '[\n {"a": "x\\u00e9"},\n {"b": [1, {"c": null}]}\n]\n'
+        objs = []
+        for c in text:
+            objs.extend(s.feed(c))
+        objs.extend(s.flush())
+        self.assertEquals(objs, [{'a': 'x\xe9'}, {'b': [1, {'c': None}]}])
+
+        s = util.jsonsplitter()
+        self.assertEquals(list(s.feed('[]')), [])
+        self.assertEquals(list(s.flush()), [])
+        self.assertEquals(list(util.jsonsplitter().flush()), [])
+
+        s = util.jsonsplitter()
+        self.assertEquals(list(s.feed('[{"a": 1}, {"b"')), [{'a': 1}])
+        self.assertRaises(ValueError, list, s.flush())
+        self.assertRaises(ValueError, list, util.jsonsplitter().feed('{}'))
+
+    def test_log(self):
+        self.append('a', 'a')
+        rev0, node0 = self.client.commit('first\n\nwith "quotes"',
+                                         addremove=True, date='1000000 -3600')
+        self.append('a', 'a')
+        rev1, node1 = self.client.commit('second', user='foo')
+
+        second, first = self.client.log(json=True)
+        self.assertEquals(first['rev'], 0)
+        self.assertEquals(first['node'], node0)
+        self.assertEquals(first['date'], [1000000, -3600])
+        self.assertEquals(second['user'], 'foo')
+        self.assertEquals(first['desc'], 'first\n\nwith "quotes"')
+        self.assertEquals(second['parents'], [node0])
+        self.assertEquals(second['tags'], ['tip'])
+
+        it = self.client.iterlog(json=True)
+        self.assertEquals(next(it)['rev'], 1)
+        it.close()
+        self.assertEquals(self.client.log('0', json=True), [first])
+
+        self.assertRaises(ValueError, self.client.log, json=True,
+                          fields=('rev',))
+
+    def test_commands(self):
+        self.append('a', 'a\n')
+        self.append('b', 'b\n')
+        rev, node = self.client.commit('first', addremove=True)
+        self.client.copy('a', 'c')
+        self.client.bookmark('bm')
+        self.client.tag('t', local=True)
+
+        self.assertEquals(self.client.status(json=True, copies=True),
+                          [{'itemtype': 'file', 'path': 'c', 'source': 'a',
+                            'status': 'A'}])
+        self.assertEquals([m['path'] for m in self.client.manifest(json=True)],
+                          ['a', 'b'])
+
+        f, = self.client.annotate(['a'], json=True, number=True)
+        self.assertEquals(f['path'], 'a')
+        self.assertEquals(f['lines'], [{'line': 'a\n', 'rev': 0}])
+
+        bm, = self.client.bookmarks(json=True)
+        self.assertEquals((bm['bookmark'], bm['rev'], bm['node']),
+                          ('bm', 0, node))
+        br, = self.client.branches(json=True)
+        self.assertEquals((br['branch'], br['node']), ('default', node))
+        tags = dict((t['tag'], t['type']) for t in self.client.tags(json=True))
+        self.assertEquals(tags, {'tip': '', 't': 'local'})
+
+    def test_error(self):
+        self.assertRaises(error.CommandError, list,
+                          self.client.annotate(['missing'], json=True))
+        # the server is still usable
+        self.assertEquals(self.client.log(json=True), [])
+
+    def test_old_server(self):
+        self.client._version = (3, 9, 0, '')
+        self.assertRaises(error.CapabilityError, self.client.tags, json=True)
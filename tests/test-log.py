@@ -1,3 +1,5 @@
+import datetime
+
 from . import common
 import hglib
 
@@ -19,6 +21,43 @@ class test_log(common.basetest):
 
         self.assertEquals(self.client.log(), self.client.log(hidden=True))
 
+    def test_iterlog(self):
+        self.append('a', 'a')
+        self.client.commit('first', addremove=True)
+        self.append('a', 'a')
+        self.client.commit('second\nwith a longer description')
+
+        it = self.client.iterlog()
+        self.assertEquals(next(it).desc, 'second\nwith a longer description')
+        self.assertEquals(list(it), self.client.log('0'))
+        self.assertEquals(list(self.client.iterlog(limit=1)),
+                          [self.client.tip()])
+
+    def test_dates(self):
+        self.append('a', 'a')
+        self.client.commit('first', addremove=True, date='1000000 -3600')
+        self.append('a', 'a')
+        self.client.commit('second', date='2000000 0')
+
+        second, first = self.client.log()
+        self.assertEquals(first.epoch, 1000000.0)
+        self.assertEquals(first.offset, -3600)
+        self.assertEquals(first.date,
+                          datetime.datetime.fromtimestamp(1000000))
+        self.assertEquals(first.tzdate.utcoffset(),
+                          datetime.timedelta(hours=1))
+        self.assertEquals(first.tzdate.hour, 14)
+        self.assertEquals(first[6], first.date)
+
+        rev, node, tags, branch, author, desc, date = second
+        self.assertEquals(date, second.date)
+
+        epochs = hglib.client.epochs(self.client.log())
+        self.assertEquals(epochs.typecode, 'd')
+        self.assertEquals(list(epochs), [2000000.0, 1000000.0])
+        t = self.client.log(columnar=True)
+        self.assertEquals(hglib.client.epochs(t), epochs)
+
     # def test_errors(self):
     #     self.assertRaisesRegexp(CommandError, 'abort: unknown revision', self.client.log, 'foo')
     #     self.append('a', 'a')
@@ -0,0 +1,92 @@
+import os
+import threading
+
+from . import common
+import hglib
+from hglib import manager, pool
+
+class test_manager(common.basetest):
+    def repos(self, n):
+        paths = []
+        for i in range(n):
+            path = 'r%d' % i
+            hglib.init(path)
+            paths.append(os.path.abspath(path))
+        return paths
+
+    def test_eviction(self):
+        a, b, c = self.repos(3)
+        with manager.repomanager(maxservers=2) as m:
+            with m.checkout(a) as ca:
+                self.assertEquals(ca.root(), a)
+            with m.checkout(b) as cb:
+                self.assertEquals(cb.root(), b)
+            with m.checkout(a) as client:
+                self.assertTrue(client is ca)
+
+            # b is the least recently used
+            with m.checkout(c):
+                pass
+            self.assertEquals(cb.server, None)
+            self.assertTrue(ca.server is not None)
+
+            stats = m.stats()
+            self.assertEquals(stats['servers'], 2)
+            self.assertEquals((stats['checkouts'], stats['hits']), (4, 1))
+            self.assertEquals((stats['spawned'], stats['evicted']), (3, 1))
+            self.assertEquals(stats['hitrate'], 0.25)
+            self.assertTrue(stats['rss'] > 0)
+
+    def test_busy(self):
+        a, b = self.repos(2)
+        with manager.repomanager(maxservers=1) as m:
+            with m.checkout(a):
+                # neither the busy server nor another one can be had
+                self.assertRaises(pool.PoolTimeout, m.get, a, 0.01)
+                self.assertRaises(pool.PoolTimeout, m.get, b, 0.01)
+
+                results = []
+                def work():
+                    with m.checkout(b) as client:
+                        results.append(client.root())
+                t = threading.Thread(target=work)
+                t.start()
+            t.join()
+            self.assertEquals(results, [b])
+            self.assertEquals(m.stats()['evicted'], 1)
+
+    def test_maxrss(self):
+        a, b = self.repos(2)
+        with manager.repomanager(maxservers=2, maxrss=1) as m:
+            with m.checkout(a) as ca:
+                with m.checkout(b):
+                    pass
+                # b is stopped as soon as it is idle, a is still busy
+                self.assertEquals(m.stats()['servers'], 1)
+            self.assertEquals(ca.server, None)
+            self.assertEquals(m.stats()['evicted'], 2)
+
+    def test_prewarm(self):
+        a, b, c = self.repos(3)
+        with manager.repomanager(maxservers=2) as m:
+            for path in (a, b, b, c, c, c):
+                with m.checkout(path):
+                    pass
+            m.close()
+        with manager.repomanager(maxservers=2) as m2:
+            m2._heat = m._heat
+            self.assertEquals(m2.prewarm(), [c, b])
+            self.assertEquals(m2.stats()['servers'], 2)
+            with m2.checkout(c):
+                pass
+            self.assertEquals(m2.stats()['hits'], 1)
+
+    def test_dead_server(self):
+        a, = self.repos(1)
+        with manager.repomanager() as m:
+            with m.checkout(a) as client:
+                client.server.kill()
+                client.server.wait()
+            with m.checkout(a) as client:
+                self.assertEquals(client.log(), [])
+            self.assertEquals(m.stats()['spawned'], 2)
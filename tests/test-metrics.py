@@ -0,0 +1,74 @@
+from . import common
+import hglib
+from hglib import metrics
+
+class test_metrics(common.basetest):
+    def test_observer(self):
+        self.append('a', 'a\n' * 100)
+        self.client.commit('first', addremove=True)
+
+        seen = []
+        self.client.addobserver(seen.append)
+        self.client.status()
+        self.client.cat(['a'])
+        list(self.client.iterlog())
+        self.assertRaises(hglib.error.CommandError, self.client.cat, ['b'])
+
+        self.assertEquals([s.name for s in seen],
+                          ['status', 'cat', 'log', 'cat'])
+        status, cat, log, bad = seen
+        self.assertEquals(status.ret, 0)
+        self.assertTrue(status.parse is not None)
+        self.assertEquals(cat.parse, None)
+        self.assertEquals(cat.bytes[b'o'], 200)
+        self.assertEquals(bad.ret, 1)
+        self.assertTrue(bad.bytes[b'e'] > 0)
+        for s in seen:
+            self.assertTrue(s.frames >= 1)
+            self.assertTrue(0 <= s.ttfb <= s.server <= s.wall)
+
+        self.client.removeobserver(seen.append)
+        self.client.status()
+        self.assertEquals(len(seen), 4)
+
+    def test_close_early(self):
+        self.append('a', 'a\n' * 100)
+        self.client.commit('first', addremove=True)
+
+        seen = []
+        self.client.addobserver(seen.append)
+        it = self.client.rawcommanditer(['cat', 'a'], delimiter='\n')
+        next(it)
+        it.close()
+        self.assertEquals(len(seen), 1)
+        self.assertEquals(seen[0].ret, 0)
+        self.assertEquals(seen[0].bytes[b'o'], 200)
+
+    def test_registry(self):
+        reg = metrics.registry()
+        self.client.addobserver(reg)
+        for i in range(3):
+            self.client.status()
+        self.assertRaises(hglib.error.CommandError, self.client.cat, ['b'])
+        with self.client.batch() as b:
+            b.tags()
+
+        self.assertEquals(reg.commands['status'].latency.count, 3)
+        self.assertEquals(reg.commands['cat'].errors, 1)
+        self.assertEquals(reg.commands['tags'].latency.count, 1)
+
+        lines = reg.snapshot().splitlines()
+        self.assertEquals(lines[0].split()[:3], ['command', 'count', 'errors'])
+        self.assertEquals([l.split()[:3] for l in lines[1:]],
+                          [['cat', '1', '1'], ['status', '3', '0'],
+                           ['tags', '1', '0']])
+
+    def test_histogram(self):
+        h = metrics.histogram()
+        self.assertEquals(h.percentile(50), None)
+        for v in [0.001] * 90 + [1.0] * 10:
+            h.add(v)
+        self.assertEquals(h.count, 100)
+        self.assertTrue(0.001 <= h.percentile(50) < 0.002)
+        self.assertTrue(1.0 <= h.percentile(99) < 2.0)
+        self.assertEquals(h.max, 1.0)
@@ -32,6 +32,8 @@ class test_outgoing_incoming(common.basetest):
         self.assertEquals(out[0].node, node)
 
         self.assertEquals(out, other.incoming())
+        self.assertEquals(out, list(other.iterincoming()))
+        self.assertEquals(out, list(self.client.iteroutgoing(path='other')))
 
     def test_bookmarks(self):
         self.append('a', 'a')
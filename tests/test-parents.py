@@ -3,11 +3,13 @@ from . import common
 class test_parents(common.basetest):
     def test_noparents(self):
         self.assertEquals(self.client.parents(), None)
+        self.assertEquals(list(self.client.iterparents()), [])
 
     def test_basic(self):
         self.append('a', 'a')
         rev, node = self.client.commit('first', addremove=True)
         self.assertEquals(node, self.client.parents()[0].node)
+        self.assertEquals([node], [p.node for p in self.client.iterparents()])
         self.assertEquals(node, self.client.parents(file='a')[0].node)
 
     def test_two_parents(self):
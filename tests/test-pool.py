@@ -0,0 +1,94 @@
+import threading
+import time
+
+from . import common
+import hglib
+from hglib import pool
+
+class test_pool(common.basetest):
+    def test_checkout(self):
+        self.append('a', 'a')
+        self.client.commit('first', addremove=True)
+
+        with pool.clientpool(size=2) as p:
+            with p.checkout() as c1:
+                with p.checkout() as c2:
+                    self.assertNotEqual(c1, c2)
+                    self.assertEquals(c1.log(), c2.log())
+                    self.assertEquals(p.stats()['busy'], 2)
+                    self.assertRaises(pool.PoolTimeout, p.get, 0.01)
+            stats = p.stats()
+            self.assertEquals(stats['busy'], 0)
+            self.assertEquals(stats['checkouts'], 2)
+            self.assertEquals(stats['spawned'], 2)
+            self.assertTrue(0 < stats['utilization'] <= 1)
+
+    def test_threads(self):
+        self.append('a', 'a')
+        self.client.commit('first', addremove=True)
+
+        results = []
+        with pool.clientpool(size=2) as p:
+            def work():
+                for i in range(5):
+                    with p.checkout() as c:
+                        results.append(len(c.log()))
+            threads = [threading.Thread(target=work) for i in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEquals(p.stats()['spawned'], 2)
+        self.assertEquals(results, [1] * 20)
+
+    def test_dead_server(self):
+        with pool.clientpool(size=1) as p:
+            with p.checkout() as c:
+                c.server.kill()
+                c.server.wait()
+                self.assertRaises((hglib.error.ServerError, OSError), c.log)
+            # replaced on checkout
+            with p.checkout() as c:
+                self.assertEquals(c.log(), [])
+            stats = p.stats()
+            self.assertEquals(stats['replaced'], 1)
+            self.assertEquals(stats['spawned'], 2)
+
+    def test_call(self):
+        self.append('a', 'a')
+        self.client.commit('first', addremove=True)
+
+        with pool.clientpool(size=1) as p:
+            commands = []
+            results = []
+            # while the only client is busy, identical calls pile up behind
+            # the first one
+            with p.checkout() as c:
+                c.addobserver(lambda stats: commands.append(stats.name))
+                def work():
+                    results.append(p.call('log', 'tip'))
+                threads = [threading.Thread(target=work) for i in range(5)]
+                for t in threads:
+                    t.start()
+                while p.stats()['shared'] < 4:
+                    time.sleep(0.01)
+            for t in threads:
+                t.join()
+
+            self.assertEquals(commands, ['log'])
+            self.assertEquals(len(results), 5)
+            self.assertTrue(all(r is results[0] for r in results))
+            self.assertEquals(results[0], self.client.log('tip'))
+
+            # the same arguments given differently are the same call
+            self.assertEquals(p.call('log', revrange='tip'), results[0])
+            stats = p.stats()
+            self.assertEquals((stats['calls'], stats['shared']), (6, 4))
+
+            # calls that change the repository are never shared, and later
+            # calls see the change
+            self.append('a', 'a')
+            p.call('commit', 'second', user='u')
+            self.assertEquals(len(p.call('log')), 2)
+            self.assertRaises(hglib.error.CommandError, p.call, 'cat',
+                              ['missing'])
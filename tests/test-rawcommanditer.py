@@ -0,0 +1,53 @@
+from . import common
+import hglib
+
+class test_rawcommanditer(common.basetest):
+    def test_basic(self):
+        self.append('a', 'a\n' * 1000)
+        self.client.commit('first', addremove=True)
+
+        chunks = list(self.client.rawcommanditer(['cat', 'a']))
+        self.assertEquals(''.join(chunks), self.client.rawcommand(['cat', 'a']))
+
+    def test_delimiter(self):
+        self.append('a', 'a\nb\n\nc')
+        self.client.commit('first', addremove=True)
+
+        lines = list(self.client.rawcommanditer(['cat', 'a'], delimiter='\n'))
+        self.assertEquals(lines, ['a', 'b', '', 'c'])
+
+        lines = list(self.client.rawcommanditer(['cat', 'a'], delimiter='\n\n'))
+        self.assertEquals(lines, ['a\nb', 'c'])
+
+    def test_error(self):
+        it = self.client.rawcommanditer(['cat', 'nonexistent'])
+        self.assertRaises(hglib.error.CommandError, list, it)
+
+        def eh(ret, out, err):
+            self.assertEquals(ret, 1)
+            self.assertEquals(out, '')
+        self.assertEquals(list(self.client.rawcommanditer(['cat', 'x'],
+                                                          eh=eh)), [])
+
+    def test_close_early(self):
+        self.append('a', 'a\n' * 10000)
+        self.client.commit('first', addremove=True)
+
+        it = self.client.rawcommanditer(['cat', 'a'], delimiter='\n')
+        self.assertEquals(next(it), 'a')
+        it.close()
+
+        self.assertEquals(self.client.root(), self._testtmp)
+
+    def test_busy(self):
+        self.append('a', 'a')
+        self.client.commit('first', addremove=True)
+        self.append('a', 'a')
+        self.client.commit('second')
+
+        it = self.client.iterlog()
+        next(it)
+        self.assertRaises(ValueError, self.client.tip)
+        it.close()
+
+        self.assertEquals(self.client.tip().desc, 'second')
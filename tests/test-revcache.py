@@ -0,0 +1,72 @@
+import os
+
+from . import common
+import hglib
+
+class test_revcache(common.basetest):
+    def commit(self, n, user='u'):
+        for i in range(n):
+            self.append('a', 'a')
+            self.client.commit('commit\n\nnumber %d' % i, addremove=True,
+                               user=user, date='%d 3600' % (1000000 + i))
+
+    def test_cache(self):
+        self.commit(3)
+        self.client.branch('other')
+        self.commit(1, user='v')
+
+        cache = self.client.revcache()
+        self.assertEquals(len(cache), 4)
+        log = self.client.log('0:')
+        self.assertEquals(len(list(cache)), 4)
+        for rev, r in enumerate(log):
+            c = cache[rev]
+            self.assertEquals((c.rev, c.node, c.branch, c.author, c.desc),
+                              (r.rev, r.node, r.branch, r.author, r.desc))
+            self.assertEquals(c.offset, 3600)
+        self.assertEquals(cache.parents(3), [2, -1])
+        self.assertEquals(cache.date(1), (1000001.0, 3600))
+        self.assertEquals(cache.branch(3), 'other')
+        self.assertEquals(cache.author(3), 'v')
+        self.assertEquals(cache.desc(0), 'commit\n\nnumber 0')
+        self.assertEquals(cache.rev(log[2].node), 2)
+        self.assertEquals(cache[-1].node, log[3].node)
+        self.assertRaises(IndexError, cache.__getitem__, 4)
+
+    def test_shared(self):
+        self.commit(3)
+        self.client.revcache()
+        self.commit(2)
+
+        # another client only reads what was added since
+        other = hglib.open()
+        commands = []
+        other.addobserver(lambda stats: commands.append(stats.args))
+        cache = other.revcache()
+        self.assertEquals(len(cache), 5)
+        self.assertEquals([a[a.index('-r') + 1] for a in commands
+                           if a[0] == 'log'], ['2:'])
+        self.assertEquals(cache.node(4), self.client.tip().node)
+
+        # nothing new
+        self.assertEquals(cache.update(), 0)
+
+    def test_rebuild(self):
+        self.commit(3)
+        cache = self.client.revcache()
+        node = cache.node(2)
+
+        self.client.rawcommand(['--config', 'extensions.strip=', 'strip',
+                                '--no-backup', '2'])
+        self.commit(2, user='w')
+        self.assertEquals(cache.update(), 4)
+        self.assertEquals(len(cache), 4)
+        self.assertNotEqual(cache.node(2), node)
+        self.assertEquals(cache.author(3), 'w')
+
+        # a record cut short is thrown away with the rest
+        with open(os.path.join(cache.path, 'records-v1'), 'ab') as f:
+            f.write(b'x')
+        cache.update()
+        self.assertEquals(len(cache), 4)
+        self.assertEquals(cache.node(3), self.client.tip().node)
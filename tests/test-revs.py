@@ -0,0 +1,56 @@
+from . import common
+from hglib.bitset import bitset
+
+class test_revs(common.basetest):
+    def test_bitset(self):
+        a = bitset.fromrevs([0, 3, 9, 200])
+        b = bitset.fromrevs(range(5))
+        self.assertEquals(list(a), [0, 3, 9, 200])
+        self.assertEquals(len(a), 4)
+        self.assertTrue(200 in a)
+        self.assertFalse(201 in a or -1 in a)
+        self.assertEquals(list(a | b), [0, 1, 2, 3, 4, 9, 200])
+        self.assertEquals(list(a & b), [0, 3])
+        self.assertEquals(list(a - b), [9, 200])
+        self.assertEquals(list(a ^ b), [1, 2, 4, 9, 200])
+        self.assertEquals((a.first(), a.last()), (0, 200))
+        self.assertEquals(list(reversed(b)), [4, 3, 2, 1, 0])
+        self.assertTrue((a & b).issubset(a))
+        self.assertEquals(bitset.fromrevs([3, 0]), bitset.fromrevs([0, 3]))
+        self.assertFalse(bitset())
+        self.assertEquals(bitset().first(), None)
+        self.assertRaises(ValueError, bitset.fromrevs, [-1])
+
+    def test_revs(self):
+        for i in range(4):
+            self.append('a', 'a')
+            self.client.commit('commit %d' % i, addremove=True,
+                               user='u%d' % (i % 2))
+        self.client.phase('1', public=True)
+
+        commands = []
+        self.client.addobserver(lambda stats: commands.append(stats.name))
+        # the first one looks up the root, to find the files to stat
+        self.client.revs('all()')
+        del commands[:]
+
+        drafts = self.client.revs('draft()')
+        self.assertEquals(list(drafts), [2, 3])
+        u0 = self.client.revs('user(u0)')
+        self.assertEquals(list(drafts & u0), [2])
+        self.assertEquals(list(u0 - drafts), [0])
+        self.assertEquals(len(commands), 2)
+
+        # cached while the repository is unchanged
+        self.assertTrue(self.client.revs('draft()') is drafts)
+        self.assertEquals(len(commands), 2)
+
+        self.client.phase('2', public=True)
+        self.assertEquals(list(self.client.revs('draft()')), [3])
+        self.client.bookmark('bm', rev=0)
+        self.assertEquals(list(self.client.revs('bookmark()')), [0])
+        self.client.bookmark('bm', rev=1, force=True)
+        self.assertEquals(list(self.client.revs('bookmark()')), [1])
+
+        self.assertEquals(list(self.client.revs('none()')), [])
+        self.assertRaises(ValueError, self.client.revs, 'wdir()')
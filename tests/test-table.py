@@ -0,0 +1,43 @@
+from . import common
+from hglib import util
+
+class test_table(common.basetest):
+    def test_log(self):
+        self.append('a', 'a')
+        self.client.commit('first', addremove=True, user='alice',
+                           date='1000000 -3600')
+        self.client.tag('mytag', rev='0', message='tagged')
+        self.client.branch('foo')
+        self.append('a', 'a')
+        self.client.commit('third\n\nwith a body', user='bob')
+
+        revs = self.client.log()
+        t = self.client.log(columnar=True)
+        self.assertEquals(len(t), 3)
+        self.assertEquals(list(t), revs)
+        self.assertEquals(t[-1], revs[-1])
+        self.assertRaises(IndexError, t.__getitem__, 3)
+
+        self.assertEquals(list(t.revs), [2, 1, 0])
+        self.assertEquals(t.revs.typecode, 'l')
+        self.assertEquals(len(t.nodes), 60)
+        self.assertEquals(t.node(2), revs[2].node)
+        self.assertEquals(t.index(revs[1].node), 1)
+        self.assertEquals(t.desc(0), 'third\n\nwith a body')
+        self.assertEquals(t.branches, ['foo', 'default'])
+        self.assertEquals(list(t.branchids), [0, 1, 1])
+        self.assertEquals(t.author(2), 'alice')
+        self.assertEquals(t.dates[2], 1000000.0)
+        self.assertEquals(t.offsets[2], -3600)
+        self.assertEquals(t.tags, {0: 'tip', 2: 'mytag'})
+
+    def test_empty(self):
+        t = self.client.log(columnar=True)
+        self.assertEquals(len(t), 0)
+        self.assertEquals(list(t), [])
+
+    def test_parsedate(self):
+        self.assertEquals(util.parsedate('1000000.07200'), (1000000.0, 7200))
+        self.assertEquals(util.parsedate('1000000.0-3600'),
+                          (1000000.0, -3600))
+        self.assertEquals(util.parsedate('0.00'), (0.0, 0))
@@ -0,0 +1,53 @@
+from . import common
+import hglib
+from hglib import transport
+
+class test_transport(common.basetest):
+    def tearDown(self):
+        super(test_transport, self).tearDown()
+        transport.closeservers()
+
+    def test_unix(self):
+        self.append('a', 'a\n')
+        rev, node = self.client.commit('first', addremove=True)
+
+        client = hglib.open(transport='unix')
+        self.assertEquals(client.tip().node, node)
+        self.assertEquals(client.cat(['a']), 'a\n')
+        self.assertEquals(client.status(), [])
+
+        # a second client connects to the same server
+        other = hglib.open(transport='unix')
+        self.assertEquals(other.log(), client.log())
+        self.assertEquals(len(transport._unixservers), 1)
+
+        self.assertEquals(other.close(), 0)
+        self.assertEquals(client.close(), 0)
+
+    def test_restart(self):
+        client = hglib.open(transport='unix')
+        client.close()
+
+        server, = transport._unixservers.values()
+        server.close()
+
+        # the server is started again by the next client
+        client = hglib.open(transport='unix')
+        self.assertEquals(client.log(), [])
+
+    def test_callable(self):
+        calls = []
+        def connect(args, env):
+            calls.append(args)
+            return transport.pipe(args, env)
+
+        client = hglib.open(transport=connect)
+        self.assertEquals(client.log(), [])
+        self.assertEquals(len(calls), 1)
+
+    def test_poll(self):
+        client = hglib.open(transport='unix')
+        self.assertEquals(client.server.poll(), None)
+        client.server.kill()
+        self.assertNotEqual(client.server.poll(), None)
+        self.assertRaises(ValueError, client.log)